@@ -52,7 +52,11 @@ PY
 
 start_backend() {
   load_env_from_yaml
-  uvicorn airloop.server.api:app --reload --port "${BACKEND_PORT}"
+  if [[ -n "${BACKEND_WORKERS:-}" ]]; then
+    python -m airloop serve --workers "${BACKEND_WORKERS}" --port "${BACKEND_PORT}"
+  else
+    python -m airloop serve --reload --port "${BACKEND_PORT}"
+  fi
 }
 
 start_frontend() {
@@ -0,0 +1,6 @@
+import sys
+
+from airloop.cli import main
+
+
+sys.exit(main())
@@ -11,6 +11,9 @@ class EvalScores(BaseModel):
     reasoning: str | None = None
 
 
+# bump whenever EVAL_PROMPT / BATCH_EVAL_PROMPT change meaning; invalidates cached judgements
+EVAL_PROMPT_VERSION = "1"
+
 EVAL_PROMPT = """
 You are an evaluation assistant. Given the user request, assistant reply, and optional expected answer, score the reply on multiple dimensions.
 Return ONLY valid JSON with the fields below (scores 0-5, floats allowed):
@@ -32,3 +35,40 @@ def build_eval_agent(model) -> Agent:
         instructions=EVAL_PROMPT,
         output_type=EvalScores,
     )
+
+
+class BatchEvalItem(EvalScores):
+    id: int
+
+
+class BatchEvalScores(BaseModel):
+    items: list[BatchEvalItem]
+
+
+BATCH_EVAL_PROMPT = """
+You are an evaluation assistant. You will receive several numbered items, each with a user request, assistant reply, and optional expected answer.
+Score every item independently on multiple dimensions (scores 0-5, floats allowed).
+Return ONLY valid JSON with one entry per item, echoing each item's id:
+{
+  "items": [
+    {
+      "id": number,
+      "helpfulness": number,
+      "usefulness": number,
+      "fluency": number,
+      "instruction_follow": number,
+      "overall": number,
+      "reasoning": "short rationale"
+    }
+  ]
+}
+"""
+
+
+def build_batch_eval_agent(model) -> Agent:
+    return Agent(
+        name="LLM Judge (batch)",
+        model=model,
+        instructions=BATCH_EVAL_PROMPT,
+        output_type=BatchEvalScores,
+    )
@@ -1,4 +1,6 @@
-from typing import Dict, List, Any
+from typing import Dict, Iterator, List, Any, Optional
+from contextlib import contextmanager
+from contextvars import ContextVar
 from uuid import uuid4
 import time
 
@@ -16,6 +18,7 @@ from agents import (
 
 from airloop.agents.role import AgentRole
 from airloop.domain.context import AirlineAgentContext
+from airloop.instrumentation import phase, record_usage
 
 RELEVANCE_NAME = "Relevance Guardrail"
 JAILBREAK_NAME = "Jailbreak Guardrail"
@@ -119,6 +122,21 @@ Return ONLY the JSON object.
 # GUARDRAILS
 # =========================
 
+# Guardrail checks of the round being run. Scoped per round so concurrent chats
+# (server traffic, parallel eval cases) never see each other's checks.
+_round_checks: ContextVar[Optional[List[Dict]]] = ContextVar("airloop_guardrail_checks", default=None)
+
+
+@contextmanager
+def collect_guardrail_checks() -> Iterator[List[Dict]]:
+    checks: List[Dict] = []
+    token = _round_checks.set(checks)
+    try:
+        yield checks
+    finally:
+        _round_checks.reset(token)
+
+
 class RelevanceOutput(BaseModel):
     """Schema for relevance guardrail decisions."""
     reasoning: str
@@ -172,8 +190,12 @@ class GuardrailManager:
         self.relevance_guardrail = self._make_relevance_guardrail()
         self.jailbreak_guardrail = self._make_jailbreak_guardrail()
 
+    def _checks(self) -> List[Dict]:
+        checks = _round_checks.get()
+        return self._last_guardrail_checks if checks is None else checks
+
     def _record_check(self, *, name: str, input_value: str, reasoning: str, passed: bool):
-        self._last_guardrail_checks.append({
+        self._checks().append({
             "id": uuid4().hex,
             "name": name,
             "input": input_value,
@@ -183,8 +205,9 @@ class GuardrailManager:
         })
 
     def pop_guardrail_checks(self) -> List[Dict]:
-        checks = self._last_guardrail_checks[:]
-        self._last_guardrail_checks.clear()
+        current = self._checks()
+        checks = current[:]
+        current.clear()
         return checks
         
         
@@ -197,13 +220,16 @@ class GuardrailManager:
         async def _guard(context: RunContextWrapper[AirlineAgentContext], agent: Agent, input: str | list[TResponseInputItem]):
             input_str = _extract_last_user_text(input)
             try:
-                result = await Runner.run(
-                    self.agents[AgentRole.GUARD_RELEVANCE],
-                    input,
-                    context=context.context,
-                    run_config=self.run_config,
-                )
-                final = result.final_output_as(RelevanceOutput)
+                with phase("guardrail.relevance") as span:
+                    result = await Runner.run(
+                        self.agents[AgentRole.GUARD_RELEVANCE],
+                        input,
+                        context=context.context,
+                        run_config=self.run_config,
+                    )
+                    record_usage(self.agents[AgentRole.GUARD_RELEVANCE].name, result.raw_responses, kind="guardrail")
+                    final = result.final_output_as(RelevanceOutput)
+                    span["passed"] = final.is_relevant
             except Exception as exc:
                 final = RelevanceOutput(reasoning=f"Guardrail parse failure: {exc}", is_relevant=False)
                 self._record_check(name=RELEVANCE_NAME, input_value=input_str, reasoning=final.reasoning, passed=False)
@@ -218,13 +244,16 @@ class GuardrailManager:
         async def _guard(context: RunContextWrapper[None], agent: Agent, input: str | list[TResponseInputItem]):
             input_str = _extract_last_user_text(input)
             try:
-                result = await Runner.run(
-                    self.agents[AgentRole.GUARD_JAILBREAK],
-                    input,
-                    context=context.context,
-                    run_config=self.run_config,
-                )
-                final = result.final_output_as(JailbreakOutput)
+                with phase("guardrail.jailbreak") as span:
+                    result = await Runner.run(
+                        self.agents[AgentRole.GUARD_JAILBREAK],
+                        input,
+                        context=context.context,
+                        run_config=self.run_config,
+                    )
+                    record_usage(self.agents[AgentRole.GUARD_JAILBREAK].name, result.raw_responses, kind="guardrail")
+                    final = result.final_output_as(JailbreakOutput)
+                    span["passed"] = final.is_safe
             except Exception as exc:
                 final = JailbreakOutput(reasoning=f"Guardrail parse failure: {exc}", is_safe=False)
                 self._record_check(name=JAILBREAK_NAME, input_value=input_str, reasoning=final.reasoning, passed=False)
@@ -22,7 +22,9 @@ from airloop.agents.food import get_food_agent
 from airloop.tools.manager import ToolManager
 from airloop.service.data_service import DataService
 from airloop.provider.qwen import QwenModelProvider, build_qwen3_run_config
-from airloop.settings import UserConfig
+from airloop.provider.cassette import with_cassette
+from airloop.provider.mock import MockModelProvider
+from airloop.settings import CassetteConfig, UserConfig
 from pydantic import BaseModel
 
 HANDOFF_ROLES = [ 
@@ -86,6 +88,7 @@ class AgentManager:
         self,
         config: UserConfig,
         data_service: DataService,
+        cassette: Optional[CassetteConfig] = None,
     ):
         set_tracing_disabled(True)
         self.config = config
@@ -96,8 +99,18 @@ class AgentManager:
             base_url=config.base_url,
             api_key=config.api_key
         )
-        self.model = OpenAIChatCompletionsModel(model=config.model_name, openai_client=self.client)
-        self.run_config = build_qwen3_run_config(QwenModelProvider())
+        if config.provider == "mock":
+            # scripted local model for load tests / offline development; the client stays unused
+            provider = MockModelProvider(config.mock_script)
+            self.model = provider.get_model(config.model_name)
+        else:
+            # cassette (record/replay) wraps the model when configured; no-op otherwise
+            provider = QwenModelProvider(self.client, cassette)
+            self.model = with_cassette(
+                OpenAIChatCompletionsModel(model=config.model_name, openai_client=self.client),
+                cassette,
+            )
+        self.run_config = build_qwen3_run_config(provider)
         self._init_agents()
 
         
@@ -0,0 +1,131 @@
+"""
+State serializer benchmark.
+
+Encodes a corpus of conversation states with every serializer available here and reports
+bytes per conversation (and the ratio to the legacy `json.dumps` text) plus encode/decode
+time per state. zstd is measured with and without a dictionary trained on a separate
+sample of the same corpus. The corpus is synthetic (see airloop.bench.store) unless
+`--from-store` samples the configured conversation store.
+
+    python -m airloop.bench.codec --conversations 2000 --rounds 2,8
+    python -m airloop.bench.codec --from-store --conversations 5000
+"""
+from __future__ import annotations
+
+import argparse
+import json
+import os
+import random
+import statistics
+import time
+from typing import Any, Dict, List, Optional
+
+from airloop.bench.store import synthetic_state
+from airloop.domain.codec import StateCodec, train_dictionary
+
+
+SPECS = ["json", "json+zlib", "json+zstd", "msgpack", "msgpack+zlib", "msgpack+zstd"]
+
+
+def load_corpus(args: argparse.Namespace) -> List[Dict[str, Any]]:
+    if args.from_store:
+        from airloop.server.services import build_store
+        from airloop.settings import load_app_config
+
+        store = build_store(load_app_config())
+        corpus = []
+        for cid in store.iter_ids():
+            state = store.get(cid)
+            if state is not None:
+                corpus.append(state.model_dump(mode="json", exclude={"version"}))
+            if len(corpus) >= args.conversations:
+                break
+        return corpus
+    rng = random.Random(args.seed)
+    rounds = [int(r) for r in args.rounds.split(",")]
+    return [
+        synthetic_state(f"c{i:08d}", rng.choice(rounds), rng).model_dump(mode="json", exclude={"version"})
+        for i in range(args.conversations)
+    ]
+
+
+def measure(name: str, codec: Optional[StateCodec], corpus: List[Dict[str, Any]], legacy_bytes: float) -> Dict[str, Any]:
+    sizes: List[int] = []
+    encode_us: List[float] = []
+    decode_us: List[float] = []
+    for data in corpus:
+        t = time.perf_counter()
+        blob = json.dumps(data).encode("utf-8") if codec is None else codec.dumps(data)
+        encode_us.append((time.perf_counter() - t) * 1e6)
+        t = time.perf_counter()
+        json.loads(blob) if codec is None else codec.loads(blob)
+        decode_us.append((time.perf_counter() - t) * 1e6)
+        sizes.append(len(blob))
+    row = {
+        "bytes_per_conversation": round(statistics.mean(sizes), 1),
+        "ratio_vs_legacy": round(statistics.mean(sizes) / legacy_bytes, 4) if legacy_bytes else 1.0,
+        "encode_us": round(statistics.mean(encode_us), 1),
+        "decode_us": round(statistics.mean(decode_us), 1),
+    }
+    print(
+        f"{name:<22} {row['bytes_per_conversation']:>10.0f} B  x{row['ratio_vs_legacy']:<7.3f}"
+        f" enc {row['encode_us']:>8.1f}us  dec {row['decode_us']:>8.1f}us"
+    )
+    return row
+
+
+def main(argv: Optional[List[str]] = None) -> Dict[str, Any]:
+    parser = argparse.ArgumentParser(description="Benchmark conversation state serializers")
+    parser.add_argument("--conversations", type=int, default=2000)
+    parser.add_argument("--rounds", default="1,2,4,8", help="rounds per synthetic conversation, drawn uniformly")
+    parser.add_argument("--from-store", action="store_true", help="sample the configured store instead")
+    parser.add_argument("--train", type=int, default=500, help="conversations used to train the zstd dictionary")
+    parser.add_argument("--dict-kb", type=int, default=112)
+    parser.add_argument("--level", type=int, default=None, help="compression level")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--out", default=None, help="result JSON path (default data/bench/codec-<time>.json)")
+    args = parser.parse_args(argv)
+
+    corpus = load_corpus(args)
+    # the dictionary is trained on a disjoint sample so the numbers are not flattered
+    train, corpus = corpus[: args.train], corpus[args.train:]
+    if not corpus:
+        parser.error("corpus is smaller than --train")
+    result: Dict[str, Any] = {
+        "kind": "codec",
+        "created_at": time.time(),
+        "params": {k: v for k, v in vars(args).items() if k != "out"},
+        "conversations": len(corpus),
+        "codecs": {},
+        "skipped": {},
+    }
+    legacy = measure("legacy json text", None, corpus, 0)
+    result["codecs"]["legacy"] = legacy
+    for spec in SPECS:
+        try:
+            codec = StateCodec(spec, level=args.level)
+        except RuntimeError as e:
+            result["skipped"][spec] = str(e)
+            print(f"{spec:<22} skipped: {e}")
+            continue
+        result["codecs"][spec] = measure(spec, codec, corpus, legacy["bytes_per_conversation"])
+        if codec.compression != "zstd":
+            continue
+        dict_path = os.path.join("data", "bench", f"codec-{codec.format}.zdict")
+        os.makedirs(os.path.dirname(dict_path), exist_ok=True)
+        with open(dict_path, "wb") as f:
+            f.write(train_dictionary(codec, train, args.dict_kb * 1024))
+        with_dict = StateCodec(spec, level=args.level, zstd_dict_path=dict_path)
+        result["codecs"][f"{spec}+dict"] = measure(f"{spec}+dict", with_dict, corpus, legacy["bytes_per_conversation"])
+        os.remove(dict_path)
+
+    out = args.out or os.path.join("data", "bench", f"codec-{time.strftime('%Y%m%d-%H%M%S')}.json")
+    os.makedirs(os.path.dirname(out) or ".", exist_ok=True)
+    with open(out, "w", encoding="utf-8") as f:
+        json.dump(result, f, ensure_ascii=False, indent=2)
+    print(f"results written to {out}")
+    return result
+
+
+if __name__ == "__main__":
+    main()
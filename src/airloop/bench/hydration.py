@@ -0,0 +1,109 @@
+"""
+Conversation load latency with lazy round hydration.
+
+Writes `--conversations` long synthetic conversations (`--rounds`, 200 by default) twice
+into one sqlite store: once as pre-split rows that inline the whole history (how every row
+looked before the rounds table, and how they still load) and once in the current layout.
+It then reports, for each layout, the latency of:
+
+    get      what a chat turn pays to load the state
+    turn     get + one round + save
+    history  get + `messages` (hydrates every round, like the session detail view)
+
+    python -m airloop.bench.hydration --conversations 20 --rounds 200 --repeat 50
+"""
+from __future__ import annotations
+
+import argparse
+import json
+import os
+import random
+import shutil
+import time
+from typing import Any, Callable, Dict, List, Optional
+
+from airloop.bench.loadtest import percentile
+from airloop.bench.store import synthetic_state
+
+
+def _latency(fn: Callable[[str], Any], picks: List[str]) -> Dict[str, float]:
+    samples = []
+    for cid in picks:
+        t = time.perf_counter()
+        fn(cid)
+        samples.append((time.perf_counter() - t) * 1000)
+    return {"p50_ms": round(percentile(samples, 50), 3), "p99_ms": round(percentile(samples, 99), 3)}
+
+
+def main(argv: Optional[List[str]] = None) -> Dict[str, Any]:
+    from airloop.domain.codec import StateCodec
+    from airloop.domain.schema import PersistentConversationStore
+
+    parser = argparse.ArgumentParser(description="Benchmark conversation load latency with lazy rounds")
+    parser.add_argument("--conversations", type=int, default=20)
+    parser.add_argument("--rounds", type=int, default=200)
+    parser.add_argument("--repeat", type=int, default=50, help="timed operations per measurement")
+    parser.add_argument("--serializer", default="json+zlib")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--dir", default=os.path.join("data", "bench", "hydration-scratch"))
+    parser.add_argument("--out", default=None, help="result JSON path (default data/bench/hydration-<time>.json)")
+    args = parser.parse_args(argv)
+
+    shutil.rmtree(args.dir, ignore_errors=True)
+    os.makedirs(args.dir)
+    store = PersistentConversationStore(os.path.join(args.dir, "conversations.db"), codec=StateCodec(args.serializer))
+    rng = random.Random(args.seed)
+    template = synthetic_state("template", args.rounds, rng)
+    inline_ids = [f"inline{i}" for i in range(args.conversations)]
+    split_ids = [f"split{i}" for i in range(args.conversations)]
+    for cid in inline_ids:
+        data = template.model_dump(mode="json", exclude={"version"})
+        data["state_id"] = cid
+        store._conn.execute(
+            "INSERT INTO conversations (id, state_json, updated_at, version) VALUES (?, ?, ?, 1)",
+            (cid, store.codec.dumps(data), time.time()),
+        )
+    store._conn.commit()
+    for cid in split_ids:
+        template.state_id, template.version = cid, 0
+        template._stored_below = None
+        store.save(cid, template)
+
+    def turn(cid: str) -> None:
+        state = store.get(cid)
+        state.update_round("Triage Agent", "trace", list(state.input_items), messages=[{"role": "user", "content": "hi"}])
+        state.finish_round()
+        store.save(cid, state)
+
+    result: Dict[str, Any] = {
+        "kind": "hydration",
+        "created_at": time.time(),
+        "params": {k: v for k, v in vars(args).items() if k not in ("out", "dir")},
+        "state_json_bytes": len(template.model_dump_json()),
+        "layouts": {},
+    }
+    # "turn" goes last: it migrates inline rows to the split layout on their first save
+    for layout, ids in (("inline", inline_ids), ("split", split_ids)):
+        rng = random.Random(args.seed)
+        picks = [rng.choice(ids) for _ in range(args.repeat)]
+        row = {
+            "get": _latency(store.get, picks),
+            "history": _latency(lambda cid: store.get(cid).messages, picks),
+            # each inline row can only be timed once before it is migrated
+            "turn": _latency(turn, picks if layout == "split" else ids),
+        }
+        result["layouts"][layout] = row
+        print(f"{layout:<7} " + "  ".join(f"{k} p50 {v['p50_ms']:.2f}ms p99 {v['p99_ms']:.2f}ms" for k, v in row.items()))
+    store.close()
+    shutil.rmtree(args.dir, ignore_errors=True)
+
+    out = args.out or os.path.join("data", "bench", f"hydration-{time.strftime('%Y%m%d-%H%M%S')}.json")
+    os.makedirs(os.path.dirname(out) or ".", exist_ok=True)
+    with open(out, "w", encoding="utf-8") as f:
+        json.dump(result, f, ensure_ascii=False, indent=2)
+    print(f"results written to {out}")
+    return result
+
+
+if __name__ == "__main__":
+    main()
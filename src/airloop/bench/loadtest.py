@@ -0,0 +1,265 @@
+"""
+End-to-end load test for the FastAPI server.
+
+Each simulated session logs in, creates an order and then holds a multi-turn `/api/chat`
+conversation. Sessions run at increasing concurrency levels; for every level the harness
+reports throughput, p50/p95/p99 latency and error rate per endpoint, plus the per-phase
+breakdown the server returns in its `Server-Timing` header.
+
+By default the app is built in-process with `create_app()` and driven through an ASGI
+transport, so run it with the mock model (llm.provider: mock) to measure the server rather
+than the LLM endpoint. Pass `--url` to target a running server instead. Results are written
+as JSON (with the git commit) so runs can be compared with `--baseline`.
+
+    LLM_PROVIDER=mock python -m airloop.bench.loadtest --concurrency 1,4,16 --sessions 32
+"""
+from __future__ import annotations
+
+import argparse
+import asyncio
+import json
+import os
+import random
+import subprocess
+import time
+from contextlib import AsyncExitStack
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Optional
+
+import httpx
+
+
+USERS = [("Amy", "123456"), ("bob", "123456"), ("Alex", "123456")]
+
+DEFAULT_TURNS = [
+    "Hi, I need some help with my booking",
+    "I want to change my seat to 14",
+    "Can I get a vegetarian meal?",
+    "What is the baggage policy?",
+    "Thanks, that's all",
+]
+
+
+@dataclass
+class Sample:
+    endpoint: str
+    status: int
+    latency_ms: float
+    phases: Dict[str, float] = field(default_factory=dict)
+    error: Optional[str] = None
+
+
+def parse_server_timing(header: Optional[str]) -> Dict[str, float]:
+    """`guardrail.relevance;dur=12.3, total;dur=40.1` -> {"guardrail.relevance": 12.3, "total": 40.1}"""
+    phases: Dict[str, float] = {}
+    for part in (header or "").split(","):
+        name, _, params = part.strip().partition(";")
+        for param in params.split(";"):
+            key, _, value = param.strip().partition("=")
+            if name and key == "dur":
+                try:
+                    phases[name] = phases.get(name, 0.0) + float(value)
+                except ValueError:
+                    pass
+    return phases
+
+
+def percentile(values: List[float], q: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    rank = (len(ordered) - 1) * q / 100
+    low = int(rank)
+    high = min(low + 1, len(ordered) - 1)
+    return ordered[low] + (ordered[high] - ordered[low]) * (rank - low)
+
+
+def _latency_stats(values: List[float]) -> Dict[str, float]:
+    return {
+        "mean_ms": round(sum(values) / len(values), 2) if values else 0.0,
+        "p50_ms": round(percentile(values, 50), 2),
+        "p95_ms": round(percentile(values, 95), 2),
+        "p99_ms": round(percentile(values, 99), 2),
+        "max_ms": round(max(values), 2) if values else 0.0,
+    }
+
+
+def summarize(samples: List[Sample], wall_s: float) -> Dict[str, Any]:
+    endpoints: Dict[str, Any] = {}
+    for endpoint in sorted({s.endpoint for s in samples}):
+        rows = [s for s in samples if s.endpoint == endpoint]
+        errors = [s for s in rows if s.error or s.status >= 400]
+        endpoints[endpoint] = {
+            "requests": len(rows),
+            "errors": len(errors),
+            "error_rate": round(len(errors) / len(rows), 4),
+            "throughput_rps": round(len(rows) / wall_s, 2) if wall_s else 0.0,
+            **_latency_stats([s.latency_ms for s in rows]),
+        }
+
+    phase_values: Dict[str, List[float]] = {}
+    for s in samples:
+        for name, dur in s.phases.items():
+            phase_values.setdefault(name, []).append(dur)
+    phases = {name: {"count": len(v), **_latency_stats(v)} for name, v in sorted(phase_values.items())}
+
+    errors = [s for s in samples if s.error or s.status >= 400]
+    error_kinds: Dict[str, int] = {}
+    for s in errors:
+        kind = s.error or f"HTTP {s.status}"
+        error_kinds[kind] = error_kinds.get(kind, 0) + 1
+    return {
+        "requests": len(samples),
+        "wall_s": round(wall_s, 3),
+        "throughput_rps": round(len(samples) / wall_s, 2) if wall_s else 0.0,
+        "error_rate": round(len(errors) / len(samples), 4) if samples else 0.0,
+        "errors": error_kinds,
+        **_latency_stats([s.latency_ms for s in samples]),
+        "endpoints": endpoints,
+        "phases": phases,
+    }
+
+
+async def _request(client: httpx.AsyncClient, samples: List[Sample], endpoint: str, method: str, url: str, **kwargs) -> Optional[Any]:
+    start = time.perf_counter()
+    try:
+        resp = await client.request(method, url, **kwargs)
+    except Exception as exc:
+        samples.append(Sample(endpoint, 0, (time.perf_counter() - start) * 1000, error=type(exc).__name__))
+        return None
+    latency = (time.perf_counter() - start) * 1000
+    samples.append(Sample(endpoint, resp.status_code, latency, parse_server_timing(resp.headers.get("server-timing"))))
+    if resp.status_code >= 400:
+        return None
+    return resp.json()
+
+
+async def run_session(client: httpx.AsyncClient, rng: random.Random, turns: List[str], samples: List[Sample]) -> None:
+    username, password = rng.choice(USERS)
+    user = await _request(client, samples, "login", "POST", "/api/login", json={"username": username, "password": password})
+    if not user:
+        return
+    order = await _request(client, samples, "orders", "POST", "/api/orders", params={"user_id": user["id"]})
+    if not order:
+        return
+    conversation_id = None
+    for message in turns:
+        body = {"user_id": user["id"], "order_id": order["id"], "conversation_id": conversation_id, "message": message}
+        result = await _request(client, samples, "chat", "POST", "/api/chat", json=body)
+        if not result:
+            return
+        conversation_id = result.get("conversation_id")
+
+
+async def run_level(client: httpx.AsyncClient, concurrency: int, sessions: int, turns: List[str], seed: int) -> Dict[str, Any]:
+    samples: List[Sample] = []
+    semaphore = asyncio.Semaphore(concurrency)
+    rng = random.Random(seed)
+
+    async def one(n: int) -> None:
+        async with semaphore:
+            await run_session(client, random.Random(rng.random() + n), turns, samples)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(one(n) for n in range(max(sessions, concurrency))))
+    wall_s = time.perf_counter() - start
+    return {"concurrency": concurrency, "sessions": max(sessions, concurrency), **summarize(samples, wall_s)}
+
+
+def _git_commit() -> Optional[str]:
+    try:
+        out = subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, timeout=5)
+    except (OSError, subprocess.SubprocessError):
+        return None
+    return out.stdout.strip() or None
+
+
+def compare(result: Dict[str, Any], baseline: Dict[str, Any]) -> List[Dict[str, Any]]:
+    """Per-concurrency deltas of throughput and tail latency against a saved run."""
+    base_levels = {level["concurrency"]: level for level in baseline.get("levels", [])}
+    rows = []
+    for level in result["levels"]:
+        base = base_levels.get(level["concurrency"])
+        if base is None:
+            continue
+        row = {"concurrency": level["concurrency"]}
+        for key in ("throughput_rps", "p50_ms", "p95_ms", "p99_ms", "error_rate"):
+            before, after = base.get(key, 0.0), level.get(key, 0.0)
+            row[key] = {"before": before, "after": after, "change": round((after - before) / before, 4) if before else None}
+        rows.append(row)
+    return rows
+
+
+async def run(args: argparse.Namespace) -> Dict[str, Any]:
+    turns = [DEFAULT_TURNS[n % len(DEFAULT_TURNS)] for n in range(args.turns)]
+    levels = [int(c) for c in str(args.concurrency).split(",") if c.strip()]
+
+    async with AsyncExitStack() as stack:
+        if args.url:
+            transport = None
+            base_url = args.url.rstrip("/")
+        else:
+            from airloop.server.api import create_app
+
+            app = create_app()
+            await stack.enter_async_context(app.router.lifespan_context(app))
+            transport = httpx.ASGITransport(app=app)
+            base_url = "http://loadtest"
+        client = await stack.enter_async_context(
+            httpx.AsyncClient(transport=transport, base_url=base_url, timeout=args.timeout)
+        )
+        if args.warmup:
+            await run_level(client, 1, args.warmup, turns, args.seed)
+        results = []
+        for concurrency in levels:
+            level = await run_level(client, concurrency, args.sessions, turns, args.seed)
+            results.append(level)
+            print(
+                f"c={concurrency:<4} req={level['requests']:<6} rps={level['throughput_rps']:<8} "
+                f"p50={level['p50_ms']:<9} p95={level['p95_ms']:<9} p99={level['p99_ms']:<9} err={level['error_rate']}"
+            )
+
+    return {
+        "kind": "loadtest",
+        "commit": _git_commit(),
+        "created_at": time.time(),
+        "target": args.url or "in-process",
+        "llm_provider": os.getenv("LLM_PROVIDER"),
+        "config": {"concurrency": levels, "sessions": args.sessions, "turns": len(turns), "seed": args.seed},
+        "levels": results,
+    }
+
+
+def main(argv: Optional[List[str]] = None) -> Dict[str, Any]:
+    parser = argparse.ArgumentParser(description="Load test the airloop API")
+    parser.add_argument("--url", default=None, help="target a running server instead of an in-process app")
+    parser.add_argument("--concurrency", default="1,4,16", help="comma-separated concurrency levels")
+    parser.add_argument("--sessions", type=int, default=16, help="sessions per level (at least the concurrency)")
+    parser.add_argument("--turns", type=int, default=len(DEFAULT_TURNS), help="chat turns per session")
+    parser.add_argument("--warmup", type=int, default=1, help="sessions to run before measuring")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--timeout", type=float, default=120.0)
+    parser.add_argument("--out", default=None, help="result JSON path (default data/bench/loadtest-<time>.json)")
+    parser.add_argument("--baseline", default=None, help="earlier result JSON to compare against")
+    args = parser.parse_args(argv)
+
+    result = asyncio.run(run(args))
+    if args.baseline:
+        with open(args.baseline, "r", encoding="utf-8") as f:
+            result["comparison"] = compare(result, json.load(f))
+        for row in result["comparison"]:
+            print(
+                f"c={row['concurrency']:<4} rps {row['throughput_rps']['before']} -> {row['throughput_rps']['after']}, "
+                f"p95 {row['p95_ms']['before']} -> {row['p95_ms']['after']}"
+            )
+
+    out = args.out or os.path.join("data", "bench", f"loadtest-{time.strftime('%Y%m%d-%H%M%S')}.json")
+    os.makedirs(os.path.dirname(out) or ".", exist_ok=True)
+    with open(out, "w", encoding="utf-8") as f:
+        json.dump(result, f, ensure_ascii=False, indent=2)
+    print(f"results written to {out}")
+    return result
+
+
+if __name__ == "__main__":
+    main()
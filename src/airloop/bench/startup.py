@@ -0,0 +1,124 @@
+"""
+Startup-time benchmark for the API process.
+
+Each repetition runs in a fresh interpreter and measures: cold import of
+`airloop.server.api`, `create_app()`, the lifespan startup, the first login + chat request,
+and the first request that needs the evaluation services. It also records whether the
+langfuse SDK got imported. Use `--src` to point at another checkout (e.g. a git worktree of
+an older commit) to get before/after numbers from the same machine.
+
+    LLM_PROVIDER=mock python -m airloop.bench.startup --runs 5
+    LLM_PROVIDER=mock python -m airloop.bench.startup --src /tmp/airloop-old/src --out before.json
+"""
+from __future__ import annotations
+
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+from typing import Any, Dict, List, Optional
+
+
+_CHILD = r"""
+import asyncio, json, sys, time
+
+t0 = time.perf_counter()
+import airloop.server.api as api_module
+t_import = time.perf_counter() - t0
+
+import httpx
+
+async def main():
+    out = {"import_s": t_import}
+    t = time.perf_counter()
+    app = api_module.create_app()
+    out["create_app_s"] = time.perf_counter() - t
+    lifespan = app.router.lifespan_context(app)
+    t = time.perf_counter()
+    await lifespan.__aenter__()
+    out["lifespan_start_s"] = time.perf_counter() - t
+    try:
+        async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://startup") as client:
+            t = time.perf_counter()
+            user = (await client.post("/api/login", json={"username": "Amy", "password": "123456"})).json()
+            order = (await client.post("/api/orders", params={"user_id": user["id"]})).json()
+            resp = await client.post(
+                "/api/chat", json={"user_id": user["id"], "order_id": order["id"], "message": "hello"}
+            )
+            out["first_request_s"] = time.perf_counter() - t
+            out["first_request_status"] = resp.status_code
+            t = time.perf_counter()
+            resp = await client.get("/api/judge_cache")
+            out["first_eval_request_s"] = time.perf_counter() - t
+    finally:
+        await lifespan.__aexit__(None, None, None)
+    out["langfuse_imported"] = "langfuse" in sys.modules
+    out["modules"] = len(sys.modules)
+    print("@@" + json.dumps(out))
+
+asyncio.run(main())
+"""
+
+_METRICS = ("import_s", "create_app_s", "lifespan_start_s", "first_request_s", "first_eval_request_s")
+
+
+def run_once(src: Optional[str]) -> Dict[str, Any]:
+    env = dict(os.environ)
+    if src:
+        env["PYTHONPATH"] = os.pathsep.join(p for p in (os.path.abspath(src), env.get("PYTHONPATH")) if p)
+    started = time.perf_counter()
+    proc = subprocess.run([sys.executable, "-c", _CHILD], capture_output=True, text=True, env=env)
+    wall = time.perf_counter() - started
+    line = next((l for l in proc.stdout.splitlines() if l.startswith("@@")), None)
+    if proc.returncode != 0 or line is None:
+        raise RuntimeError(f"startup run failed:\n{proc.stderr[-2000:]}")
+    return {**json.loads(line[2:]), "process_wall_s": wall}
+
+
+def summarize(runs: List[Dict[str, Any]]) -> Dict[str, Any]:
+    summary: Dict[str, Any] = {}
+    for key in (*_METRICS, "process_wall_s"):
+        values = [r[key] for r in runs if r.get(key) is not None]
+        if values:
+            summary[key] = {"median": round(statistics.median(values), 4), "min": round(min(values), 4)}
+    summary["langfuse_imported"] = any(r.get("langfuse_imported") for r in runs)
+    return summary
+
+
+def main(argv: Optional[List[str]] = None) -> Dict[str, Any]:
+    parser = argparse.ArgumentParser(description="Benchmark API cold start")
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--src", default=None, help="source root to benchmark instead of the installed package")
+    parser.add_argument("--out", default=None, help="result JSON path (default data/bench/startup-<time>.json)")
+    parser.add_argument("--baseline", default=None, help="earlier result JSON to compare against")
+    args = parser.parse_args(argv)
+
+    runs = [run_once(args.src) for _ in range(args.runs)]
+    result = {"kind": "startup", "created_at": time.time(), "src": args.src, "runs": runs, "summary": summarize(runs)}
+    for key, stats in result["summary"].items():
+        print(f"{key:<22} {stats}")
+
+    if args.baseline:
+        with open(args.baseline, "r", encoding="utf-8") as f:
+            base = json.load(f)["summary"]
+        result["comparison"] = {
+            key: {"before": base[key]["median"], "after": result["summary"][key]["median"]}
+            for key in (*_METRICS, "process_wall_s")
+            if key in base and key in result["summary"]
+        }
+        for key, row in result["comparison"].items():
+            print(f"{key:<22} {row['before']:.3f}s -> {row['after']:.3f}s")
+
+    out = args.out or os.path.join("data", "bench", f"startup-{time.strftime('%Y%m%d-%H%M%S')}.json")
+    os.makedirs(os.path.dirname(out) or ".", exist_ok=True)
+    with open(out, "w", encoding="utf-8") as f:
+        json.dump(result, f, ensure_ascii=False, indent=2)
+    print(f"results written to {out}")
+    return result
+
+
+if __name__ == "__main__":
+    main()
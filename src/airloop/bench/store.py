@@ -0,0 +1,217 @@
+"""
+Conversation store benchmark.
+
+Fills each backend with `--conversations` synthetic conversations (shaped like real
+ChatService states: a growing input history, per-round messages, handoff/tool events),
+then measures random gets, read-modify-write updates, `list()`, the cost of reopening the
+store (index rebuild for the log backend) and the size on disk. For the log backend it also
+times a compaction pass after the updates. Backends run one after another in a scratch
+directory that is removed afterwards unless `--keep` is given.
+
+    python -m airloop.bench.store --conversations 1000000 --backends sqlite,log
+    python -m airloop.bench.store --conversations 50000 --rounds 6 --out store.json
+"""
+from __future__ import annotations
+
+import argparse
+import json
+import os
+import random
+import shutil
+import time
+from typing import Any, Callable, Dict, List, Optional
+
+from airloop.bench.loadtest import percentile
+from airloop.bench.soak import store_size_bytes
+
+
+_TOOL_OUTPUT = "You are allowed to bring one bag on the plane. It must be under 50 pounds and 22 inches x 14 inches x 9 inches."
+_AGENTS = ["Triage Agent", "FAQ Agent", "Seat Booking Agent", "Flight Status Agent", "Cancellation Agent", "Food Agent"]
+
+
+def synthetic_state(conversation_id: str, rounds: int, rng: random.Random):
+    """A ConversationState with `rounds` finished rounds, structured like ChatService output."""
+    from airloop.domain.context import create_initial_context
+    from airloop.domain.schema import ConversationState
+
+    state = ConversationState(state_id=conversation_id, title="bench", user_id=rng.randint(1, 3))
+    state.context = create_initial_context()
+    state.input_items = [{"role": "user", "content": "A customer starts a new session, please provide your assistance."}]
+    call = 0
+    for r in range(rounds):
+        agent = rng.choice(_AGENTS)
+        text = f"question {r} about my booking {rng.randint(100, 999)}"
+        call += 2
+        items = [
+            {"role": "user", "content": text},
+            {"arguments": "{}", "call_id": f"call_{call}", "name": "transfer_to_faq_agent", "type": "function_call", "id": f"call_{call}"},
+            {"call_id": f"call_{call}", "output": json.dumps({"assistant": agent}), "type": "function_call_output"},
+            {"arguments": json.dumps({"question": text}), "call_id": f"call_{call + 1}", "name": "faq_lookup_tool", "type": "function_call", "id": f"call_{call + 1}"},
+            {"call_id": f"call_{call + 1}", "output": _TOOL_OUTPUT, "type": "function_call_output"},
+            {
+                "id": f"msg_{call}",
+                "content": [{"annotations": [], "text": "Here is what I found in our policies.", "type": "output_text"}],
+                "role": "assistant",
+                "status": "completed",
+                "type": "message",
+            },
+        ]
+        state.input_items.extend(items)
+        now = time.time()
+        events = [
+            {"id": f"evt{call}", "type": "handoff", "agent": "Triage Agent", "content": f"Triage Agent -> {agent}", "metadata": {"source_agent": "Triage Agent", "target_agent": agent}, "timestamp": now},
+            {"id": f"evt{call + 1}", "type": "tool_call", "agent": agent, "content": "faq_lookup_tool", "metadata": {"tool_args": {"question": text}}, "timestamp": now},
+            {"id": f"evt{call + 2}", "type": "tool_output", "agent": agent, "content": _TOOL_OUTPUT, "metadata": {"tool_result": _TOOL_OUTPUT}, "timestamp": now},
+        ]
+        state.update_round(
+            agent,
+            f"trace_{rng.getrandbits(64):016x}",
+            list(state.input_items),
+            messages=[{"role": "user", "content": text}, {"content": "Here is what I found in our policies.", "agent": agent}],
+            events=events,
+            usage={"input_tokens": rng.randint(300, 3000), "output_tokens": rng.randint(20, 200)},
+        )
+        state.current_agent_name = agent
+        state.finish_round()
+    return state
+
+
+def build_backend(kind: str, workdir: str, args: argparse.Namespace):
+    from airloop.domain.log_store import LogConversationStore
+    from airloop.domain.schema import PersistentConversationStore
+
+    if kind == "sqlite":
+        path = os.path.join(workdir, "conversations.db")
+        return PersistentConversationStore(path), path
+    if kind == "log":
+        path = os.path.join(workdir, "conversations.log.d")
+        store = LogConversationStore(
+            path, segment_bytes=int(args.segment_mb * 2**20), fsync=args.fsync, compact_interval_s=None
+        )
+        return store, path
+    raise ValueError(f"unknown backend {kind}")
+
+
+def _timed(fn: Callable[[], Any], latencies: List[float]) -> Any:
+    t = time.perf_counter()
+    out = fn()
+    latencies.append((time.perf_counter() - t) * 1000)
+    return out
+
+
+def _phase(name: str, count: int, elapsed: float, latencies: List[float]) -> Dict[str, Any]:
+    row = {
+        "ops": count,
+        "seconds": round(elapsed, 3),
+        "ops_per_s": round(count / elapsed, 1) if elapsed else None,
+        "p50_ms": round(percentile(latencies, 50), 4),
+        "p99_ms": round(percentile(latencies, 99), 4),
+    }
+    print(f"  {name:<8} {row['ops']:>9} ops  {row['ops_per_s'] or 0:>10.1f}/s  p50 {row['p50_ms']:.3f}ms  p99 {row['p99_ms']:.3f}ms")
+    return row
+
+
+def bench_backend(kind: str, args: argparse.Namespace, templates: list) -> Dict[str, Any]:
+    workdir = os.path.join(args.dir, kind)
+    shutil.rmtree(workdir, ignore_errors=True)
+    os.makedirs(workdir)
+    store, path = build_backend(kind, workdir, args)
+    rng = random.Random(args.seed)
+    ids = [f"c{i:09d}" for i in range(args.conversations)]
+    result: Dict[str, Any] = {"backend": kind}
+    print(f"{kind}:")
+
+    latencies: List[float] = []
+    started = time.perf_counter()
+    for i, cid in enumerate(ids):
+        state = templates[i % len(templates)]
+        state.state_id, state.version = cid, 0
+        _timed(lambda: store.save(cid, state), latencies)
+    result["insert"] = _phase("insert", len(ids), time.perf_counter() - started, latencies)
+
+    latencies = []
+    started = time.perf_counter()
+    for _ in range(args.reads):
+        cid = rng.choice(ids)
+        _timed(lambda: store.get(cid), latencies)
+    result["get"] = _phase("get", args.reads, time.perf_counter() - started, latencies)
+
+    latencies = []
+    started = time.perf_counter()
+    for _ in range(args.updates):
+        cid = rng.choice(ids)
+
+        def rmw():
+            state = store.get(cid)
+            state.title = "updated"
+            store.save(cid, state)
+
+        _timed(rmw, latencies)
+    result["update"] = _phase("update", args.updates, time.perf_counter() - started, latencies)
+
+    latencies = []
+    started = time.perf_counter()
+    for _ in range(20):
+        _timed(lambda: store.list(limit=20), latencies)
+    result["list"] = _phase("list", 20, time.perf_counter() - started, latencies)
+
+    result["disk_bytes"] = store_size_bytes(path)
+    if kind == "log":
+        started = time.perf_counter()
+        reclaimed = store.compact(ratio=args.compact_ratio)
+        result["compact"] = {"seconds": round(time.perf_counter() - started, 3), "bytes_reclaimed": reclaimed}
+        result["disk_bytes_after_compact"] = store_size_bytes(path)
+
+    store.close()
+    started = time.perf_counter()
+    store, _ = build_backend(kind, workdir, args)
+    result["reopen_s"] = round(time.perf_counter() - started, 3)
+    assert store.get(ids[-1]) is not None
+    store.close()
+    result["bytes_per_conversation"] = round(result["disk_bytes"] / max(len(ids), 1), 1)
+    print(f"  disk {result['disk_bytes'] / 2**20:.1f} MB  reopen {result['reopen_s']}s")
+    return result
+
+
+def main(argv: Optional[List[str]] = None) -> Dict[str, Any]:
+    parser = argparse.ArgumentParser(description="Benchmark conversation store backends")
+    parser.add_argument("--conversations", type=int, default=1_000_000)
+    parser.add_argument("--rounds", type=int, default=2, help="finished rounds per synthetic conversation")
+    parser.add_argument("--reads", type=int, default=100_000)
+    parser.add_argument("--updates", type=int, default=100_000)
+    parser.add_argument("--backends", default="sqlite,log")
+    parser.add_argument("--segment-mb", type=float, default=64.0)
+    parser.add_argument("--fsync", action="store_true", help="log backend: flush every append to disk")
+    parser.add_argument("--compact-ratio", type=float, default=0.9)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--dir", default=os.path.join("data", "bench", "store-scratch"))
+    parser.add_argument("--keep", action="store_true", help="keep the scratch stores")
+    parser.add_argument("--out", default=None, help="result JSON path (default data/bench/store-<time>.json)")
+    args = parser.parse_args(argv)
+
+    rng = random.Random(args.seed)
+    templates = [synthetic_state(f"t{i}", args.rounds, rng) for i in range(32)]
+    result = {
+        "kind": "store",
+        "created_at": time.time(),
+        "params": {k: v for k, v in vars(args).items() if k not in ("out", "dir", "keep")},
+        "state_json_bytes": round(sum(len(t.model_dump_json()) for t in templates) / len(templates)),
+        "backends": {},
+    }
+    try:
+        for kind in [b.strip() for b in args.backends.split(",") if b.strip()]:
+            result["backends"][kind] = bench_backend(kind, args, templates)
+    finally:
+        if not args.keep:
+            shutil.rmtree(args.dir, ignore_errors=True)
+
+    out = args.out or os.path.join("data", "bench", f"store-{time.strftime('%Y%m%d-%H%M%S')}.json")
+    os.makedirs(os.path.dirname(out) or ".", exist_ok=True)
+    with open(out, "w", encoding="utf-8") as f:
+        json.dump(result, f, ensure_ascii=False, indent=2)
+    print(f"results written to {out}")
+    return result
+
+
+if __name__ == "__main__":
+    main()
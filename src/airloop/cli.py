@@ -0,0 +1,40 @@
+"""
+`airloop` command line.
+
+    airloop serve --workers 4 --port 8000
+    airloop train-dict --out data/conversations.zdict
+    airloop export --out rounds.ndjson --since 2025-10-01
+"""
+from __future__ import annotations
+
+import argparse
+import sys
+from typing import List, Optional
+
+from airloop.domain import codec
+from airloop.server import serve
+from airloop.service import export_service
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(prog="airloop", description="Airline customer service agents")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    serve_parser = commands.add_parser("serve", help="run the API server")
+    serve.add_arguments(serve_parser)
+    serve_parser.set_defaults(handler=serve.run)
+
+    dict_parser = commands.add_parser("train-dict", help="train a zstd dictionary on stored conversations")
+    codec.add_train_arguments(dict_parser)
+    dict_parser.set_defaults(handler=codec.run_train)
+
+    export_parser = commands.add_parser("export", help="stream conversation rounds as NDJSON")
+    export_service.add_arguments(export_parser)
+    export_parser.set_defaults(handler=export_service.run)
+
+    args = parser.parse_args(argv)
+    return args.handler(args) or 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
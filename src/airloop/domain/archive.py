@@ -0,0 +1,63 @@
+"""
+Cold storage for idle conversations.
+
+A separate sqlite file holding one compressed blob per conversation: the full state with
+its rounds inline (the pre-split row layout, so PersistentConversationStore reads it back
+with the same code path). The hot database keeps only a small index of what was moved
+here; see PersistentConversationStore.archive_one() and get().
+"""
+from __future__ import annotations
+
+import os
+import sqlite3
+import time
+from typing import Dict, Optional, Tuple
+
+from airloop.domain.codec import StateCodec
+
+
+class ConversationArchive:
+    def __init__(self, db_path: str = "data/conversations_archive.db", codec: Optional[StateCodec] = None):
+        self.db_path = db_path
+        self.codec = codec or StateCodec("json+zlib", level=9)
+        os.makedirs(os.path.dirname(db_path) or ".", exist_ok=True)
+        self._conn = sqlite3.connect(db_path, check_same_thread=False)
+        self._conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS archived_conversations (
+                id TEXT PRIMARY KEY,
+                state BLOB NOT NULL,
+                version INTEGER NOT NULL,
+                updated_at REAL,
+                archived_at REAL NOT NULL
+            )
+            """
+        )
+        self._conn.commit()
+
+    def put(self, conversation_id: str, data: Dict, version: int, updated_at: Optional[float]) -> int:
+        """Store the inline state dict; returns the compressed size."""
+        blob = self.codec.dumps(data)
+        self._conn.execute(
+            "INSERT OR REPLACE INTO archived_conversations (id, state, version, updated_at, archived_at) VALUES (?, ?, ?, ?, ?)",
+            (conversation_id, blob, version, updated_at, time.time()),
+        )
+        self._conn.commit()
+        return len(blob)
+
+    def get(self, conversation_id: str) -> Optional[Tuple[bytes, int, Optional[float]]]:
+        """(blob, version, updated_at) or None."""
+        row = self._conn.execute(
+            "SELECT state, version, updated_at FROM archived_conversations WHERE id = ?", (conversation_id,)
+        ).fetchone()
+        return (row[0], row[1], row[2]) if row else None
+
+    def delete(self, conversation_id: str) -> None:
+        self._conn.execute("DELETE FROM archived_conversations WHERE id = ?", (conversation_id,))
+        self._conn.commit()
+
+    def count(self) -> int:
+        return self._conn.execute("SELECT COUNT(*) FROM archived_conversations").fetchone()[0]
+
+    def close(self) -> None:
+        self._conn.close()
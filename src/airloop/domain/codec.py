@@ -0,0 +1,177 @@
+"""
+Serialization of stored conversation states.
+
+A stored state is a blob: schema version byte | codec byte | body. The codec byte names the
+body format (high nibble: JSON or msgpack) and its compression (low nibble: none, zlib or
+zstd), so every blob can be read back whatever the store is currently configured to write.
+Rows written before this existed are plain JSON text; they start with "{" and are decoded
+as such.
+
+msgpack and zstd are optional (`pip install 'agents_demo[codec]'`). zstd can use a trained
+dictionary, which pays off on our payloads: every state repeats the same keys, roles,
+agent names, tool names and canned tool outputs. Train one from the current store with
+`airloop train-dict`; its id is recorded in each zstd frame, and reading a frame that was
+written with a dictionary needs that dictionary configured.
+"""
+from __future__ import annotations
+
+import argparse
+import json
+import os
+import zlib
+from typing import Any, Dict, List, Optional, Union
+
+
+SCHEMA_VERSION = 1
+
+_FORMATS = {"json": 0x00, "msgpack": 0x10}
+_COMPRESSIONS = {"none": 0x00, "zlib": 0x01, "zstd": 0x02}
+
+
+def _msgpack():
+    try:
+        import msgpack
+    except ImportError as e:
+        raise RuntimeError("the msgpack serializer needs `pip install 'agents_demo[codec]'`") from e
+    return msgpack
+
+
+def _zstd():
+    try:
+        import zstandard
+    except ImportError as e:
+        raise RuntimeError("zstd compression needs `pip install 'agents_demo[codec]'`") from e
+    return zstandard
+
+
+class StateCodec:
+    """
+    `spec` is "<format>[+<compression>]", e.g. "json", "json+zlib", "msgpack+zstd".
+    `level` is the compression level (library default when None).
+    """
+
+    def __init__(self, spec: str = "json+zlib", level: Optional[int] = None, zstd_dict_path: Optional[str] = None):
+        fmt, _, compression = spec.partition("+")
+        compression = compression or "none"
+        if fmt not in _FORMATS or compression not in _COMPRESSIONS:
+            raise ValueError(f"unknown serializer {spec!r}")
+        self.spec = spec
+        self.format = fmt
+        self.compression = compression
+        self.level = level
+        self.zstd_dict_path = zstd_dict_path
+        self.codec_byte = _FORMATS[fmt] | _COMPRESSIONS[compression]
+        if fmt == "msgpack":
+            _msgpack()
+        self._zstd_dict = None
+        if zstd_dict_path:
+            zstd = _zstd()
+            with open(zstd_dict_path, "rb") as f:
+                self._zstd_dict = zstd.ZstdCompressionDict(f.read())
+        self._compressor = None
+        self._decompressors: Dict[int, Any] = {}
+        if compression == "zstd":
+            zstd = _zstd()
+            kwargs = {"level": level} if level is not None else {}
+            self._compressor = zstd.ZstdCompressor(dict_data=self._zstd_dict, **kwargs)
+
+    def copy(self) -> "StateCodec":
+        """Same settings, compressor objects of its own (zstd ones must not be shared across threads)."""
+        return StateCodec(self.spec, level=self.level, zstd_dict_path=self.zstd_dict_path)
+
+    # ---- body formats ----
+
+    def serialize(self, data: Dict[str, Any]) -> bytes:
+        """The uncompressed body in this codec's format (also what dictionaries are trained on)."""
+        if self.format == "msgpack":
+            return _msgpack().packb(data, use_bin_type=True)
+        return json.dumps(data, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+    @staticmethod
+    def _deserialize(fmt: int, body: bytes) -> Dict[str, Any]:
+        if fmt == _FORMATS["msgpack"]:
+            return _msgpack().unpackb(body, raw=False, strict_map_key=False)
+        return json.loads(body)
+
+    # ---- compression ----
+
+    def _decompress(self, compression: int, body: bytes) -> bytes:
+        if compression == _COMPRESSIONS["zlib"]:
+            return zlib.decompress(body)
+        if compression == _COMPRESSIONS["zstd"]:
+            zstd = _zstd()
+            dict_id = zstd.get_frame_parameters(body).dict_id
+            decompressor = self._decompressors.get(dict_id)
+            if decompressor is None:
+                if dict_id and (self._zstd_dict is None or self._zstd_dict.dict_id() != dict_id):
+                    raise RuntimeError(f"state was compressed with zstd dictionary {dict_id}, which is not configured")
+                decompressor = zstd.ZstdDecompressor(dict_data=self._zstd_dict if dict_id else None)
+                self._decompressors[dict_id] = decompressor
+            return decompressor.decompress(body)
+        return body
+
+    # ---- public ----
+
+    def dumps(self, data: Dict[str, Any]) -> bytes:
+        body = self.serialize(data)
+        if self.compression == "zlib":
+            body = zlib.compress(body, self.level if self.level is not None else 6)
+        elif self.compression == "zstd":
+            body = self._compressor.compress(body)
+        return bytes((SCHEMA_VERSION, self.codec_byte)) + body
+
+    def loads(self, blob: Union[bytes, bytearray, memoryview, str]) -> Dict[str, Any]:
+        if isinstance(blob, str):
+            return json.loads(blob)
+        blob = bytes(blob)
+        if blob[:1] == b"{":
+            return json.loads(blob)
+        version, codec_byte = blob[0], blob[1]
+        if version > SCHEMA_VERSION:
+            raise RuntimeError(f"state schema version {version} is newer than this build ({SCHEMA_VERSION})")
+        body = self._decompress(codec_byte & 0x0F, blob[2:])
+        return self._deserialize(codec_byte & 0xF0, body)
+
+
+def train_dictionary(codec: StateCodec, states: List[Dict[str, Any]], size: int = 112 * 1024) -> bytes:
+    """Train a zstd dictionary on `states` serialized in `codec`'s format; returns its bytes."""
+    zstd = _zstd()
+    samples = [codec.serialize(state) for state in states]
+    return zstd.train_dictionary(size, samples).as_bytes()
+
+
+def add_train_arguments(parser: argparse.ArgumentParser) -> None:
+    parser.add_argument("--out", default=None, help="dictionary path (default store.zstd_dict_path)")
+    parser.add_argument("--samples", type=int, default=5000, help="conversations to sample")
+    parser.add_argument("--size-kb", type=int, default=112)
+
+
+def run_train(args: argparse.Namespace) -> int:
+    from airloop.server.services import build_store
+    from airloop.settings import load_app_config
+
+    cfg = load_app_config()
+    out = args.out or cfg.store.zstd_dict_path
+    if not out:
+        print("no output path: pass --out or set store.zstd_dict_path")
+        return 2
+    store = build_store(cfg)
+    codec = StateCodec(cfg.store.serializer.split("+")[0])
+    states = []
+    for cid in store.iter_ids():
+        state = store.get(cid)
+        if state is not None:
+            states.append(state.model_dump(mode="json", exclude={"version"}))
+        if len(states) >= args.samples:
+            break
+    if hasattr(store, "close"):
+        store.close()
+    if len(states) < 10:
+        print(f"only {len(states)} conversations in the store; need at least 10 to train")
+        return 1
+    data = train_dictionary(codec, states, args.size_kb * 1024)
+    os.makedirs(os.path.dirname(out) or ".", exist_ok=True)
+    with open(out, "wb") as f:
+        f.write(data)
+    print(f"trained a {len(data) // 1024} KB dictionary on {len(states)} conversations -> {out}")
+    return 0
@@ -0,0 +1,355 @@
+"""
+Append-only, segmented log backend for conversation states.
+
+Every save appends one record - the conversation's state after that round - to the active
+segment file; nothing is rewritten in place. An in-memory index maps each conversation id
+to its latest record, and reads slice the record straight out of the segment's mmap.
+
+Record layout (little endian):
+
+    magic "ALR1" | crc32(body) u32 | body length u32 | body
+    body = version u64 | updated_at f64 | id length u16 | id utf-8 | state blob (StateCodec)
+
+The active segment is preallocated and written through its mmap, so the unwritten tail is
+zeros. On open every segment is scanned and the index rebuilt; the scan of a segment stops
+at the first record with a bad magic, a short body or a checksum mismatch, which drops a
+torn write left by a crash. Superseded records are garbage: a background thread copies the
+live records of sealed segments that are mostly garbage into the active segment and
+deletes the old file.
+
+The directory is locked for one process; under `airloop serve --workers N` use sqlite.
+"""
+from __future__ import annotations
+
+import itertools
+import logging
+import mmap
+import os
+import struct
+import threading
+import time
+import zlib
+from typing import Dict, Iterator, List, NamedTuple, Optional
+
+try:
+    import fcntl
+except ImportError:  # pragma: no cover - windows
+    fcntl = None
+
+from airloop.domain.codec import StateCodec
+from airloop.domain.schema import ConversationConflictError, ConversationState, ConversationStore
+
+
+logger = logging.getLogger(__name__)
+
+_MAGIC = b"ALR1"
+_HEADER = struct.Struct("<4sII")
+_BODY_HEAD = struct.Struct("<QdH")
+_SUFFIX = ".seg"
+
+
+class _Loc(NamedTuple):
+    segment: int
+    offset: int
+    length: int  # header + body
+    version: int
+    updated_at: float
+
+
+class _Segment:
+    def __init__(self, seq: int, path: str):
+        self.seq = seq
+        self.path = path
+        self.file = None
+        self.mm: Optional[mmap.mmap] = None
+        self.end = 0  # bytes of valid records
+        self.capacity = 0
+        self.live = 0  # bytes of records the index still points at
+        self.sealed = True
+
+    def close(self) -> None:
+        if self.mm is not None:
+            self.mm.close()
+            self.mm = None
+        if self.file is not None:
+            self.file.close()
+            self.file = None
+
+
+def encode_record(conversation_id: str, version: int, updated_at: float, payload: bytes) -> bytes:
+    cid = conversation_id.encode("utf-8")
+    body = _BODY_HEAD.pack(version, updated_at, len(cid)) + cid + payload
+    return _HEADER.pack(_MAGIC, zlib.crc32(body), len(body)) + body
+
+
+class LogConversationStore(ConversationStore):
+    """
+    ConversationStore over a directory of append-only segment files. Same compare-and-swap
+    semantics as the other stores: `state.version` must match the latest record.
+    """
+
+    def __init__(
+        self,
+        directory: str = "data/conversations.log.d",
+        segment_bytes: int = 64 * 2**20,
+        fsync: bool = False,
+        compact_interval_s: Optional[float] = 60.0,
+        compact_ratio: float = 0.5,
+        codec: Optional[StateCodec] = None,
+    ):
+        self.directory = directory
+        self.codec = codec or StateCodec()
+        self.segment_bytes = segment_bytes
+        self.fsync = fsync
+        self.compact_ratio = compact_ratio
+        self.stats = {"compactions": 0, "segments_removed": 0, "bytes_reclaimed": 0, "corrupt_tails": 0}
+        os.makedirs(directory, exist_ok=True)
+        self._lock = threading.RLock()
+        self._lock_file = open(os.path.join(directory, "LOCK"), "a+")
+        if fcntl is not None:
+            try:
+                fcntl.flock(self._lock_file.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except OSError:
+                self._lock_file.close()
+                raise RuntimeError(f"conversation log {directory} is open in another process")
+        self._index: Dict[str, _Loc] = {}
+        self._segments: Dict[int, _Segment] = {}
+        self._active: Optional[_Segment] = None
+        self._closed = False
+        self._recover()
+        self._open_active(segment_bytes)
+        self._stop = threading.Event()
+        self._compactor: Optional[threading.Thread] = None
+        if compact_interval_s:
+            self._compactor = threading.Thread(
+                target=self._compact_loop, args=(compact_interval_s,), name="conversation-log-compactor", daemon=True
+            )
+            self._compactor.start()
+
+    # ---- segments ----
+
+    def _path(self, seq: int) -> str:
+        return os.path.join(self.directory, f"{seq:010d}{_SUFFIX}")
+
+    def _scan(self, seg: _Segment, limit: int) -> int:
+        """Index every valid record of `seg` up to `limit`; returns the end of the last one."""
+        mm, off = seg.mm, 0
+        while off + _HEADER.size <= limit:
+            magic, crc, length = _HEADER.unpack_from(mm, off)
+            body_start = off + _HEADER.size
+            if magic != _MAGIC or body_start + length > limit:
+                break
+            body = mm[body_start:body_start + length]
+            if zlib.crc32(body) != crc:
+                break
+            version, updated_at, id_len = _BODY_HEAD.unpack_from(body)
+            cid = body[_BODY_HEAD.size:_BODY_HEAD.size + id_len].decode("utf-8")
+            self._point(cid, _Loc(seg.seq, off, _HEADER.size + length, version, updated_at))
+            off = body_start + length
+        if off < limit and any(mm[off:min(limit, off + _HEADER.size)]):
+            self.stats["corrupt_tails"] += 1
+            logger.warning("conversation log %s: ignoring %s bytes after offset %s", seg.path, limit - off, off)
+        return off
+
+    def _recover(self) -> None:
+        seqs = sorted(int(name[: -len(_SUFFIX)]) for name in os.listdir(self.directory) if name.endswith(_SUFFIX))
+        for seq in seqs:
+            seg = _Segment(seq, self._path(seq))
+            size = os.path.getsize(seg.path)
+            if size == 0:
+                os.remove(seg.path)
+                continue
+            seg.file = open(seg.path, "r+b")
+            seg.mm = mmap.mmap(seg.file.fileno(), size, access=mmap.ACCESS_READ)
+            self._segments[seq] = seg
+            seg.end = self._scan(seg, size)
+            if seg.end < size:
+                # drop the torn or preallocated tail so the segment is sealed at its last record
+                seg.mm.close()
+                seg.file.truncate(seg.end)
+                seg.mm = mmap.mmap(seg.file.fileno(), seg.end, access=mmap.ACCESS_READ) if seg.end else None
+            seg.capacity = seg.end
+        # compaction moves old records behind newer ones; restore save order
+        self._index = dict(sorted(self._index.items(), key=lambda item: item[1].updated_at))
+
+    def _open_active(self, capacity: int) -> None:
+        seq = max(self._segments, default=0) + 1
+        seg = _Segment(seq, self._path(seq))
+        seg.file = open(seg.path, "w+b")
+        seg.file.truncate(capacity)
+        seg.mm = mmap.mmap(seg.file.fileno(), capacity, access=mmap.ACCESS_WRITE)
+        seg.capacity = capacity
+        seg.sealed = False
+        self._segments[seq] = seg
+        self._active = seg
+
+    def _seal(self, seg: _Segment) -> None:
+        seg.mm.flush()
+        seg.mm.close()
+        seg.file.truncate(seg.end)
+        if self.fsync:
+            os.fsync(seg.file.fileno())
+        seg.mm = mmap.mmap(seg.file.fileno(), seg.end, access=mmap.ACCESS_READ) if seg.end else None
+        seg.capacity = seg.end
+        seg.sealed = True
+
+    def _append(self, record: bytes) -> _Segment:
+        seg = self._active
+        if seg.end + len(record) > seg.capacity:
+            self._seal(seg)
+            self._open_active(max(self.segment_bytes, len(record)))
+            seg = self._active
+        seg.mm[seg.end:seg.end + len(record)] = record
+        if self.fsync:
+            seg.mm.flush()
+        return seg
+
+    def _point(self, conversation_id: str, loc: _Loc, keep_order: bool = False) -> None:
+        # the index is kept in save order (re-inserting moves a key to the end), so list()
+        # can walk it backwards instead of sorting
+        old = self._index.get(conversation_id) if keep_order else self._index.pop(conversation_id, None)
+        if old is not None:
+            self._segments[old.segment].live -= old.length
+        self._index[conversation_id] = loc
+        self._segments[loc.segment].live += loc.length
+
+    # ---- ConversationStore ----
+
+    def _read(self, loc: _Loc) -> Optional[ConversationState]:
+        mm = self._segments[loc.segment].mm
+        _, crc, length = _HEADER.unpack_from(mm, loc.offset)
+        body = mm[loc.offset + _HEADER.size:loc.offset + loc.length]
+        if zlib.crc32(body) != crc:
+            logger.error("conversation log: checksum mismatch in segment %s at %s", loc.segment, loc.offset)
+            return None
+        id_len = _BODY_HEAD.unpack_from(body)[2]
+        data = self.codec.loads(body[_BODY_HEAD.size + id_len:])
+        if "round_store" in data and isinstance(data["round_store"], dict):
+            data["round_store"] = {int(k): v for k, v in data["round_store"].items()}
+        try:
+            state = ConversationState.model_validate(data)
+        except Exception:
+            logger.exception("invalid conversation state in segment %s at %s", loc.segment, loc.offset)
+            return None
+        state.version = loc.version
+        state.bound_context()
+        return state
+
+    def get(self, conversation_id: str) -> Optional[ConversationState]:
+        with self._lock:
+            loc = self._index.get(conversation_id)
+            return self._read(loc) if loc is not None else None
+
+    def save(self, conversation_id: str, state: ConversationState):
+        payload = self.codec.dumps(state.model_dump(mode="json", exclude={"version"}))
+        with self._lock:
+            loc = self._index.get(conversation_id)
+            stored_version = loc.version if loc is not None else 0
+            if state.version != stored_version:
+                raise ConversationConflictError(
+                    conversation_id, state.version, stored_version if loc is not None else None
+                )
+            now = time.time()
+            record = encode_record(conversation_id, state.version + 1, now, payload)
+            seg = self._append(record)
+            self._point(conversation_id, _Loc(seg.seq, seg.end, len(record), state.version + 1, now))
+            seg.end += len(record)
+        state.version += 1
+
+    def version_of(self, conversation_id: str) -> Optional[int]:
+        loc = self._index.get(conversation_id)
+        return loc.version if loc is not None else None
+
+    def iter_ids(self, updated_since: Optional[float] = None) -> Iterator[str]:
+        with self._lock:
+            ids = [
+                cid for cid, loc in self._index.items()
+                if updated_since is None or loc.updated_at >= updated_since
+            ]
+        return iter(ids)
+
+    def list(self, limit: int = 20) -> List[ConversationState]:
+        """Most recently saved first."""
+        with self._lock:
+            states = [self._read(loc) for loc in itertools.islice(reversed(self._index.values()), limit)]
+        return [st for st in states if st is not None]
+
+    def __len__(self) -> int:
+        return len(self._index)
+
+    # ---- compaction ----
+
+    def compact(self, ratio: Optional[float] = None) -> int:
+        """
+        Rewrite the live records of sealed segments whose live fraction is below `ratio` into
+        the active segment and delete them. Returns the bytes reclaimed on disk.
+        """
+        ratio = self.compact_ratio if ratio is None else ratio
+        reclaimed = 0
+        with self._lock:
+            candidates = [
+                seg for seg in self._segments.values()
+                if seg.sealed and (seg.end == 0 or seg.live / seg.end < ratio)
+            ]
+            for seg in candidates:
+                moved = self._move_live(seg)
+                # the copies must be on disk before the originals go away
+                self._active.mm.flush()
+                del self._segments[seg.seq]
+                seg.close()
+                os.remove(seg.path)
+                reclaimed += seg.end - moved
+                self.stats["segments_removed"] += 1
+            if candidates:
+                self.stats["compactions"] += 1
+                self.stats["bytes_reclaimed"] += reclaimed
+        return reclaimed
+
+    def _move_live(self, seg: _Segment) -> int:
+        moved, off = 0, 0
+        while off < seg.end:
+            length = _HEADER.size + _HEADER.unpack_from(seg.mm, off)[2]
+            body = seg.mm[off + _HEADER.size:off + length]
+            id_len = _BODY_HEAD.unpack_from(body)[2]
+            cid = body[_BODY_HEAD.size:_BODY_HEAD.size + id_len].decode("utf-8")
+            loc = self._index.get(cid)
+            if loc is not None and loc.segment == seg.seq and loc.offset == off:
+                # records are copied verbatim, checksum included
+                dest = self._append(seg.mm[off:off + length])
+                self._point(cid, loc._replace(segment=dest.seq, offset=dest.end), keep_order=True)
+                dest.end += length
+                moved += length
+            off += length
+        return moved
+
+    def _compact_loop(self, interval_s: float) -> None:
+        while not self._stop.wait(interval_s):
+            try:
+                reclaimed = self.compact()
+                if reclaimed:
+                    logger.info("conversation log compaction reclaimed %.1f MB", reclaimed / 2**20)
+            except Exception:
+                logger.exception("conversation log compaction failed")
+
+    def disk_stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {
+                "conversations": len(self._index),
+                "segments": len(self._segments),
+                "bytes": sum(seg.end for seg in self._segments.values()),
+                "live_bytes": sum(seg.live for seg in self._segments.values()),
+            }
+
+    def close(self) -> None:
+        if self._closed:
+            return
+        self._stop.set()
+        if self._compactor is not None:
+            self._compactor.join()
+        with self._lock:
+            self._closed = True
+            if self._active is not None:
+                self._seal(self._active)
+            for seg in self._segments.values():
+                seg.close()
+            self._lock_file.close()
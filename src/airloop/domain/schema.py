@@ -1,12 +1,21 @@
 from __future__ import annotations
 import random
 import json
+import logging
 import os
 import time
 import sqlite3
-from typing import List, Dict, Any, Optional
+from collections import OrderedDict
+from typing import List, Dict, Any, Callable, Iterable, Iterator, Optional, Tuple
 from dataclasses import dataclass, field
-from pydantic import BaseModel
+from pydantic import BaseModel, PrivateAttr
+from airloop.domain.archive import ConversationArchive
+from airloop.domain.codec import StateCodec
+from airloop.domain.search import ConversationSearchIndex, fts5_available
+
+logger = logging.getLogger(__name__)
+
+_BUSY_TIMEOUT_MS = 5000
 # from airloop.domain.context import AirlineAgentContext
 
 
@@ -63,6 +72,8 @@ class ChatResponse(BaseModel):
     agents: List[Dict[str, Any]]
     guardrails: List[GuardrailCheck] = []
     trace_id: Optional[str] = None
+    timings: Optional[List[Dict[str, Any]]] = None
+    usage: Optional[Dict[str, Any]] = None
 
 # =====================================================================
 # In-memory store for conversation state 
@@ -79,6 +90,9 @@ class _RoundStore(BaseModel):
     events: List[Any] = field(default_factory=list)
     trace_id: Optional[str] = None
     guardrails: List[Any] = field(default_factory=list)
+    usage: Dict[str, Any] = field(default_factory=dict)
+    # {"finished_at": unix seconds, "phases": PhaseTimer.summary() up to the round's save}
+    timings: Dict[str, Any] = field(default_factory=dict)
     
 
 class ConversationState(BaseModel):
@@ -91,7 +105,58 @@ class ConversationState(BaseModel):
     context: Any = None
     round_counter: int = 0
     round_store: Dict[int, _RoundStore] = field(default_factory=dict)
-    
+    # optimistic concurrency: the stored version this state was loaded at (0 = never saved)
+    version: int = 0
+    # lazy history: rounds below `_lazy_below` are not in round_store yet; `_round_loader(lo, hi)`
+    # returns the stored rounds in [lo, hi) as raw dicts. Set by PersistentConversationStore.
+    _round_loader: Optional[Callable[[int, int], Dict[int, Any]]] = PrivateAttr(default=None)
+    _lazy_below: int = PrivateAttr(default=0)
+    # rounds below this index are already in the store's rounds table (None = write them all)
+    _stored_below: Optional[int] = PrivateAttr(default=None)
+
+    @property
+    def rounds_loaded(self) -> bool:
+        return self._round_loader is None
+
+    def hydrate_rounds(self, start: int = 0) -> "ConversationState":
+        """Load the historic rounds from `start` on (all by default) into round_store."""
+        if self._round_loader is None or start >= self._lazy_below:
+            return self
+        for idx, data in self._round_loader(start, self._lazy_below).items():
+            self.round_store.setdefault(idx, _RoundStore.model_validate(data))
+        self.round_store = dict(sorted(self.round_store.items()))
+        self._lazy_below = start
+        if start <= 0:
+            self._round_loader = None
+        return self
+
+    def iter_rounds(self, page_size: int = 50) -> Iterator[Tuple[int, "_RoundStore"]]:
+        """
+        Yield (index, round) in order without hydrating: rounds that are not loaded yet are read
+        `page_size` at a time and not kept, so memory stays flat however long the history is.
+        """
+        lazy_below = self._lazy_below if self._round_loader is not None else 0
+        for lo in range(0, lazy_below, page_size):
+            page = self._round_loader(lo, min(lo + page_size, lazy_below))
+            for idx in sorted(page):
+                yield idx, _RoundStore.model_validate(page[idx])
+        for idx in sorted(self.round_store):
+            if idx >= lazy_below:
+                yield idx, self.round_store[idx]
+
+    def model_dump(self, **kwargs):
+        # a full dump must include the history, whoever asks for it
+        self.hydrate_rounds()
+        return super().model_dump(**kwargs)
+
+    def model_dump_json(self, **kwargs):
+        self.hydrate_rounds()
+        return super().model_dump_json(**kwargs)
+
+    def dump_header(self) -> Dict[str, Any]:
+        """JSON-mode dump without round_store and version; never hydrates."""
+        return super().model_dump(mode="json", exclude={"version", "round_store"})
+
     def bound_context(self):
         # If context is a plain dict, attempt to rebuild AirlineAgentContext
         try:
@@ -113,12 +178,21 @@ class ConversationState(BaseModel):
         input_items: List[Dict[str, Any]],
         messages: List[Dict[str, Any]]=None,
         events: Optional[List[Any]]=None,
+        usage: Optional[Dict[str, Any]]=None,
+        guardrails: Optional[List[Any]]=None,
+        timings: Optional[Dict[str, Any]]=None,
     ):
         if not events:
             events = []
         if not messages:
             messages = []
         self._ensure_round()
+        if usage is not None:
+            self.round_store[self.round_counter].usage = usage
+        if guardrails is not None:
+            self.round_store[self.round_counter].guardrails = guardrails
+        if timings is not None:
+            self.round_store[self.round_counter].timings = timings
         self.round_store[self.round_counter].agent_name = agent_name
         self.round_store[self.round_counter].input_items = input_items
         self.round_store[self.round_counter].events.extend(events)
@@ -131,6 +205,7 @@ class ConversationState(BaseModel):
         
     @property
     def messages(self):
+        self.hydrate_rounds()
         messages = []
         now_ms = int(time.time() * 1000)
         for idx, item in self.round_store.items():
@@ -160,7 +235,24 @@ class ConversationState(BaseModel):
             
 
 
+class ConversationConflictError(RuntimeError):
+	"""Raised by `save` when the conversation was saved by someone else since it was loaded."""
+
+	def __init__(self, conversation_id: str, expected: int, actual: Optional[int]):
+		super().__init__(f"Conversation {conversation_id} changed concurrently (loaded version {expected}, stored {actual})")
+		self.conversation_id = conversation_id
+		self.expected = expected
+		self.actual = actual
+
+
 class ConversationStore:
+	"""
+	Conversation persistence with optimistic concurrency: `save` is a compare-and-swap on
+	`state.version`. It succeeds only if the stored version still equals the one the state
+	was loaded at (0 for a new conversation), then bumps `state.version`; otherwise it raises
+	ConversationConflictError and leaves the stored conversation untouched.
+	"""
+
 	def get(self, conversation_id: str) -> Optional[ConversationState]:
 		pass
 
@@ -170,81 +262,495 @@ class ConversationStore:
 	def list(self, limit: int = 20) -> List[ConversationState]:
 		pass
 
+	def iter_ids(self, updated_since: Optional[float] = None) -> Iterator[str]:
+		"""Stream conversation ids, optionally only those saved at or after `updated_since` (unix seconds)."""
+		return iter(())
+
+	def is_archived(self, conversation_id: str) -> bool:
+		"""Whether the conversation sits in the cold archive (`get` would restore it)."""
+		return False
+
+@dataclass
+class _MemoryEntry:
+	state: ConversationState
+	size: int
+	last_active: float
+	updated_at: float
+
+
 class InMemoryConversationStore(ConversationStore):
-	_conversations: Dict[str, ConversationState] = {}
+	"""
+	Instance-scoped in-memory store, ordered by last activity (get or save).
+
+	Bounded by any combination of `max_conversations` (LRU), `ttl_s` (idle time) and
+	`max_bytes` (sum of each state's serialized JSON size, an estimate of its footprint).
+	Evicted conversations are written to `spill` when given (typically the sqlite store) and
+	transparently loaded back on the next `get`; without it they are dropped.
+	"""
+
+	def __init__(
+		self,
+		max_conversations: Optional[int] = None,
+		ttl_s: Optional[float] = None,
+		max_bytes: Optional[int] = None,
+		spill: Optional["PersistentConversationStore"] = None,
+	):
+		self.max_conversations = max_conversations
+		self.ttl_s = ttl_s
+		self.max_bytes = max_bytes
+		self.spill = spill
+		self._entries: "OrderedDict[str, _MemoryEntry]" = OrderedDict()
+		self._bytes = 0
+		self.stats = {"evicted": 0, "expired": 0, "spilled": 0, "spill_hits": 0}
+
+	def _size(self, state: ConversationState) -> int:
+		# only paid for when a memory cap is configured
+		return len(state.model_dump_json()) if self.max_bytes else 0
+
+	def _admit(self, conversation_id: str, state: ConversationState, updated_at: float) -> None:
+		now = time.time()
+		old = self._entries.pop(conversation_id, None)
+		if old is not None:
+			self._bytes -= old.size
+		entry = _MemoryEntry(state=state, size=self._size(state), last_active=now, updated_at=updated_at)
+		self._entries[conversation_id] = entry
+		self._bytes += entry.size
+		self._evict(now)
+
+	def _drop_oldest(self, reason: str) -> None:
+		cid, entry = self._entries.popitem(last=False)
+		self._bytes -= entry.size
+		self.stats[reason] += 1
+		if self.spill is not None:
+			self.spill.put(cid, entry.state, updated_at=entry.updated_at)
+			self.stats["spilled"] += 1
+
+	def _evict(self, now: Optional[float] = None) -> None:
+		now = now or time.time()
+		# entries are in activity order, so idle ones sit at the front
+		while self.ttl_s and self._entries and now - next(iter(self._entries.values())).last_active > self.ttl_s:
+			self._drop_oldest("expired")
+		while len(self._entries) > 1 and (
+			(self.max_conversations and len(self._entries) > self.max_conversations)
+			or (self.max_bytes and self._bytes > self.max_bytes)
+		):
+			self._drop_oldest("evicted")
 
 	def get(self, conversation_id: str) -> Optional[ConversationState]:
-		return self._conversations.get(conversation_id)
+		self._evict()
+		entry = self._entries.get(conversation_id)
+		if entry is None:
+			if self.spill is None:
+				return None
+			state = self.spill.get(conversation_id)
+			if state is None:
+				return None
+			self.stats["spill_hits"] += 1
+			self._admit(conversation_id, state.model_copy(deep=True), time.time())
+			return state
+		entry.last_active = time.time()
+		self._entries.move_to_end(conversation_id)
+		# hand out copies: two callers mutating one shared object would defeat the version check
+		return entry.state.model_copy(deep=True)
 
 	def save(self, conversation_id: str, state: ConversationState):
-		self._conversations[conversation_id] = state
+		entry = self._entries.get(conversation_id)
+		if entry is not None:
+			stored_version = entry.state.version
+		elif self.spill is not None:
+			stored_version = self.spill.version_of(conversation_id) or 0
+		else:
+			# evicted without a spill store (or new): nothing left to conflict with, so a round
+			# that was in flight during the eviction re-admits it at its own version
+			stored_version = state.version
+		if state.version != stored_version:
+			raise ConversationConflictError(conversation_id, state.version, stored_version)
+		state.version += 1
+		self._admit(conversation_id, state.model_copy(deep=True), time.time())
+
+	def __len__(self) -> int:
+		return len(self._entries)
+
+	@property
+	def approx_bytes(self) -> int:
+		return self._bytes
+
+	def iter_ids(self, updated_since: Optional[float] = None) -> Iterator[str]:
+		in_memory = set()
+		for cid, entry in list(self._entries.items()):
+			in_memory.add(cid)
+			if updated_since is None or entry.updated_at >= updated_since:
+				yield cid
+		if self.spill is not None:
+			for cid in self.spill.iter_ids(updated_since):
+				if cid not in in_memory:
+					yield cid
+
+	def is_archived(self, conversation_id: str) -> bool:
+		return self.spill is not None and self.spill.is_archived(conversation_id)
 
 	def list(self, limit: int = 20) -> List[ConversationState]:
-		all_states = list(self._conversations.values())
-		# In-memory: no timestamps, return as-is capped by limit
-		return all_states[:limit]
+		"""Most recently active first; topped up from the spill store when memory has fewer."""
+		self._evict()
+		states = [entry.state.model_copy(deep=True) for entry in list(reversed(self._entries.values()))[:limit]]
+		if self.spill is not None and len(states) < limit:
+			seen = set(self._entries)
+			states.extend(st for st in self.spill.list(limit=limit + len(seen)) if st.state_id not in seen)
+		return states[:limit]
   
 class PersistentConversationStore:
     """
-    Simple sqlite-backed conversation store. Serializes ConversationState as JSON.
+    Simple sqlite-backed conversation store. Serializes ConversationState with `codec`
+    (versioned blobs, see airloop.domain.codec); plain JSON rows from older builds still load.
+
+    The state header (everything but round_store) lives in `conversations` and each round in
+    `conversation_rounds`. `get` loads the header and the open round only; finished rounds are
+    fetched when something hydrates them (`messages`, session details, evaluation), and
+    `save` writes only the rounds that can have changed since the load. Rows from before the
+    split keep the whole history inline and are moved over on their next save.
+
+    With an `archive`, idle conversations can be moved out with `archive_one` (see
+    RetentionService); a small index of them stays here, and `get` restores one on access.
+
+    With a `search_tokenizer`, every written round is also indexed for full-text search
+    (`self.search`, see airloop.domain.search) in the same transaction. Archived
+    conversations stay searchable.
     """
-    def __init__(self, db_path: str = "data/conversations.db"):
+    def __init__(
+        self,
+        db_path: str = "data/conversations.db",
+        codec: Optional[StateCodec] = None,
+        archive: Optional[ConversationArchive] = None,
+        search_tokenizer: Optional[str] = None,
+    ):
         self.db_path = db_path
+        self.codec = codec or StateCodec()
+        self.archive = archive
+        self.search: Optional[ConversationSearchIndex] = None
         dir_name = os.path.dirname(db_path) or "."
         os.makedirs(dir_name, exist_ok=True)
         # Keep a shared connection (important for :memory:)
         self._conn = sqlite3.connect(self.db_path, check_same_thread=False, uri=self.db_path.startswith("file:"))
+        # only takes effect on a new database (before any table exists); see vacuum()
+        self._conn.execute("PRAGMA auto_vacuum = INCREMENTAL")
+        # sibling connections (retention) write alongside the request path: WAL lets readers
+        # through during their transactions, busy_timeout waits out the other writer
+        self._conn.execute(f"PRAGMA busy_timeout = {_BUSY_TIMEOUT_MS}")
+        if self.db_path != ":memory:" and "mode=memory" not in self.db_path:
+            self._conn.execute("PRAGMA journal_mode = WAL")
         self._ensure_schema()
+        if search_tokenizer:
+            if fts5_available(self._conn):
+                self.search = ConversationSearchIndex(self._conn, search_tokenizer)
+                self.search.ensure_schema()
+                self._conn.commit()
+            else:
+                logger.warning("sqlite3 was built without FTS5; conversation search is disabled")
 
     def _ensure_schema(self):
         self._conn.execute(
             """
             CREATE TABLE IF NOT EXISTS conversations (
                 id TEXT PRIMARY KEY,
-                state_json TEXT NOT NULL
+                state_json TEXT NOT NULL,
+                updated_at REAL,
+                version INTEGER NOT NULL DEFAULT 1
+            )
+            """
+        )
+        columns = [row[1] for row in self._conn.execute("PRAGMA table_info(conversations)").fetchall()]
+        if "updated_at" not in columns:
+            self._conn.execute("ALTER TABLE conversations ADD COLUMN updated_at REAL")
+        if "version" not in columns:
+            # rows written before versioning count as saved once
+            self._conn.execute("ALTER TABLE conversations ADD COLUMN version INTEGER NOT NULL DEFAULT 1")
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_conversations_updated_at ON conversations (updated_at)")
+        self._conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS conversation_rounds (
+                conversation_id TEXT NOT NULL,
+                round INTEGER NOT NULL,
+                data BLOB NOT NULL,
+                PRIMARY KEY (conversation_id, round)
+            ) WITHOUT ROWID
+            """
+        )
+        self._conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS conversation_archive_index (
+                id TEXT PRIMARY KEY,
+                user_id INTEGER,
+                title TEXT,
+                updated_at REAL,
+                archived_at REAL NOT NULL
             )
             """
         )
         self._conn.commit()
 
+    def _round_loader(self, conversation_id: str) -> Callable[[int, int], Dict[int, Any]]:
+        conn, codec = self._conn, self.codec
+
+        def load(lo: int, hi: int) -> Dict[int, Any]:
+            rows = conn.execute(
+                "SELECT round, data FROM conversation_rounds WHERE conversation_id = ? AND round >= ? AND round < ?",
+                (conversation_id, lo, hi),
+            ).fetchall()
+            return {idx: codec.loads(data) for idx, data in rows}
+
+        return load
+
+    def _from_row(self, conversation_id: str, blob, version: int) -> ConversationState:
+        data = self.codec.loads(blob)
+        inline = "round_store" in data
+        if inline and isinstance(data["round_store"], dict):
+            data["round_store"] = {int(k): v for k, v in data["round_store"].items()}
+        state = ConversationState.model_validate(data)
+        state.version = version
+        if not inline:
+            counter = state.round_counter
+            rows = self._conn.execute(
+                "SELECT round, data FROM conversation_rounds WHERE conversation_id = ? AND round >= ?",
+                (conversation_id, counter),
+            ).fetchall()
+            state.round_store = {idx: _RoundStore.model_validate(self.codec.loads(d)) for idx, d in rows}
+            if counter > 0:
+                state._round_loader = self._round_loader(conversation_id)
+                state._lazy_below = counter
+            state._stored_below = counter
+        state.bound_context()
+        return state
+
+    def _write_rounds(
+        self, conversation_id: str, state: ConversationState, start: int, updated_at: Optional[float] = None
+    ) -> None:
+        self._conn.executemany(
+            "INSERT OR REPLACE INTO conversation_rounds (conversation_id, round, data) VALUES (?, ?, ?)",
+            [
+                (conversation_id, idx, self.codec.dumps(rs.model_dump(mode="json")))
+                for idx, rs in state.round_store.items()
+                if idx >= start
+            ],
+        )
+        if self.search is not None:
+            self.search.index_rounds(
+                conversation_id,
+                state.user_id,
+                state.context,
+                [(idx, rs) for idx, rs in state.round_store.items() if idx >= start],
+                updated_at,
+            )
+
     def get(self, conversation_id: str) -> Optional[ConversationState]:
-        cur = self._conn.execute("SELECT state_json FROM conversations WHERE id = ?", (conversation_id,))
+        cur = self._conn.execute("SELECT state_json, version FROM conversations WHERE id = ?", (conversation_id,))
         row = cur.fetchone()
         if not row:
-            return None
-        data = json.loads(row[0])
-        if "round_store" in data and isinstance(data["round_store"], dict):
-            data["round_store"] = {int(k): v for k, v in data["round_store"].items()}
+            return self._restore(conversation_id) if self.archive is not None else None
         try:
-            state = ConversationState.model_validate(data)
-            state.bound_context()
-            return state
+            return self._from_row(conversation_id, row[0], row[1])
         except Exception as e:
             print(e)
             return None
 
     def save(self, conversation_id: str, state: ConversationState):
-        payload = state.model_dump(mode="json")
-        state_json = json.dumps(payload)
+        """Compare-and-swap on the version column; raises ConversationConflictError on a lost update."""
+        state_json = self.codec.dumps(state.dump_header())
+        now = time.time()
+        if state.version == 0:
+            cur = self._conn.execute(
+                "INSERT OR IGNORE INTO conversations (id, state_json, updated_at, version) VALUES (?, ?, ?, 1)",
+                (conversation_id, state_json, now),
+            )
+        else:
+            cur = self._conn.execute(
+                "UPDATE conversations SET state_json = ?, updated_at = ?, version = version + 1 WHERE id = ? AND version = ?",
+                (state_json, now, conversation_id, state.version),
+            )
+        if cur.rowcount != 1:
+            self._conn.rollback()
+            raise ConversationConflictError(conversation_id, state.version, self.version_of(conversation_id))
+        # finished rounds below _stored_below are immutable and already stored
+        self._write_rounds(conversation_id, state, state._stored_below or 0, now)
+        self._conn.commit()
+        state.version += 1
+        state._stored_below = state.round_counter
+
+    def put(self, conversation_id: str, state: ConversationState, updated_at: Optional[float] = None):
+        """Unconditional write keeping `state.version`; used to spill from the in-memory store."""
+        state.hydrate_rounds()
         self._conn.execute(
-            "INSERT OR REPLACE INTO conversations (id, state_json) VALUES (?, ?)",
-            (conversation_id, state_json),
+            "INSERT OR REPLACE INTO conversations (id, state_json, updated_at, version) VALUES (?, ?, ?, ?)",
+            (conversation_id, self.codec.dumps(state.dump_header()), updated_at or time.time(), state.version),
         )
+        self._write_rounds(conversation_id, state, 0, updated_at)
+        self._conn.commit()
+
+    def reindex_search(self, conversation_ids: Iterable[str]) -> int:
+        """(Re)build the search documents of a batch of conversations in one commit; returns how many were found."""
+        indexed = 0
+        for cid in conversation_ids:
+            row = self._conn.execute("SELECT updated_at FROM conversations WHERE id = ?", (cid,)).fetchone()
+            state = self.get(cid) if row else None
+            if state is None:
+                continue
+            state.hydrate_rounds()
+            self.search.index_rounds(cid, state.user_id, state.context, state.round_store.items(), row[0])
+            indexed += 1
         self._conn.commit()
+        return indexed
+
+    # ---- archive ----
+
+    def _restore(self, conversation_id: str) -> Optional[ConversationState]:
+        """Move an archived conversation back into the hot tables."""
+        indexed = self._conn.execute(
+            "SELECT 1 FROM conversation_archive_index WHERE id = ?", (conversation_id,)
+        ).fetchone()
+        if indexed is None:
+            return None
+        found = self.archive.get(conversation_id)
+        if found is None:
+            self._conn.execute("DELETE FROM conversation_archive_index WHERE id = ?", (conversation_id,))
+            self._conn.commit()
+            return None
+        blob, version, archived_updated_at = found
+        state = self._from_row(conversation_id, blob, version)
+        # restored as just touched, so the next retention pass does not send it straight back
+        self._conn.execute(
+            "INSERT OR REPLACE INTO conversations (id, state_json, updated_at, version) VALUES (?, ?, ?, ?)",
+            (conversation_id, self.codec.dumps(state.dump_header()), time.time(), version),
+        )
+        self._write_rounds(conversation_id, state, 0, archived_updated_at)
+        self._conn.execute("DELETE FROM conversation_archive_index WHERE id = ?", (conversation_id,))
+        self._conn.commit()
+        self.archive.delete(conversation_id)
+        state._stored_below = state.round_counter
+        return state
+
+    def idle_ids(self, before: float, limit: int) -> List[str]:
+        """Oldest conversations not saved since `before` (rows without a timestamp count as idle)."""
+        rows = self._conn.execute(
+            "SELECT id FROM conversations WHERE updated_at IS NULL OR updated_at < ? ORDER BY updated_at LIMIT ?",
+            (before, limit),
+        ).fetchall()
+        return [row[0] for row in rows]
+
+    def archive_one(self, conversation_id: str) -> Optional[int]:
+        """
+        Copy a conversation into the archive, then drop it from the hot tables. Returns the
+        archived size, or None when it was saved meanwhile (it stays hot).
+        """
+        row = self._conn.execute(
+            "SELECT updated_at FROM conversations WHERE id = ?", (conversation_id,)
+        ).fetchone()
+        state = self.get(conversation_id) if row else None
+        if state is None:
+            return None
+        data = state.model_dump(mode="json", exclude={"version"})
+        # archive first: a crash in between leaves a duplicate, never a loss
+        size = self.archive.put(conversation_id, data, state.version, row[0])
+        cur = self._conn.execute(
+            "DELETE FROM conversations WHERE id = ? AND version = ?", (conversation_id, state.version)
+        )
+        if cur.rowcount != 1:
+            self._conn.rollback()
+            self.archive.delete(conversation_id)
+            return None
+        self._conn.execute("DELETE FROM conversation_rounds WHERE conversation_id = ?", (conversation_id,))
+        self._conn.execute(
+            "INSERT OR REPLACE INTO conversation_archive_index (id, user_id, title, updated_at, archived_at) VALUES (?, ?, ?, ?, ?)",
+            (conversation_id, state.user_id, state.title, row[0], time.time()),
+        )
+        self._conn.commit()
+        return size
+
+    def sibling(self) -> "PersistentConversationStore":
+        """
+        Another store over the same database and archive files with connections of its own, for
+        long maintenance work in a worker thread. The shared connection's transactions would
+        otherwise interleave with the request path's.
+        """
+        archive = ConversationArchive(self.archive.db_path, self.archive.codec.copy()) if self.archive is not None else None
+        return PersistentConversationStore(self.db_path, codec=self.codec.copy(), archive=archive)
+
+    def is_archived(self, conversation_id: str) -> bool:
+        return self._conn.execute(
+            "SELECT 1 FROM conversation_archive_index WHERE id = ?", (conversation_id,)
+        ).fetchone() is not None
+
+    def archived_count(self) -> int:
+        return self._conn.execute("SELECT COUNT(*) FROM conversation_archive_index").fetchone()[0]
+
+    def file_bytes(self) -> int:
+        return sum(os.path.getsize(p) for p in (self.db_path, f"{self.db_path}-wal") if os.path.exists(p))
+
+    def vacuum(self, pages: int = 0, convert: bool = False) -> Dict[str, Any]:
+        """
+        Return free pages to the OS with incremental VACUUM (`pages` = 0 frees all). A database
+        created without auto_vacuum=INCREMENTAL has nothing to free this way; `convert` switches
+        it with one full VACUUM, which rewrites the whole file and holds the write lock for the
+        duration, so it is only done on request.
+        """
+        converted = False
+        if self._conn.execute("PRAGMA auto_vacuum").fetchone()[0] != 2:
+            if not convert:
+                return {"converted": False, "incremental": False, "freed_pages": 0}
+            self._conn.execute("PRAGMA auto_vacuum = INCREMENTAL")
+            self._conn.execute("VACUUM")
+            converted = True
+        page_size = self._conn.execute("PRAGMA page_size").fetchone()[0]
+        free_before = self._conn.execute("PRAGMA freelist_count").fetchone()[0]
+        self._conn.commit()
+        # executescript steps the pragma to completion; execute() would free a single page
+        self._conn.executescript(f"PRAGMA incremental_vacuum({int(pages)});" if pages else "PRAGMA incremental_vacuum;")
+        free_after = self._conn.execute("PRAGMA freelist_count").fetchone()[0]
+        # in WAL mode the truncation only reaches the main file at a checkpoint; also drop the
+        # -wal file the archiving grew (file_bytes counts it)
+        self._conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+        return {"converted": converted, "incremental": True, "freed_pages": free_before - free_after, "page_size": page_size}
+
+    def version_of(self, conversation_id: str) -> Optional[int]:
+        row = self._conn.execute("SELECT version FROM conversations WHERE id = ?", (conversation_id,)).fetchone()
+        return row[0] if row else None
+
+    def close(self):
+        self._conn.close()
+        if self.archive is not None:
+            self.archive.close()
+
+    def iter_ids(self, updated_since: Optional[float] = None, page_size: int = 500) -> Iterator[str]:
+        """
+        Stream conversation ids in id order, one page at a time (keyset pagination), so callers
+        never hold the full id list. Rows saved before `updated_at` existed only match without
+        `updated_since`.
+        """
+        last_id = ""
+        while True:
+            if updated_since is None:
+                rows = self._conn.execute(
+                    "SELECT id FROM conversations WHERE id > ? ORDER BY id LIMIT ?",
+                    (last_id, page_size),
+                ).fetchall()
+            else:
+                rows = self._conn.execute(
+                    "SELECT id FROM conversations WHERE id > ? AND updated_at >= ? ORDER BY id LIMIT ?",
+                    (last_id, updated_since, page_size),
+                ).fetchall()
+            if not rows:
+                return
+            for (cid,) in rows:
+                yield cid
+            last_id = rows[-1][0]
 
     def list(self, limit: int = 20) -> List[ConversationState]:
+        """Most recently active first (save updates the row in place, so rowid is creation order)."""
         rows = self._conn.execute(
-            "SELECT state_json FROM conversations ORDER BY rowid DESC LIMIT ?", (limit,)
+            "SELECT id, state_json, version FROM conversations ORDER BY updated_at DESC LIMIT ?", (limit,)
         ).fetchall()
         states: List[ConversationState] = []
-        for (state_json,) in rows:
+        for cid, state_json, version in rows:
             try:
-                data = json.loads(state_json)
-                if "round_store" in data and isinstance(data["round_store"], dict):
-                    data["round_store"] = {int(k): v for k, v in data["round_store"].items()}
-                st = ConversationState.model_validate(data)
-                st.bound_context()
-                states.append(st)
+                states.append(self._from_row(cid, state_json, version))
             except Exception:
                 continue
         return states
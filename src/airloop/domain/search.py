@@ -0,0 +1,204 @@
+"""
+Full-text search over conversation rounds (sqlite FTS5).
+
+One document per round: the user and assistant messages, the non-message event contents
+(handoffs, tool calls with their arguments, tool outputs) and the booking identifiers from
+the context (confirmation, flight, seat, passenger), so staff can search by phrase or by
+number. Documents live in `conversation_search_docs`; `conversation_search` is an
+external-content FTS5 index over them, kept in sync by triggers. PersistentConversationStore
+writes a round's document in the same transaction as the round itself.
+
+The tokenizer is fixed when the index is created: "unicode61" (words, the default) or
+"trigram" (substring matching, also for CJK text; queries need 3+ characters). Changing it
+needs the index dropped and rebuilt with a reindex job.
+"""
+from __future__ import annotations
+
+import json
+import sqlite3
+import time
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+
+
+_CONTEXT_FIELDS = ("confirmation_number", "flight_number", "seat_number", "passenger_name", "account_number")
+
+
+def fts5_available(conn: sqlite3.Connection) -> bool:
+    try:
+        conn.execute("CREATE VIRTUAL TABLE IF NOT EXISTS temp._fts5_probe USING fts5(x)")
+        conn.execute("DROP TABLE temp._fts5_probe")
+        return True
+    except sqlite3.OperationalError:
+        return False
+
+
+def _text(value: Any) -> str:
+    if value is None:
+        return ""
+    if isinstance(value, str):
+        return value
+    return json.dumps(value, ensure_ascii=False, default=str)
+
+
+def round_document(round_store, context: Any) -> str:
+    """The searchable text of one round."""
+    parts: List[str] = []
+    for msg in round_store.messages or []:
+        parts.append(_text(msg.get("content")))
+    for ev in round_store.events or []:
+        if not isinstance(ev, dict) or ev.get("type") == "message":
+            continue
+        parts.append(_text(ev.get("content")))
+        args = (ev.get("metadata") or {}).get("tool_args")
+        if args:
+            parts.append(_text(args))
+    if not any(parts):
+        return ""
+    for name in _CONTEXT_FIELDS:
+        value = context.get(name) if isinstance(context, dict) else getattr(context, name, None)
+        if value:
+            parts.append(str(value))
+    return "\n".join(p for p in parts if p)
+
+
+def to_match(query: str) -> str:
+    """Plain text -> FTS5 query: every term must appear, each quoted so punctuation is literal."""
+    terms = [t.replace('"', '""') for t in query.split()]
+    return " ".join(f'"{t}"' for t in terms)
+
+
+class ConversationSearchIndex:
+    def __init__(self, conn: sqlite3.Connection, tokenizer: str = "unicode61"):
+        self._conn = conn
+        self.tokenizer = tokenizer
+
+    def ensure_schema(self) -> None:
+        self._conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS conversation_search_docs (
+                id INTEGER PRIMARY KEY,
+                conversation_id TEXT NOT NULL,
+                round INTEGER NOT NULL,
+                user_id INTEGER,
+                agent TEXT,
+                ts REAL NOT NULL,
+                content TEXT NOT NULL,
+                UNIQUE (conversation_id, round)
+            )
+            """
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_search_docs_user_ts ON conversation_search_docs (user_id, ts)")
+        self._conn.execute(
+            f"""
+            CREATE VIRTUAL TABLE IF NOT EXISTS conversation_search USING fts5(
+                content, content='conversation_search_docs', content_rowid='id', tokenize='{self.tokenizer}'
+            )
+            """
+        )
+        self._conn.executescript(
+            """
+            CREATE TRIGGER IF NOT EXISTS conversation_search_ai AFTER INSERT ON conversation_search_docs BEGIN
+                INSERT INTO conversation_search (rowid, content) VALUES (new.id, new.content);
+            END;
+            CREATE TRIGGER IF NOT EXISTS conversation_search_ad AFTER DELETE ON conversation_search_docs BEGIN
+                INSERT INTO conversation_search (conversation_search, rowid, content) VALUES ('delete', old.id, old.content);
+            END;
+            CREATE TRIGGER IF NOT EXISTS conversation_search_au AFTER UPDATE ON conversation_search_docs BEGIN
+                INSERT INTO conversation_search (conversation_search, rowid, content) VALUES ('delete', old.id, old.content);
+                INSERT INTO conversation_search (rowid, content) VALUES (new.id, new.content);
+            END;
+            """
+        )
+
+    def index_rounds(
+        self,
+        conversation_id: str,
+        user_id: Optional[int],
+        context: Any,
+        rounds: Iterable[Tuple[int, Any]],
+        updated_at: Optional[float] = None,
+    ) -> None:
+        """
+        Upsert the documents of `rounds` ((index, _RoundStore) pairs); caller commits. A round's
+        time is when it finished, or `updated_at` (the conversation's last save) for rounds
+        stored before that was recorded.
+        """
+        fallback = updated_at or time.time()
+        rows = []
+        for idx, rs in rounds:
+            content = round_document(rs, context)
+            if content:
+                ts = rs.timings.get("finished_at") or fallback
+                rows.append((conversation_id, idx, user_id, rs.agent_name, ts, content))
+        if rows:
+            self._conn.executemany(
+                """
+                INSERT INTO conversation_search_docs (conversation_id, round, user_id, agent, ts, content)
+                VALUES (?, ?, ?, ?, ?, ?)
+                ON CONFLICT (conversation_id, round) DO UPDATE SET
+                    user_id = excluded.user_id, agent = excluded.agent, ts = excluded.ts, content = excluded.content
+                WHERE content != excluded.content OR ts != excluded.ts
+                """,
+                rows,
+            )
+
+    def search(
+        self,
+        query: str,
+        user_id: Optional[int] = None,
+        agent: Optional[str] = None,
+        since: Optional[float] = None,
+        until: Optional[float] = None,
+        limit: int = 20,
+        offset: int = 0,
+        raw: bool = False,
+        mark: Tuple[str, str] = ("<mark>", "</mark>"),
+    ) -> Dict[str, Any]:
+        """
+        Best matches first (bm25). `raw` passes `query` through as FTS5 syntax (AND/OR/NEAR,
+        prefix*); otherwise every whitespace-separated term must match. Raises ValueError on
+        a malformed query.
+        """
+        match = query if raw else to_match(query)
+        where = ["conversation_search MATCH ?"]
+        params: List[Any] = [match]
+        for clause, value in (("d.user_id = ?", user_id), ("d.agent = ?", agent), ("d.ts >= ?", since), ("d.ts < ?", until)):
+            if value is not None:
+                where.append(clause)
+                params.append(value)
+        base = f"FROM conversation_search JOIN conversation_search_docs d ON d.id = conversation_search.rowid WHERE {' AND '.join(where)}"
+        try:
+            total = self._conn.execute(f"SELECT COUNT(*) {base}", params).fetchone()[0]
+            rows = self._conn.execute(
+                f"""
+                SELECT d.conversation_id, d.round, d.user_id, d.agent, d.ts,
+                       snippet(conversation_search, 0, ?, ?, '…', 24), bm25(conversation_search)
+                {base}
+                ORDER BY bm25(conversation_search) LIMIT ? OFFSET ?
+                """,
+                (mark[0], mark[1], *params, limit, offset),
+            ).fetchall()
+        except sqlite3.OperationalError as e:
+            raise ValueError(f"bad search query: {e}") from e
+        return {
+            "query": query,
+            "total": total,
+            "limit": limit,
+            "offset": offset,
+            "results": [
+                {
+                    "conversation_id": cid,
+                    "round": idx,
+                    "user_id": uid,
+                    "agent": ag,
+                    "ts": ts,
+                    "snippet": snippet,
+                    "score": round(-score, 4),
+                }
+                for cid, idx, uid, ag, ts, snippet, score in rows
+            ],
+        }
+
+    def count(self) -> int:
+        return self._conn.execute("SELECT COUNT(*) FROM conversation_search_docs").fetchone()[0]
@@ -0,0 +1,162 @@
+"""
+Per-request instrumentation carried in context variables: the phase timer and the usage
+collector of the current chat round.
+
+Kept free of service and agent-SDK imports so every layer can record into them; agent
+guardrails time their classifier runs and report its usage here without importing the
+service layer. The SDK run hooks that feed them live in airloop.service.timing and
+airloop.service.usage_service.
+"""
+from __future__ import annotations
+
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Dict, Iterable, Iterator, List, Optional
+
+from airloop.settings import UsageConfig
+
+
+class PhaseTimer:
+    """
+    Lightweight per-request phase timer.
+
+    Every phase is recorded as a span (name, start offset, duration). Spans with the same
+    name are summed when rendered, so repeated model/tool calls show up as one entry with
+    a call count. Recording is a perf_counter read plus a list append, cheap enough to
+    leave on for every request.
+    """
+
+    __slots__ = ("started_at", "spans", "tags", "_open")
+
+    def __init__(self) -> None:
+        self.started_at = time.perf_counter()
+        self.spans: List[Dict[str, Any]] = []
+        self.tags: Dict[str, Any] = {}
+        self._open: Dict[Any, List[float]] = {}
+
+    @contextmanager
+    def phase(self, name: str, **attrs: Any) -> Iterator[Dict[str, Any]]:
+        start = time.perf_counter()
+        try:
+            yield attrs
+        finally:
+            self.add(name, start, time.perf_counter(), **attrs)
+
+    def add(self, name: str, start: float, end: float, **attrs: Any) -> None:
+        self.spans.append({
+            "name": name,
+            "start_ms": (start - self.started_at) * 1000,
+            "dur_ms": (end - start) * 1000,
+            **attrs,
+        })
+
+    def begin(self, key: Any) -> None:
+        """Open a span that is closed later by `end` (used from run hooks)."""
+        self._open.setdefault(key, []).append(time.perf_counter())
+
+    def end(self, key: Any, name: str, **attrs: Any) -> None:
+        starts = self._open.get(key)
+        if not starts:
+            return
+        self.add(name, starts.pop(), time.perf_counter(), **attrs)
+
+    def total_ms(self) -> float:
+        return (time.perf_counter() - self.started_at) * 1000
+
+    def summary(self) -> List[Dict[str, Any]]:
+        totals: Dict[str, Dict[str, Any]] = {}
+        for span in self.spans:
+            entry = totals.setdefault(span["name"], {"name": span["name"], "dur_ms": 0.0, "count": 0})
+            entry["dur_ms"] += span["dur_ms"]
+            entry["count"] += 1
+        out = [{**e, "dur_ms": round(e["dur_ms"], 2)} for e in totals.values()]
+        out.append({"name": "total", "dur_ms": round(self.total_ms(), 2), "count": 1})
+        return out
+
+
+_current_timer: ContextVar[Optional[PhaseTimer]] = ContextVar("airloop_phase_timer", default=None)
+
+
+def current_timer() -> Optional[PhaseTimer]:
+    return _current_timer.get()
+
+
+@contextmanager
+def use_timer(timer: PhaseTimer) -> Iterator[PhaseTimer]:
+    token = _current_timer.set(timer)
+    try:
+        yield timer
+    finally:
+        _current_timer.reset(token)
+
+
+def annotate(**tags: Any) -> None:
+    """Attach round-level tags (status, error, ...) to the current request's timer."""
+    timer = _current_timer.get()
+    if timer is not None:
+        timer.tags.update(tags)
+
+
+@contextmanager
+def phase(name: str, **attrs: Any) -> Iterator[Dict[str, Any]]:
+    """Time a block against the current request's timer; no-op when there is none."""
+    timer = _current_timer.get()
+    if timer is None:
+        yield attrs
+        return
+    with timer.phase(name, **attrs) as span_attrs:
+        yield span_attrs
+
+
+_USAGE_FIELDS = ("requests", "input_tokens", "output_tokens", "total_tokens")
+
+
+class UsageCollector:
+    """Collects model usage of one chat round, per agent, from the runs' raw model responses."""
+
+    def __init__(self) -> None:
+        self.by_agent: Dict[str, Dict[str, Any]] = {}
+
+    def add(self, agent_name: str, usage: Any, kind: str = "agent") -> None:
+        if usage is None:
+            return
+        entry = self.by_agent.setdefault(agent_name, {"kind": kind, **{f: 0 for f in _USAGE_FIELDS}})
+        for f in _USAGE_FIELDS:
+            entry[f] += getattr(usage, f, 0) or 0
+
+    def add_responses(self, agent_name: str, raw_responses: Iterable[Any], kind: str = "agent") -> None:
+        for response in raw_responses or []:
+            self.add(agent_name, getattr(response, "usage", None), kind=kind)
+
+    def as_dict(self, config: Optional[UsageConfig] = None) -> Dict[str, Any]:
+        totals = {f: sum(a[f] for a in self.by_agent.values()) for f in _USAGE_FIELDS}
+        by_agent = {name: dict(entry) for name, entry in self.by_agent.items()}
+        if config is not None:
+            for entry in by_agent.values():
+                entry["cost"] = config.cost(entry["input_tokens"], entry["output_tokens"])
+            totals["cost"] = sum(e["cost"] for e in by_agent.values())
+        return {**totals, "by_agent": by_agent}
+
+
+_current_usage: ContextVar[Optional[UsageCollector]] = ContextVar("airloop_usage", default=None)
+
+
+def current_usage() -> Optional[UsageCollector]:
+    return _current_usage.get()
+
+
+@contextmanager
+def use_usage(collector: UsageCollector) -> Iterator[UsageCollector]:
+    token = _current_usage.set(collector)
+    try:
+        yield collector
+    finally:
+        _current_usage.reset(token)
+
+
+def record_usage(agent_name: str, raw_responses: Iterable[Any], kind: str = "agent") -> None:
+    """Add the usage of a run's raw responses to the current round; no-op outside a round."""
+    collector = _current_usage.get()
+    if collector is not None:
+        collector.add_responses(agent_name, raw_responses, kind=kind)
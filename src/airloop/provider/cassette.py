@@ -0,0 +1,224 @@
+from __future__ import annotations
+
+import hashlib
+import json
+import os
+import threading
+from collections import defaultdict, deque
+from typing import Any, AsyncIterator, Deque, Dict, List, Optional
+
+from pydantic import BaseModel, TypeAdapter
+from agents import Model, ModelResponse, Usage
+from openai.types.responses import ResponseOutputItem
+
+from airloop.settings import CassetteConfig
+
+
+CASSETTE_MODES = ("off", "record", "replay", "auto")
+
+_output_items = TypeAdapter(List[ResponseOutputItem])
+
+
+class CassetteMissError(LookupError):
+    """Raised in replay mode when no recorded response matches a model request."""
+
+
+def _jsonable(value: Any) -> Any:
+    if isinstance(value, BaseModel):
+        return value.model_dump(mode="json", exclude_none=True)
+    if isinstance(value, dict):
+        return {k: _jsonable(v) for k, v in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [_jsonable(v) for v in value]
+    if isinstance(value, (str, int, float, bool)) or value is None:
+        return value
+    return str(value)
+
+
+def _digest(payload: Any) -> str:
+    text = json.dumps(payload, sort_keys=True, ensure_ascii=False, default=str)
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+def _route(model_name: str, tools, output_schema, handoffs) -> Dict[str, Any]:
+    # what the model is allowed to answer with: identifies "the same agent" across runs
+    return {
+        "model": model_name,
+        "tools": sorted(getattr(t, "name", "") for t in tools or []),
+        "handoffs": sorted(getattr(h, "tool_name", "") for h in handoffs or []),
+        "output": output_schema.name() if output_schema is not None else None,
+    }
+
+
+def _dump_response(response: ModelResponse) -> Dict[str, Any]:
+    usage = response.usage
+    return {
+        "output": [item.model_dump(mode="json", exclude_none=True) for item in response.output],
+        "usage": {
+            "requests": usage.requests,
+            "input_tokens": usage.input_tokens,
+            "output_tokens": usage.output_tokens,
+            "total_tokens": usage.total_tokens,
+        },
+        "response_id": response.response_id,
+    }
+
+
+def _load_response(data: Dict[str, Any]) -> ModelResponse:
+    return ModelResponse(
+        output=_output_items.validate_python(data["output"]),
+        usage=Usage(**data.get("usage", {})),
+        response_id=data.get("response_id"),
+    )
+
+
+class Cassette:
+    """
+    JSONL file of recorded model responses, keyed by a hash of the full request.
+
+    Each line holds the request key, its route (model + tools + handoffs + output schema) and
+    the serialized ModelResponse. Replays look up the exact request first; without `strict`,
+    a miss falls back to the next unused response recorded for the same route, which keeps
+    replays working when prompts embed run-specific values (random confirmation numbers,
+    generated ids).
+    """
+
+    _open: Dict[str, "Cassette"] = {}
+    _open_lock = threading.Lock()
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+        self._exact: Dict[str, Dict[str, Any]] = {}
+        self._by_route: Dict[str, Deque[Dict[str, Any]]] = defaultdict(deque)
+        self.stats = {"hits": 0, "route_hits": 0, "misses": 0, "recorded": 0}
+        self._load()
+
+    @classmethod
+    def open(cls, path: str) -> "Cassette":
+        """One shared instance per file, so concurrent models append to it safely."""
+        path = os.path.abspath(path)
+        with cls._open_lock:
+            if path not in cls._open:
+                cls._open[path] = cls(path)
+            return cls._open[path]
+
+    def _load(self) -> None:
+        if not os.path.exists(self.path):
+            return
+        with open(self.path, "r", encoding="utf-8") as f:
+            for line in f:
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    continue
+                self._exact[entry["key"]] = entry["response"]
+                self._by_route[entry["route"]].append(entry["response"])
+
+    def __len__(self) -> int:
+        return len(self._exact)
+
+    def lookup(self, key: str, route: str, strict: bool = False) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            if key in self._exact:
+                self.stats["hits"] += 1
+                return self._exact[key]
+            queue = self._by_route.get(route)
+            if not strict and queue:
+                self.stats["route_hits"] += 1
+                response = queue.popleft()
+                queue.append(response)
+                return response
+            self.stats["misses"] += 1
+            return None
+
+    def record(self, key: str, route: str, response: Dict[str, Any]) -> None:
+        entry = {"key": key, "route": route, "response": response}
+        with self._lock:
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+            with open(self.path, "a", encoding="utf-8") as f:
+                f.write(json.dumps(entry, ensure_ascii=False) + "\n")
+            self._exact[key] = response
+            self._by_route[route].append(response)
+            self.stats["recorded"] += 1
+
+
+class CassetteModel(Model):
+    """
+    Record/replay wrapper around another Model.
+
+      - record: call the wrapped model and store every response in the cassette.
+      - replay: serve responses from the cassette only; a miss raises CassetteMissError.
+      - auto:   replay when recorded, otherwise call the wrapped model and record.
+    """
+
+    def __init__(self, model: Model, cassette: Cassette, mode: str = "replay", strict: bool = False):
+        if mode not in CASSETTE_MODES or mode == "off":
+            raise ValueError(f"Unsupported cassette mode {mode}")
+        self.model = model
+        self.cassette = cassette
+        self.mode = mode
+        self.strict = strict
+
+    @property
+    def model_name(self) -> str:
+        return str(getattr(self.model, "model", None) or type(self.model).__name__)
+
+    def _keys(self, system_instructions, input, model_settings, tools, output_schema, handoffs) -> tuple:
+        route = _route(self.model_name, tools, output_schema, handoffs)
+        request = {
+            **route,
+            "system_instructions": system_instructions,
+            "input": _jsonable(input),
+            "model_settings": _jsonable(model_settings.to_json_dict()) if model_settings else None,
+            "tool_schemas": [_jsonable(getattr(t, "params_json_schema", None)) for t in tools or []],
+            "output_schema": output_schema.json_schema() if output_schema is not None and not output_schema.is_plain_text() else None,
+        }
+        return _digest(request), _digest(route)
+
+    async def get_response(
+        self,
+        system_instructions,
+        input,
+        model_settings,
+        tools,
+        output_schema,
+        handoffs,
+        tracing,
+        *,
+        previous_response_id=None,
+        conversation_id=None,
+        prompt=None,
+    ) -> ModelResponse:
+        key, route = self._keys(system_instructions, input, model_settings, tools, output_schema, handoffs)
+        if self.mode in ("replay", "auto"):
+            recorded = self.cassette.lookup(key, route, strict=self.strict or self.mode == "auto")
+            if recorded is not None:
+                return _load_response(recorded)
+            if self.mode == "replay":
+                raise CassetteMissError(f"No recorded response for request {key[:12]} in {self.cassette.path}")
+        response = await self.model.get_response(
+            system_instructions,
+            input,
+            model_settings,
+            tools,
+            output_schema,
+            handoffs,
+            tracing,
+            previous_response_id=previous_response_id,
+            conversation_id=conversation_id,
+            prompt=prompt,
+        )
+        self.cassette.record(key, route, _dump_response(response))
+        return response
+
+    def stream_response(self, *args, **kwargs) -> AsyncIterator[Any]:
+        # streaming is not recorded; the app runs with output_streaming disabled
+        return self.model.stream_response(*args, **kwargs)
+
+
+def with_cassette(model: Model, config: Optional[CassetteConfig]) -> Model:
+    """Wrap `model` according to the cassette config; returns it unchanged when mode is off."""
+    if config is None or config.mode == "off":
+        return model
+    return CassetteModel(model, Cassette.open(config.path), mode=config.mode, strict=config.strict)
@@ -0,0 +1,260 @@
+from __future__ import annotations
+
+import asyncio
+import itertools
+import json
+import random
+import re
+import time
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+import yaml
+from agents import Model, ModelProvider, ModelResponse, Usage
+from openai.types.responses import (
+    Response,
+    ResponseCompletedEvent,
+    ResponseFunctionToolCall,
+    ResponseOutputMessage,
+    ResponseOutputText,
+    ResponseUsage,
+)
+from openai.types.responses.response_usage import InputTokensDetails, OutputTokensDetails
+
+
+DEFAULT_MOCK_SCRIPT = "config/mock_llm.yaml"
+
+
+class LatencyModel:
+    """
+    Sampled response latency in milliseconds.
+
+    Distributions: fixed (ms), uniform (min_ms, max_ms), normal (mean_ms, stddev_ms) and
+    lognormal (median_ms, sigma). Negative samples are clamped to zero.
+    """
+
+    def __init__(self, spec: Optional[Dict[str, Any]] = None):
+        self.spec = dict(spec or {"distribution": "fixed", "ms": 0})
+        if self.spec.get("distribution", "fixed") not in ("fixed", "uniform", "normal", "lognormal"):
+            raise ValueError(f"Unsupported latency distribution {self.spec.get('distribution')}")
+
+    def sample(self, rng: random.Random) -> float:
+        spec = self.spec
+        kind = spec.get("distribution", "fixed")
+        if kind == "uniform":
+            ms = rng.uniform(float(spec.get("min_ms", 0)), float(spec.get("max_ms", 0)))
+        elif kind == "normal":
+            ms = rng.gauss(float(spec.get("mean_ms", 0)), float(spec.get("stddev_ms", 0)))
+        elif kind == "lognormal":
+            median = max(float(spec.get("median_ms", 1)), 1e-3)
+            ms = rng.lognormvariate(0.0, float(spec.get("sigma", 0.5))) * median
+        else:
+            ms = float(spec.get("ms", 0))
+        return max(0.0, ms)
+
+
+def _text(content: Any) -> str:
+    if isinstance(content, str):
+        return content
+    if isinstance(content, list):
+        return " ".join(str(part.get("text", "")) for part in content if isinstance(part, dict))
+    return str(content or "")
+
+
+class _Turn:
+    """What a rule can look at: the latest user text and the calls made since it."""
+
+    def __init__(self, input: Any):
+        items = [{"role": "user", "content": input}] if isinstance(input, str) else list(input or [])
+        items = [i if isinstance(i, dict) else getattr(i, "model_dump", lambda: {})() for i in items]
+        last_user = max((n for n, item in enumerate(items) if item.get("role") == "user"), default=-1)
+        self.user_text = _text(items[last_user].get("content")) if last_user >= 0 else ""
+        self.calls = [item.get("name", "") for item in items[last_user + 1:] if item.get("type") == "function_call"]
+
+
+class _Rule:
+    def __init__(self, spec: Dict[str, Any]):
+        self.spec = spec
+        when = spec.get("when") or {}
+        contains = when.get("input_contains") or []
+        self.contains = [c.lower() for c in ([contains] if isinstance(contains, str) else contains)]
+        self.output = spec.get("output")
+        self.has_tool = when.get("has_tool")
+        self.has_handoff = when.get("has_handoff")
+        self.after_tool = when.get("after_tool")
+        self.first_step = when.get("first_step")
+        self.latency = LatencyModel(spec["latency"]) if spec.get("latency") else None
+
+    def matches(self, turn: _Turn, output_name: Optional[str], tools: List[str], handoffs: List[str]) -> bool:
+        if self.output is not None and self.output != (output_name or "text"):
+            return False
+        if self.output is None and output_name is not None:
+            return False
+        if self.contains and not any(c in turn.user_text.lower() for c in self.contains):
+            return False
+        if self.has_tool and self.has_tool not in tools:
+            return False
+        if self.has_handoff and not any(self.has_handoff in h for h in handoffs):
+            return False
+        if self.after_tool and self.after_tool not in turn.calls:
+            return False
+        if self.first_step is not None and bool(self.first_step) == bool(turn.calls):
+            return False
+        # each tool / handoff fires at most once per user turn, so runs always terminate
+        if "tool" in self.spec and self.spec["tool"] in turn.calls:
+            return False
+        if "handoff" in self.spec:
+            target = next((h for h in handoffs if self.spec["handoff"] in h), None)
+            if target is None or target in turn.calls:
+                return False
+        return True
+
+
+class MockModel(Model):
+    """
+    Deterministic local stand-in for the chat model, driven by a YAML script.
+
+    Rules are tried in order; the first one whose conditions match the request produces the
+    response. Conditions: `output` (structured output schema name, "text" for plain replies),
+    `when.input_contains` (any substring of the latest user message), `when.has_tool` and
+    `when.has_handoff` (the agent offers that tool / a handoff containing that name),
+    `when.after_tool` (that tool already ran this turn) and `when.first_step` (whether nothing
+    has been called yet this turn). Actions:
+    `reply` (text, may use {last_user} and {number}), `json` (structured output), `batch_items`
+    (one json item per "### Item" of a batched judge input), `tool` + `arguments` (a function
+    call) and `handoff` (calls the first handoff whose tool name contains the value). Latency is
+    sampled from the script's `latency` distribution, or the rule's own, with a seeded RNG.
+    """
+
+    def __init__(self, script: Dict[str, Any], model_name: str = "mock"):
+        self.model = model_name
+        self.rules = [_Rule(spec) for spec in script.get("rules") or []]
+        self.latency = LatencyModel(script.get("latency"))
+        self._rng = random.Random(script.get("seed", 0))
+        self._call_ids = itertools.count(1)
+
+    @classmethod
+    def from_file(cls, path: Optional[str] = None, model_name: str = "mock") -> "MockModel":
+        script_path = Path(path or DEFAULT_MOCK_SCRIPT)
+        with script_path.open("r", encoding="utf-8") as f:
+            return cls(yaml.safe_load(f) or {}, model_name=model_name)
+
+    async def get_response(
+        self,
+        system_instructions,
+        input,
+        model_settings,
+        tools,
+        output_schema,
+        handoffs,
+        tracing,
+        *,
+        previous_response_id=None,
+        conversation_id=None,
+        prompt=None,
+    ) -> ModelResponse:
+        turn = _Turn(input)
+        output_name = output_schema.name() if output_schema is not None and not output_schema.is_plain_text() else None
+        tool_names = [getattr(t, "name", "") for t in tools or []]
+        handoff_names = [getattr(h, "tool_name", "") for h in handoffs or []]
+        rule = next((r for r in self.rules if r.matches(turn, output_name, tool_names, handoff_names)), None)
+
+        latency = (rule.latency if rule and rule.latency else self.latency).sample(self._rng)
+        if latency:
+            await asyncio.sleep(latency / 1000)
+
+        if rule is None:
+            if output_name is not None:
+                raise ValueError(f"Mock script has no rule for structured output {output_name}")
+            output = [self._message("OK")]
+        else:
+            output = [self._act(rule.spec, turn, tool_names, handoff_names)]
+
+        input_tokens = (len(system_instructions or "") + len(json.dumps(input, default=str))) // 4
+        output_tokens = sum(len(json.dumps(item.model_dump(), default=str)) for item in output) // 4
+        return ModelResponse(
+            output=output,
+            usage=Usage(
+                requests=1,
+                input_tokens=input_tokens,
+                output_tokens=output_tokens,
+                total_tokens=input_tokens + output_tokens,
+            ),
+            response_id=None,
+        )
+
+    async def stream_response(self, *args, **kwargs):
+        # the scripted response in one piece: a streaming Runner only needs response.completed
+        result = await self.get_response(*args, **kwargs)
+        usage = result.usage
+        response = Response(
+            id=f"mock_resp_{next(self._call_ids)}",
+            created_at=time.time(),
+            model=self.model,
+            object="response",
+            output=result.output,
+            tool_choice="auto",
+            tools=[],
+            parallel_tool_calls=False,
+            status="completed",
+            usage=ResponseUsage(
+                input_tokens=usage.input_tokens,
+                output_tokens=usage.output_tokens,
+                total_tokens=usage.total_tokens,
+                input_tokens_details=InputTokensDetails(cached_tokens=0, cache_write_tokens=0),
+                output_tokens_details=OutputTokensDetails(reasoning_tokens=0),
+            ),
+        )
+        yield ResponseCompletedEvent(type="response.completed", response=response, sequence_number=0)
+
+    def _act(self, spec: Dict[str, Any], turn: _Turn, tools: List[str], handoffs: List[str]):
+        if "handoff" in spec:
+            return self._call(next(h for h in handoffs if spec["handoff"] in h), {})
+        if "tool" in spec:
+            arguments = {k: self._fill(v, turn) for k, v in (spec.get("arguments") or {}).items()}
+            return self._call(spec["tool"], arguments)
+        if "batch_items" in spec:
+            count = turn.user_text.count("### Item")
+            items = [{"id": i, **spec["batch_items"]} for i in range(count)]
+            return self._message(json.dumps({"items": items}))
+        if "json" in spec:
+            return self._message(json.dumps(spec["json"]))
+        return self._message(self._fill(spec.get("reply", "OK"), turn))
+
+    def _fill(self, value: Any, turn: _Turn) -> Any:
+        if not isinstance(value, str):
+            return value
+        number = re.search(r"\d+", turn.user_text)
+        return value.replace("{last_user}", turn.user_text).replace("{number}", number.group(0) if number else "")
+
+    def _message(self, text: str) -> ResponseOutputMessage:
+        return ResponseOutputMessage(
+            id=f"msg_mock_{next(self._call_ids)}",
+            content=[ResponseOutputText(annotations=[], text=text, type="output_text")],
+            role="assistant",
+            status="completed",
+            type="message",
+        )
+
+    def _call(self, name: str, arguments: Dict[str, Any]) -> ResponseFunctionToolCall:
+        call_id = f"call_mock_{next(self._call_ids)}"
+        return ResponseFunctionToolCall(
+            arguments=json.dumps(arguments),
+            call_id=call_id,
+            name=name,
+            type="function_call",
+            id=call_id,
+        )
+
+
+class MockModelProvider(ModelProvider):
+    """Serves one shared MockModel (and so one seeded RNG) for every model name."""
+
+    def __init__(self, script_path: Optional[str] = None):
+        self.script_path = script_path
+        self._model: Optional[MockModel] = None
+
+    def get_model(self, model_name: str | None) -> Model:
+        if self._model is None:
+            self._model = MockModel.from_file(self.script_path, model_name=model_name or "mock")
+        return self._model
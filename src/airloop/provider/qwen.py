@@ -9,10 +9,18 @@ import string
 from openai import AsyncOpenAI
 from agents import OpenAIChatCompletionsModel, Model, ModelProvider,RunConfig, ModelSettings,set_tracing_disabled
 
+from airloop.provider.cassette import with_cassette
+from airloop.settings import CassetteConfig
+
 class QwenModelProvider(ModelProvider):
-        
-    def get_model(self, model_name: str | None, client: AsyncOpenAI) -> Model:
-        return OpenAIChatCompletionsModel(model=model_name , client=client)
+
+    def __init__(self, client: AsyncOpenAI | None = None, cassette: CassetteConfig | None = None):
+        self.client = client
+        self.cassette = cassette
+
+    def get_model(self, model_name: str | None) -> Model:
+        model = OpenAIChatCompletionsModel(model=model_name, openai_client=self.client or AsyncOpenAI())
+        return with_cassette(model, self.cassette)
     
 def build_qwen3_run_config(
     provider: QwenModelProvider,
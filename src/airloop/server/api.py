@@ -1,22 +1,23 @@
-from fastapi import FastAPI, HTTPException
+from fastapi import FastAPI, HTTPException, Response
+from fastapi.responses import PlainTextResponse, StreamingResponse
 from fastapi.middleware.cors import CORSMiddleware
 from pydantic import BaseModel
-from typing import Optional
+from typing import List, Optional
+from contextlib import asynccontextmanager
+import asyncio
+import json
+import os
 import time
 
-from airloop.agents.manager import AgentManager
-from airloop.domain.schema import InMemoryConversationStore, PersistentConversationStore
-from airloop.service.chat_service import ChatService
-from airloop.service.offline_eval_service import OfflineEvalService
-from airloop.service.conversation_eval_service import ConversationEvalService, ConversationEvalRequest
-from airloop.service.feedback_service import FeedbackService
-from airloop.service.auth_service import AuthService
-from airloop.service.data_service import DataService
-from airloop.settings import load_app_config
-from airloop.service.observility_service import LangfuseObservabilityService, NoopObservabilityService
-from airloop.domain.schema import FeedbackRequest
+from airloop.server.services import AppServices
+from airloop.service.job_service import JOB_STATUSES
+from airloop.service.conversation_eval_service import ConversationEvalRequest
+from airloop.settings import AppConfig
+from airloop.service.sqlite_observability_service import SqliteObservabilityService
+from airloop.domain.schema import ConversationConflictError, FeedbackRequest
 from fastapi import Query
 from airloop.service.chat_service import ROLES_TO_SHOW
+from airloop.service.timing import format_server_timing
 
 class ChatRequest(BaseModel):
     conversation_id: Optional[str] = None
@@ -28,8 +29,20 @@ class LoginRequest(BaseModel):
     username: str
     password: str
 
-def create_app() -> FastAPI:
-    app = FastAPI()
+def create_app(config: Optional[AppConfig] = None, services: Optional[AppServices] = None) -> FastAPI:
+    # cheap: services are built by the lifespan hook (or on first use), not here
+    services = services or AppServices(config)
+
+    @asynccontextmanager
+    async def lifespan(app: FastAPI):
+        await services.start()
+        try:
+            yield
+        finally:
+            await services.shutdown()
+
+    app = FastAPI(lifespan=lifespan)
+    app.state.services = services
 
     app.add_middleware(
         CORSMiddleware,
@@ -37,55 +50,68 @@ def create_app() -> FastAPI:
         allow_credentials=True,
         allow_methods=["*"],
         allow_headers=["*"],
+        expose_headers=["Server-Timing"],
     )
 
-    cfg = load_app_config()
-    auth_svc = AuthService(cfg.store.path)
-    auth_svc.init_db()
-    data_svc = DataService(cfg.store.path)
-    data_svc.init_db()
-    agent_mgr = AgentManager(cfg.llm, data_svc)
-    if cfg.store.kind == "sqlite":
-        store = PersistentConversationStore(cfg.store.path)
-    else:
-        store = InMemoryConversationStore()
-    obs_service = LangfuseObservabilityService(cfg.langfuse) if cfg.langfuse else NoopObservabilityService()
-    chat_svc = ChatService(agent_mgr, store, obs_service)
-    feedback_svc = FeedbackService(obs_service)
-    offline_eval_svc = OfflineEvalService(chat_svc, agent_mgr, obs_service, cfg)
-    convo_eval_svc = ConversationEvalService(store, agent_mgr, obs_service, cfg)
+    @app.get("/healthz")
+    async def healthz():
+        # liveness: the worker's event loop is serving requests
+        return {"status": "ok", "worker": services.worker_id, "pid": os.getpid()}
+
+    @app.get("/readyz")
+    async def readyz(response: Response):
+        # readiness: startup finished and the worker is not draining for shutdown
+        if not services.ready:
+            response.status_code = 503
+            return {"status": "unavailable", "worker": services.worker_id, "pid": os.getpid()}
+        return {
+            "status": "ready",
+            "worker": services.worker_id,
+            "pid": os.getpid(),
+            "uptime_s": round(time.time() - services.started_at, 1),
+        }
 
     @app.post("/api/chat")
-    async def chat(req: ChatRequest):
+    async def chat(req: ChatRequest, response: Response, timings: bool = Query(default=False)):
         if req.user_id is None:
             raise HTTPException(status_code=400, detail="user_id required")
-        user = auth_svc.get_user_by_id(req.user_id)
+        user = services.auth.get_user_by_id(req.user_id)
         if not user:
             raise HTTPException(status_code=401, detail="Invalid user")
         order_info = None
         if req.order_id is not None:
-            order_info = data_svc.get_order(req.order_id, req.user_id)
+            order_info = services.data.get_order(req.order_id, req.user_id)
             if not order_info:
                 raise HTTPException(status_code=404, detail="Order not found")
             if order_info.get("status") == "canceled":
                 raise HTTPException(status_code=410, detail="Order is canceled")
         if req.conversation_id is None and req.order_id is None:
             raise HTTPException(status_code=400, detail="order_id required for new session")
-        return await chat_svc.chat(
-            req.conversation_id,
-            req.message,
-            req.user_id,
-            user_name=user.get("username"),
-            account_number=user.get("account_number"),
-            order_id=order_info["id"] if order_info else None,
-            confirmation_number=order_info["confirmation_number"] if order_info else None,
-            flight_number=order_info["flight_number"] if order_info else None,
-            seat_number=str(order_info["seat_number"]) if order_info else None,
-        )
+        try:
+            result = await services.chat.chat(
+                req.conversation_id,
+                req.message,
+                req.user_id,
+                user_name=user.get("username"),
+                account_number=user.get("account_number"),
+                order_id=order_info["id"] if order_info else None,
+                confirmation_number=order_info["confirmation_number"] if order_info else None,
+                flight_number=order_info["flight_number"] if order_info else None,
+                seat_number=str(order_info["seat_number"]) if order_info else None,
+            )
+        except ConversationConflictError as exc:
+            # another worker saved this conversation mid-round; the client may retry
+            raise HTTPException(status_code=409, detail=str(exc))
+        phase_timings = result.pop("timings", None)
+        if phase_timings:
+            response.headers["Server-Timing"] = format_server_timing(phase_timings)
+            if timings:
+                result["timings"] = phase_timings
+        return result
 
     @app.post("/api/login")
     async def login(req: LoginRequest):
-        user = auth_svc.login(req.username, req.password)
+        user = services.auth.login(req.username, req.password)
         if not user:
             raise HTTPException(status_code=401, detail="Invalid credentials")
         return user
@@ -94,58 +120,269 @@ def create_app() -> FastAPI:
     async def list_orders(user_id: Optional[int] = None):
         if user_id is None:
             raise HTTPException(status_code=400, detail="user_id required")
-        if not auth_svc.get_user_by_id(user_id):
+        if not services.auth.get_user_by_id(user_id):
             raise HTTPException(status_code=401, detail="Invalid user")
-        return data_svc.list_orders(user_id)
+        return services.data.list_orders(user_id)
 
     @app.post("/api/orders")
     async def create_order(user_id: Optional[int] = None):
         if user_id is None:
             raise HTTPException(status_code=400, detail="user_id required")
-        if not auth_svc.get_user_by_id(user_id):
+        if not services.auth.get_user_by_id(user_id):
             raise HTTPException(status_code=401, detail="Invalid user")
         try:
-            return data_svc.create_order(user_id)
+            return services.data.create_order(user_id)
         except ValueError as exc:
             raise HTTPException(status_code=400, detail=str(exc))
 
     @app.post("/api/feedback")
     async def feedback(req: FeedbackRequest):
-        return feedback_svc.submit(req)
+        return services.feedback.submit(req)
 
     @app.post("/api/offline_eval")
-    async def offline_eval(run_all: bool = Query(default=True)):
-        return await offline_eval_svc.run_cases()
+    async def offline_eval(
+        run_all: bool = Query(default=True),
+        dataset: Optional[str] = None,
+        resume: bool = False,
+        stream: bool = Query(default=False),
+    ):
+        # run_all: stream the configured (or given) JSONL dataset; otherwise only the built-in smoke cases.
+        # resume is opt-in here: a fresh request should evaluate, not skip everything the last run did
+        dataset_path = None
+        if run_all:
+            try:
+                dataset_path = services.offline_eval.resolve_dataset(dataset)
+            except FileNotFoundError as exc:
+                raise HTTPException(status_code=404, detail=str(exc))
+        if not stream:
+            if dataset_path:
+                return await services.offline_eval.run_dataset(dataset_path, resume=resume)
+            return await services.offline_eval.run_suite()
+
+        async def _progress():
+            started = time.perf_counter()
+            done = 0
+            sequential = 0.0
+            if dataset_path:
+                queue: asyncio.Queue = asyncio.Queue()
+                runner = asyncio.create_task(
+                    services.offline_eval.run_dataset(dataset_path, resume=resume, on_progress=lambda n, r: queue.put_nowait(r))
+                )
+                runner.add_done_callback(lambda _: queue.put_nowait(None))
+                while (result := await queue.get()) is not None:
+                    done += 1
+                    yield json.dumps({"type": "result", "done": done, "result": result}, ensure_ascii=False, default=str) + "\n"
+                yield json.dumps({"type": "summary", **runner.result()}) + "\n"
+                return
+            async for result in services.offline_eval.iter_results():
+                done += 1
+                sequential += result["duration_s"]
+                yield json.dumps({"type": "result", "done": done, "result": result}, ensure_ascii=False) + "\n"
+            wall = time.perf_counter() - started
+            summary = {"type": "summary", "total": done, "wall_time_s": round(wall, 3), "sequential_time_s": round(sequential, 3)}
+            yield json.dumps(summary) + "\n"
+
+        return StreamingResponse(_progress(), media_type="application/x-ndjson")
 
     @app.post("/api/conversation_eval")
     async def conversation_eval(req: ConversationEvalRequest):
-        return await convo_eval_svc.evaluate_conversations(req)
+        return await services.convo_eval.evaluate_conversations(req)
+
+    @app.post("/api/conversation_eval/compare_batching")
+    async def conversation_eval_compare_batching(req: ConversationEvalRequest):
+        return await services.convo_eval.compare_batching(req)
+
+    @app.post("/api/jobs/offline_eval")
+    async def submit_offline_eval(run_all: bool = Query(default=True), dataset: Optional[str] = None, resume: bool = True):
+        if run_all:
+            try:
+                services.offline_eval.resolve_dataset(dataset)
+            except FileNotFoundError as exc:
+                raise HTTPException(status_code=404, detail=str(exc))
+        return services.jobs.submit("offline_eval", {"run_all": run_all, "dataset": dataset, "resume": resume})
+
+    @app.post("/api/jobs/conversation_eval")
+    async def submit_conversation_eval(req: ConversationEvalRequest):
+        return services.jobs.submit("conversation_eval", req.model_dump())
+
+    @app.post("/api/jobs/retention")
+    async def submit_retention(convert_vacuum: bool = False):
+        if services.retention is None:
+            raise HTTPException(status_code=400, detail="retention needs store.kind=sqlite")
+        return services.jobs.submit("retention", {"convert_vacuum": convert_vacuum})
+
+    @app.get("/api/retention")
+    async def retention_stats():
+        if services.retention is None:
+            return {"enabled": False}
+        return services.retention.stats()
+
+    def _search_index():
+        index = getattr(services.store, "search", None)
+        if index is None:
+            raise HTTPException(status_code=404, detail="Search needs store.kind=sqlite and store.search_tokenizer")
+        return index
+
+    @app.get("/api/search")
+    async def search_conversations(
+        q: str = Query(min_length=1),
+        user_id: Optional[int] = None,
+        agent: Optional[str] = None,
+        since: Optional[float] = None,
+        until: Optional[float] = None,
+        limit: int = Query(default=20, ge=1, le=100),
+        offset: int = Query(default=0, ge=0),
+        raw: bool = False,
+    ):
+        try:
+            return _search_index().search(
+                q, user_id=user_id, agent=agent, since=since, until=until, limit=limit, offset=offset, raw=raw
+            )
+        except ValueError as exc:
+            raise HTTPException(status_code=400, detail=str(exc))
+
+    @app.post("/api/jobs/search_reindex")
+    async def submit_search_reindex(updated_since: Optional[float] = None):
+        _search_index()
+        return services.jobs.submit("search_reindex", {"updated_since": updated_since})
+
+    @app.get("/api/jobs")
+    async def list_jobs(status: Optional[str] = None, limit: int = Query(default=50, le=500)):
+        if status and status not in JOB_STATUSES:
+            raise HTTPException(status_code=400, detail=f"status must be one of {', '.join(JOB_STATUSES)}")
+        return services.jobs.list(status, limit)
+
+    @app.get("/api/jobs/{job_id}")
+    async def get_job(job_id: str):
+        job = services.jobs.get(job_id)
+        if job is None:
+            raise HTTPException(status_code=404, detail="Job not found")
+        return job
+
+    @app.get("/api/jobs/{job_id}/result")
+    async def get_job_result(job_id: str):
+        job = services.jobs.get(job_id)
+        if job is None:
+            raise HTTPException(status_code=404, detail="Job not found")
+        if job["status"] != "succeeded":
+            raise HTTPException(status_code=409, detail=f"Job is {job['status']}")
+        return services.jobs.result(job_id)
+
+    @app.post("/api/jobs/{job_id}/cancel")
+    async def cancel_job(job_id: str):
+        job = services.jobs.cancel(job_id)
+        if job is None:
+            raise HTTPException(status_code=404, detail="Job not found")
+        return job
+
+    @app.get("/api/online_eval")
+    async def online_eval_stats():
+        if services.online_eval is None:
+            return {"enabled": False}
+        return services.online_eval.snapshot()
+
+    @app.get("/api/judge_cache")
+    async def judge_cache_stats():
+        judge = services.convo_eval.judge
+        if judge.cache is None:
+            raise HTTPException(status_code=404, detail="Judge cache is not enabled")
+        return {
+            **judge.cache.stats(),
+            "conversation_eval": judge.stats,
+            # not worth building the offline runner just to report that it has judged nothing
+            "offline_eval": services.offline_eval.judge.stats if services.is_built("offline_eval") else None,
+        }
+
+    def _trace_store() -> SqliteObservabilityService:
+        if not isinstance(services.obs, SqliteObservabilityService):
+            raise HTTPException(status_code=404, detail="Local trace store is not enabled")
+        return services.obs
+
+    @app.get("/api/traces/agent_latency")
+    async def trace_agent_latency(since_ms: float = 0.0):
+        return _trace_store().agent_latency(since_ms)
+
+    @app.get("/api/traces/guardrails")
+    async def trace_guardrails(since_ms: float = 0.0):
+        return _trace_store().guardrail_trip_rate(since_ms)
+
+    @app.get("/api/traces/scores")
+    async def trace_scores(since_ms: float = 0.0):
+        return _trace_store().score_aggregates(since_ms)
+
+    @app.get("/api/flight_recorder/recent")
+    async def flight_recorder_recent(limit: int = 20, slow_only: bool = False):
+        return services.recorder.recent(limit=limit, slow_only=slow_only)
+
+    @app.get("/api/flight_recorder/slow")
+    async def flight_recorder_slow(limit: int = 20):
+        return services.recorder.slow_rounds(limit=limit)
+
+    @app.get("/api/usage")
+    async def usage_summary(group_by: str = "agent", since: float = 0.0, limit: int = 100):
+        try:
+            return services.usage.summary(group_by=group_by, since=since, limit=limit)
+        except ValueError as exc:
+            raise HTTPException(status_code=400, detail=str(exc))
+
+    @app.get("/metrics", response_class=PlainTextResponse)
+    async def metrics():
+        return services.usage.prometheus_metrics()
 
     @app.get("/api/sessions")
     async def list_sessions(limit: int = 20, user_id: Optional[int] = None):
         if user_id is None:
             raise HTTPException(status_code=400, detail="user_id required")
-        states = store.list(limit=limit)
+        states = services.store.list(limit=limit)
         return [
             {
                 "conversation_id": st.state_id,
-                "title": _ensure_session_title(st, store),
+                "title": _ensure_session_title(st, services.store),
                 "current_agent": st.current_agent_name,
                 "rounds": st.round_counter,
                 "context": st.context,
                 "messages": st.messages,
                 "events": _build_events(st),
-                "agents": agent_mgr.list_agents(filter=ROLES_TO_SHOW),
+                "agents": services.agent_mgr.list_agents(filter=ROLES_TO_SHOW),
                 "guardrails": _build_guardrails(st),
             }
             for st in states
             if st.user_id == user_id
         ]
 
+    @app.get("/api/export")
+    async def export_rounds(
+        user_id: Optional[int] = None,
+        agent: Optional[str] = None,
+        since: Optional[float] = None,
+        until: Optional[float] = None,
+        conversation_id: Optional[List[str]] = Query(default=None),
+    ):
+        lines = services.export.iter_ndjson(
+            user_id=user_id, agent=agent, since=since, until=until, conversation_ids=conversation_id, heartbeat=True
+        )
+
+        async def _stream():
+            # the store reads are synchronous; let other requests in after every conversation
+            # scanned (a selective filter may skip thousands between two matching lines) and
+            # every 100 lines within a long one
+            n = 0
+            for line in lines:
+                if not line:
+                    await asyncio.sleep(0)
+                    continue
+                yield line
+                n += 1
+                if n % 100 == 0:
+                    await asyncio.sleep(0)
+
+        return StreamingResponse(_stream(), media_type="application/x-ndjson")
+
     return app
 
 
 def _build_events(state):
+    state.hydrate_rounds()
     events = []
     for round_id in sorted((state.round_store or {}).keys()):
         store = state.round_store[round_id]
@@ -155,6 +392,7 @@ def _build_events(state):
     return events
 
 def _build_guardrails(state):
+    state.hydrate_rounds()
     guardrails = []
     for round_id in sorted((state.round_store or {}).keys()):
         store = state.round_store[round_id]
@@ -173,7 +411,11 @@ def _ensure_session_title(state, store):
         state.title = f"Order {confirmation}"
     else:
         state.title = f"Session {state.state_id[:6]}"
-    store.save(state.state_id, state)
+    try:
+        store.save(state.state_id, state)
+    except ConversationConflictError:
+        # a chat turn saved it meanwhile; the title is derived, so the next listing persists it
+        pass
     return state.title
 
 app = create_app()
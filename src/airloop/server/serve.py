@@ -0,0 +1,241 @@
+"""
+Production entry point: `airloop serve`.
+
+One worker runs uvicorn in-process. With `--workers N` the parent binds the listening socket,
+optionally preloads the app (module imports, config, agent/tool definitions) and then forks N
+workers that share the socket, so the expensive immutable parts are built once and shared
+copy-on-write. The parent supervises: a crashed worker is restarted, and SIGTERM/SIGINT is
+forwarded so every worker stops accepting, drains in-flight requests for up to
+`graceful_timeout_s` and exits; stragglers are killed shortly after.
+
+Each worker has its own `/healthz` and `/readyz`. Only worker 0 runs background jobs.
+"""
+from __future__ import annotations
+
+import argparse
+import importlib.util
+import logging
+import os
+import signal
+import socket
+import sys
+import time
+from typing import Dict, Optional
+
+import uvicorn
+
+from airloop.settings import AppConfig, ServerConfig, load_app_config
+
+
+logger = logging.getLogger("airloop.serve")
+
+_RESPAWN_BACKOFF_S = 1.0
+_KILL_GRACE_S = 5.0
+
+
+def event_loop_impl() -> str:
+    return "uvloop" if importlib.util.find_spec("uvloop") else "asyncio"
+
+
+def http_impl() -> str:
+    return "httptools" if importlib.util.find_spec("httptools") else "h11"
+
+
+def _uvicorn_config(app, server_cfg: ServerConfig, log_level: str) -> uvicorn.Config:
+    return uvicorn.Config(
+        app,
+        host=server_cfg.host,
+        port=server_cfg.port,
+        loop=event_loop_impl(),
+        http=http_impl(),
+        lifespan="on",
+        timeout_graceful_shutdown=int(server_cfg.graceful_timeout_s) or None,
+        timeout_keep_alive=int(server_cfg.keep_alive_s),
+        log_level=log_level,
+    )
+
+
+def _bind(server_cfg: ServerConfig) -> socket.socket:
+    family = socket.AF_INET6 if ":" in server_cfg.host else socket.AF_INET
+    sock = socket.socket(family, socket.SOCK_STREAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    sock.bind((server_cfg.host, server_cfg.port))
+    sock.listen(2048)
+    sock.set_inheritable(True)
+    return sock
+
+
+class Supervisor:
+    """Pre-forking worker supervisor around a shared listening socket."""
+
+    def __init__(self, app_config: AppConfig, log_level: str = "info"):
+        self.app_config = app_config
+        self.server_cfg = app_config.server
+        self.log_level = log_level
+        self.sock: Optional[socket.socket] = None
+        self.services = None
+        self.workers: Dict[int, int] = {}  # pid -> worker id
+        self.stopping = False
+
+    def preload(self) -> None:
+        from airloop.server.services import AppServices
+
+        started = time.perf_counter()
+        self.services = AppServices(self.app_config)
+        # immutable across workers: config, tool schemas and the agent graph
+        self.services.agent_mgr
+        logger.info("preloaded agent definitions in %.2fs", time.perf_counter() - started)
+
+    def _run_worker(self, worker_id: int) -> None:
+        for sig in (signal.SIGTERM, signal.SIGINT, signal.SIGCHLD):
+            signal.signal(sig, signal.SIG_DFL)
+        from airloop.server.api import create_app
+        from airloop.server.services import AppServices
+
+        services = self.services or AppServices(self.app_config)
+        services.worker_id = worker_id
+        services.run_jobs = worker_id == 0
+        app = create_app(services=services)
+        uvicorn.Server(_uvicorn_config(app, self.server_cfg, self.log_level)).run(sockets=[self.sock])
+
+    def _spawn(self, worker_id: int) -> None:
+        pid = os.fork()
+        if pid == 0:
+            code = 0
+            try:
+                self._run_worker(worker_id)
+            except BaseException:
+                logger.exception("worker %s crashed", worker_id)
+                code = 1
+            finally:
+                os._exit(code)
+        self.workers[pid] = worker_id
+        logger.info("started worker %s (pid %s)", worker_id, pid)
+
+    def _signal_workers(self, sig: int) -> None:
+        for pid in list(self.workers):
+            try:
+                os.kill(pid, sig)
+            except ProcessLookupError:
+                self.workers.pop(pid, None)
+
+    def _on_stop(self, signum, frame) -> None:
+        if not self.stopping:
+            logger.info("shutting down %s workers (drain up to %ss)", len(self.workers), self.server_cfg.graceful_timeout_s)
+        self.stopping = True
+
+    def _reap(self) -> list:
+        exited = []
+        while self.workers:
+            try:
+                pid, status = os.waitpid(-1, os.WNOHANG)
+            except ChildProcessError:
+                self.workers.clear()
+                break
+            if pid == 0:
+                break
+            worker_id = self.workers.pop(pid, None)
+            if worker_id is not None:
+                exited.append((worker_id, os.waitstatus_to_exitcode(status)))
+        return exited
+
+    def run(self) -> int:
+        cfg = self.server_cfg
+        self.sock = _bind(cfg)
+        logger.info(
+            "listening on %s:%s with %s workers (loop=%s, http=%s)",
+            cfg.host, cfg.port, cfg.workers, event_loop_impl(), http_impl(),
+        )
+        if cfg.preload:
+            self.preload()
+        signal.signal(signal.SIGTERM, self._on_stop)
+        signal.signal(signal.SIGINT, self._on_stop)
+        for worker_id in range(cfg.workers):
+            self._spawn(worker_id)
+
+        while not self.stopping:
+            for worker_id, code in self._reap():
+                if self.stopping:
+                    break
+                logger.warning("worker %s exited with %s; restarting", worker_id, code)
+                time.sleep(_RESPAWN_BACKOFF_S)
+                self._spawn(worker_id)
+            time.sleep(0.2)
+
+        self._signal_workers(signal.SIGTERM)
+        deadline = time.monotonic() + cfg.graceful_timeout_s + _KILL_GRACE_S
+        while self.workers and time.monotonic() < deadline:
+            self._reap()
+            time.sleep(0.1)
+        if self.workers:
+            logger.warning("killing %s workers that did not drain in time", len(self.workers))
+            self._signal_workers(signal.SIGKILL)
+            while self.workers:
+                self._reap()
+                time.sleep(0.05)
+        self.sock.close()
+        return 0
+
+
+def add_arguments(parser: argparse.ArgumentParser) -> None:
+    parser.add_argument("--host", default=None)
+    parser.add_argument("--port", type=int, default=None)
+    parser.add_argument("--workers", type=int, default=None, help="worker processes (default server.workers)")
+    parser.add_argument("--graceful-timeout", type=float, default=None, help="seconds to drain requests on shutdown")
+    parser.add_argument("--keep-alive", type=float, default=None)
+    parser.add_argument("--no-preload", action="store_true", help="build the app in each worker instead of before forking")
+    parser.add_argument("--reload", action="store_true", help="single auto-reloading worker for development")
+    parser.add_argument("--log-level", default="info")
+
+
+def run(args: argparse.Namespace) -> int:
+    logging.basicConfig(level=args.log_level.upper(), format="%(asctime)s %(levelname)s %(name)s: %(message)s")
+    app_config = load_app_config()
+    cfg = app_config.server
+    overrides = {
+        "host": args.host,
+        "port": args.port,
+        "workers": args.workers,
+        "graceful_timeout_s": args.graceful_timeout,
+        "keep_alive_s": args.keep_alive,
+    }
+    for name, value in overrides.items():
+        if value is not None:
+            setattr(cfg, name, value)
+    if args.no_preload:
+        cfg.preload = False
+    if cfg.workers > 1 and app_config.store.kind == "log":
+        logger.error("store.kind=log is single-process; use --workers 1 or store.kind=sqlite")
+        return 2
+    if cfg.workers > 1 and app_config.store.kind != "sqlite":
+        logger.warning("store.kind=%s is per process: conversations will not be shared between workers", app_config.store.kind)
+
+    if args.reload:
+        uvicorn.run(
+            "airloop.server.api:app",
+            host=cfg.host,
+            port=cfg.port,
+            reload=True,
+            loop=event_loop_impl(),
+            http=http_impl(),
+            log_level=args.log_level,
+        )
+        return 0
+    if cfg.workers <= 1 or not hasattr(os, "fork"):
+        if cfg.workers > 1:
+            logger.warning("fork is not available on this platform; running a single worker")
+        from airloop.server.api import create_app
+
+        uvicorn.Server(_uvicorn_config(create_app(app_config), cfg, args.log_level)).run()
+        return 0
+    return Supervisor(app_config, args.log_level).run()
+
+
+def main(argv: Optional[list] = None) -> int:
+    parser = argparse.ArgumentParser(prog="airloop serve", description="Run the airloop API server")
+    add_arguments(parser)
+    return run(parser.parse_args(argv))
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,240 @@
+from __future__ import annotations
+
+import asyncio
+import itertools
+import os
+import time
+from dataclasses import replace
+from functools import cached_property
+from typing import Any, Dict, Optional
+
+from airloop.agents.manager import AgentManager
+from airloop.domain.archive import ConversationArchive
+from airloop.domain.codec import StateCodec
+from airloop.domain.log_store import LogConversationStore
+from airloop.domain.schema import ConversationStore, InMemoryConversationStore, PersistentConversationStore
+from airloop.service.auth_service import AuthService
+from airloop.service.chat_service import ChatService
+from airloop.service.conversation_eval_service import ConversationEvalRequest, ConversationEvalService
+from airloop.service.data_service import DataService
+from airloop.service.export_service import ExportService
+from airloop.service.feedback_service import FeedbackService
+from airloop.service.flight_recorder import FlightRecorder
+from airloop.service.job_service import JobService
+from airloop.service.judge import LLMJudge, build_judge_model
+from airloop.service.observility_service import LangfuseObservabilityService, NoopObservabilityService, ObservabilityService
+from airloop.service.offline_eval_service import OfflineEvalService
+from airloop.service.online_eval_service import OnlineEvalService
+from airloop.service.retention_service import RetentionService
+from airloop.service.sqlite_observability_service import SqliteObservabilityService
+from airloop.service.usage_service import UsageService
+from airloop.settings import AppConfig, load_app_config
+
+
+def build_observability(cfg: AppConfig) -> ObservabilityService:
+    if cfg.langfuse:
+        return LangfuseObservabilityService(cfg.langfuse)
+    if cfg.traces.kind == "sqlite":
+        return SqliteObservabilityService(cfg.traces)
+    return NoopObservabilityService()
+
+
+def build_store(cfg: AppConfig) -> ConversationStore:
+    store_cfg = cfg.store
+    codec = StateCodec(store_cfg.serializer, level=store_cfg.serializer_level, zstd_dict_path=store_cfg.zstd_dict_path)
+    if store_cfg.kind == "sqlite":
+        retention = cfg.retention
+        archive = None
+        # keep reading the archive after retention is switched off
+        if retention.enabled or os.path.exists(retention.archive_path):
+            archive = ConversationArchive(
+                retention.archive_path, StateCodec(retention.archive_serializer, level=retention.archive_level)
+            )
+        return PersistentConversationStore(
+            store_cfg.path, codec=codec, archive=archive, search_tokenizer=store_cfg.search_tokenizer
+        )
+    if store_cfg.kind == "log":
+        return LogConversationStore(
+            store_cfg.log_dir,
+            segment_bytes=int(store_cfg.log_segment_mb * 2**20),
+            fsync=store_cfg.log_fsync,
+            compact_interval_s=store_cfg.log_compact_interval_s,
+            compact_ratio=store_cfg.log_compact_ratio,
+            codec=codec,
+        )
+    return InMemoryConversationStore(
+        max_conversations=store_cfg.memory_max_conversations,
+        ttl_s=store_cfg.memory_ttl_s,
+        max_bytes=int(store_cfg.memory_max_mb * 2**20) if store_cfg.memory_max_mb else None,
+        spill=PersistentConversationStore(store_cfg.path, codec=codec) if store_cfg.memory_spill else None,
+    )
+
+
+class AppServices:
+    """
+    The service graph behind the API, built on demand.
+
+    Every service is a cached property, so nothing is constructed at import time. The app's
+    lifespan hook calls `start()`, which builds the chat path (config, migrations, agent
+    graph, store, tracing) before the first request and resumes background jobs. The eval
+    services - the offline runner with its second agent graph and ChatService, the
+    conversation evaluator and their judges - are only built when an eval endpoint or job
+    first needs them.
+
+    Under the multi-worker server every process has its own AppServices; only the worker
+    with `run_jobs` executes background jobs, the rest just enqueue them.
+    """
+
+    def __init__(self, config: Optional[AppConfig] = None, worker_id: int = 0, run_jobs: bool = True):
+        self._config = config
+        self.worker_id = worker_id
+        self.run_jobs = run_jobs
+        self.ready = False
+        self.started_at: Optional[float] = None
+
+    def is_built(self, name: str) -> bool:
+        return name in self.__dict__
+
+    @cached_property
+    def config(self) -> AppConfig:
+        return self._config or load_app_config()
+
+    @cached_property
+    def auth(self) -> AuthService:
+        svc = AuthService(self.config.store.path)
+        svc.init_db()
+        return svc
+
+    @cached_property
+    def data(self) -> DataService:
+        svc = DataService(self.config.store.path)
+        svc.init_db()
+        return svc
+
+    @cached_property
+    def usage(self) -> UsageService:
+        svc = UsageService(self.config.store.path, self.config.usage)
+        svc.init_db()
+        return svc
+
+    @cached_property
+    def agent_mgr(self) -> AgentManager:
+        return AgentManager(self.config.llm, self.data, self.config.cassette)
+
+    @cached_property
+    def store(self) -> ConversationStore:
+        return build_store(self.config)
+
+    @cached_property
+    def obs(self) -> ObservabilityService:
+        return build_observability(self.config)
+
+    @cached_property
+    def recorder(self) -> FlightRecorder:
+        return FlightRecorder(self.config.recorder)
+
+    @cached_property
+    def online_eval(self) -> Optional[OnlineEvalService]:
+        cfg = self.config
+        if not cfg.online_eval.enabled:
+            return None
+        judge_cfg = replace(cfg.evaluation, concurrency=cfg.online_eval.concurrency, judge_batch_size=1)
+        judge = LLMJudge(build_judge_model(cfg, self.agent_mgr), self.agent_mgr.run_config, judge_cfg)
+        return OnlineEvalService(judge, self.obs, cfg.online_eval, self.usage)
+
+    @cached_property
+    def chat(self) -> ChatService:
+        return ChatService(self.agent_mgr, self.store, self.obs, self.recorder, self.usage, self.online_eval)
+
+    @cached_property
+    def export(self) -> ExportService:
+        return ExportService(self.store)
+
+    @cached_property
+    def feedback(self) -> FeedbackService:
+        return FeedbackService(self.obs)
+
+    @cached_property
+    def offline_eval(self) -> OfflineEvalService:
+        return OfflineEvalService(self.chat, self.agent_mgr, self.obs, self.config)
+
+    @cached_property
+    def convo_eval(self) -> ConversationEvalService:
+        return ConversationEvalService(self.store, self.agent_mgr, self.obs, self.config)
+
+    @cached_property
+    def jobs(self) -> JobService:
+        svc = JobService(self.config.jobs, runner=self.run_jobs)
+        svc.init_db()
+        svc.register("offline_eval", self._offline_eval_job)
+        svc.register("conversation_eval", self._conversation_eval_job)
+        svc.register("retention", self._retention_job)
+        svc.register("search_reindex", self._search_reindex_job)
+        return svc
+
+    @cached_property
+    def retention(self) -> Optional[RetentionService]:
+        """Only for the sqlite store; None otherwise."""
+        if not isinstance(self.store, PersistentConversationStore) or self.store.archive is None:
+            return None
+        return RetentionService(self.store, self.jobs, self.config.retention)
+
+    async def start(self) -> None:
+        """Build the chat path up front and resume queued jobs; called from the lifespan hook."""
+        self.auth, self.chat, self.feedback
+        await self.jobs.start()
+        if self.run_jobs and self.config.retention.enabled and self.retention is not None:
+            self.retention.start()
+        self.started_at = time.time()
+        self.ready = True
+
+    async def shutdown(self) -> None:
+        self.ready = False
+        if self.is_built("retention") and self.retention is not None:
+            await self.retention.shutdown()
+        if self.is_built("jobs"):
+            await self.jobs.shutdown()
+        if self.is_built("online_eval") and self.online_eval is not None:
+            await self.online_eval.shutdown()
+        if self.is_built("store") and hasattr(self.store, "close"):
+            self.store.close()
+
+    async def _offline_eval_job(self, job: Dict[str, Any], report) -> Any:
+        params = job["params"]
+        offline_eval = self.offline_eval
+        dataset_path = offline_eval.resolve_dataset(params.get("dataset")) if params.get("run_all", True) else None
+        on_progress = lambda n, r: report({"done": n, "last_case": r.get("case"), "last_error": r.get("error")})
+        if dataset_path:
+            # a job resumed after a restart always continues from its checkpoint
+            resume = params.get("resume", True) or job["attempts"] > 1
+            return await offline_eval.run_dataset(dataset_path, resume=resume, on_progress=on_progress)
+        return await offline_eval.run_suite(on_progress=on_progress)
+
+    async def _retention_job(self, job: Dict[str, Any], report) -> Any:
+        if self.retention is None:
+            raise RuntimeError("retention needs store.kind=sqlite")
+        return await self.retention.run_pass(
+            on_progress=report, convert_vacuum=job["params"].get("convert_vacuum", False)
+        )
+
+    async def _search_reindex_job(self, job: Dict[str, Any], report) -> Any:
+        """Index every hot conversation, e.g. rows written before search was enabled."""
+        store = self.store
+        if getattr(store, "search", None) is None:
+            raise RuntimeError("search needs store.kind=sqlite and store.search_tokenizer")
+        started = time.time()
+        ids = store.iter_ids(updated_since=job["params"].get("updated_since"))
+        indexed = 0
+        while True:
+            batch = list(itertools.islice(ids, 100))
+            if not batch:
+                break
+            indexed += store.reindex_search(batch)
+            report({"done": indexed})
+            await asyncio.sleep(0)
+        return {"conversations": indexed, "documents": store.search.count(), "duration_s": round(time.time() - started, 3)}
+
+    async def _conversation_eval_job(self, job: Dict[str, Any], report) -> Any:
+        req = ConversationEvalRequest.model_validate(job["params"])
+        on_progress = lambda n, r: report({"done": n, "conversation_id": r["conversation_id"], "round": r["round"]})
+        return await self.convo_eval.evaluate_conversations(req, on_progress=on_progress)
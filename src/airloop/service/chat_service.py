@@ -1,15 +1,32 @@
 from __future__ import annotations
+import asyncio
+import time
+from contextlib import asynccontextmanager
 from uuid import uuid4
-from typing import Any, Dict, Optional
+from typing import Any, AsyncIterator, Dict, Optional
 
 from agents import Runner, InputGuardrailTripwireTriggered
 
 from airloop.agents.role import AgentRole
+from airloop.agents.guard import collect_guardrail_checks
 from airloop.domain.schema import ConversationStore, ConversationState
 from airloop.domain.context import create_initial_context
 from airloop.service.mappers import extract_messages_events
 from airloop.agents.manager import AgentManager
 from airloop.service.observility_service import NoopObservabilityService, ObservabilityService
+from airloop.instrumentation import (
+    PhaseTimer,
+    UsageCollector,
+    annotate,
+    current_timer,
+    current_usage,
+    phase,
+    use_timer,
+    use_usage,
+)
+from airloop.service.flight_recorder import FlightRecorder
+from airloop.service.usage_service import UsageService, UsageTrackingHooks
+from airloop.service.online_eval_service import OnlineEvalService
 import logging
 
 
@@ -31,10 +48,49 @@ GUARD_RAIL_ROLES=[
 
 
 class ChatService:
-    def __init__(self, agent_mgr: AgentManager, store: ConversationStore, obs_service: ObservabilityService | None = None):
+    def __init__(
+        self,
+        agent_mgr: AgentManager,
+        store: ConversationStore,
+        obs_service: ObservabilityService | None = None,
+        recorder: FlightRecorder | None = None,
+        usage_svc: UsageService | None = None,
+        online_eval: OnlineEvalService | None = None,
+    ):
         self.agent_mgr = agent_mgr
         self.store = store
         self.obs_service = obs_service or NoopObservabilityService()
+        self.recorder = recorder
+        self.usage_svc = usage_svc
+        self.online_eval = online_eval
+        self.run_hooks = UsageTrackingHooks()
+        # per-conversation locks, dropped again once nobody holds or waits for them
+        self._locks: Dict[str, asyncio.Lock] = {}
+        self._lock_refs: Dict[str, int] = {}
+
+    @asynccontextmanager
+    async def _conversation_lock(self, conversation_id: Optional[str]) -> AsyncIterator[None]:
+        """
+        Serialize rounds of one conversation inside this process; different conversations stay
+        fully concurrent. Across processes the store's version check catches the rest.
+        """
+        if not conversation_id:
+            yield
+            return
+        lock = self._locks.setdefault(conversation_id, asyncio.Lock())
+        self._lock_refs[conversation_id] = self._lock_refs.get(conversation_id, 0) + 1
+        try:
+            with phase("conversation_lock"):
+                await lock.acquire()
+            try:
+                yield
+            finally:
+                lock.release()
+        finally:
+            self._lock_refs[conversation_id] -= 1
+            if not self._lock_refs[conversation_id]:
+                del self._lock_refs[conversation_id]
+                del self._locks[conversation_id]
 
     def _build_session_title(
         self,
@@ -169,26 +225,107 @@ class ChatService:
         flight_number: Optional[str] = None,
         seat_number: Optional[str] = None,
     ) -> Dict[str, Any]:
-        cid, state = self._load_state(
-            conversation_id,
-            user_id,
-            user_name,
-            account_number,
-            order_id,
-            confirmation_number,
-            flight_number,
-            seat_number,
-        )
-        return await self._chat_with_state(state, message, persist=True)
+        timer = PhaseTimer()
+        started_at = time.time()
+        result = None
+        try:
+            with use_timer(timer):
+                async with self._conversation_lock(conversation_id):
+                    with phase("load_state"):
+                        cid, state = self._load_state(
+                            conversation_id,
+                            user_id,
+                            user_name,
+                            account_number,
+                            order_id,
+                            confirmation_number,
+                            flight_number,
+                            seat_number,
+                        )
+                    exhausted = self.usage_svc.check_budget(cid, state.user_id) if self.usage_svc else None
+                    if exhausted:
+                        annotate(status="budget_exceeded")
+                        result = self._budget_exceeded_response(state, exhausted)
+                    else:
+                        result = await self._chat_with_state(state, message, persist=True)
+        except Exception as exc:
+            timer.tags.update(status="error", error=repr(exc))
+            raise
+        finally:
+            if self.recorder is not None:
+                self._record_round(timer, started_at, result)
+        result["timings"] = timer.summary()
+        return result
+
+    def _record_round(self, timer: PhaseTimer, started_at: float, result: Optional[Dict[str, Any]]) -> None:
+        result = result or {}
+        self.recorder.record({
+            "trace_id": result.get("trace_id"),
+            "conversation_id": timer.tags.get("conversation_id"),
+            "round_id": timer.tags.get("round_id"),
+            "agent": timer.tags.get("agent"),
+            "next_agent": result.get("current_agent"),
+            "status": timer.tags.get("status", "ok"),
+            "error": timer.tags.get("error"),
+            "started_at": started_at,
+            "total_ms": timer.total_ms(),
+            "timeline": timer.spans,
+            "guardrails": result.get("guardrails", []),
+            "usage": result.get("usage"),
+        })
+
+    def _budget_exceeded_response(self, state: ConversationState, budget: str) -> Dict[str, Any]:
+        notice = f"Sorry, the token budget for this {budget} has been used up."
+        return {
+            "conversation_id": state.state_id,
+            "session_title": state.title,
+            "current_agent": state.current_agent_name,
+            "messages": [{"content": notice, "agent": state.current_agent_name}],
+            "events": [],
+            "context": state.context,
+            "agents": self.agent_mgr.list_agents(filter=ROLES_TO_SHOW),
+            "guardrails": [],
+            "trace_id": None,
+        }
+
+    def _round_usage(self) -> Dict[str, Any]:
+        collector = current_usage()
+        if collector is None:
+            return {}
+        return collector.as_dict(self.usage_svc.config if self.usage_svc else None)
+
+    def _round_timings(self) -> Dict[str, Any]:
+        timer = current_timer()
+        timings: Dict[str, Any] = {"finished_at": time.time()}
+        if timer is not None:
+            timings["phases"] = timer.summary()
+        return timings
+
+    def _record_usage(self, state: ConversationState, round_id: int, trace_id: str, usage: Dict[str, Any], persist: bool) -> None:
+        if not persist or self.usage_svc is None or not usage.get("by_agent"):
+            return
+        with phase("usage_ledger"):
+            self.usage_svc.record_round(
+                conversation_id=state.state_id,
+                user_id=state.user_id,
+                round_id=round_id,
+                trace_id=trace_id,
+                usage=usage,
+            )
 
     async def chat_with_state(self, state: ConversationState, message: str, persist: bool = False) -> Dict[str, Any]:
         return await self._chat_with_state(state, message, persist=persist)
     
     async def _chat_with_state(self, state: ConversationState, message: str, persist: bool = True) -> Dict[str, Any]:
+        with use_usage(UsageCollector()), collect_guardrail_checks():
+            return await self._run_round(state, message, persist)
+
+    async def _run_round(self, state: ConversationState, message: str, persist: bool) -> Dict[str, Any]:
         cid = state.state_id
         agent = self.agent_mgr.get_agent_by_name(state.current_agent_name)
         state.input_items.append({"role": "user", "content": message})
         round_id = state.round_counter
+        annotate(conversation_id=cid, round_id=round_id, agent=agent.name)
         with self.obs_service.start_round_trace(
             conversation_id=cid,
             round_id=round_id,
@@ -202,23 +339,37 @@ class ChatService:
                     agent,
                     state.input_items,
                     context=state.context,
+                    hooks=self.run_hooks,
                     run_config=self.agent_mgr.run_config,
                 )
             except InputGuardrailTripwireTriggered:
+                annotate(status="guardrail_tripped")
                 refusal = "Sorry, I can only answer questions related to airline travel."
                 guardrail_checks = self.agent_mgr.guardrail_manager.pop_guardrail_checks()
+                usage = self._round_usage()
                 state.update_round(
                     agent_name=state.current_agent_name,
                     trace_id=trace_id,
                     input_items=state.input_items,
                     events=[],
-                    messages=[{"role": "assistant", "content": refusal}]
+                    messages=[{"role": "assistant", "content": refusal}],
+                    usage=usage,
+                    guardrails=guardrail_checks,
+                    timings=self._round_timings(),
                 )
-                self.obs_service.log_guardrail_trip(trace_id=trace_id, reason="Input relevance guardrail triggered")
+                with phase("observability"):
+                    self.obs_service.log_guardrail_trip(
+                        trace_id=trace_id,
+                        reason="Input relevance guardrail triggered",
+                        guardrails=guardrail_checks,
+                        usage=usage,
+                    )
                 state.input_items.append({"role": "assistant", "content": refusal})
                 state.finish_round()
                 if persist:
-                    self.store.save(cid, state)
+                    with phase("store_save"):
+                        self.store.save(cid, state)
+                self._record_usage(state, round_id, trace_id, usage, persist)
                 return {
                     "conversation_id": cid,
                     "session_title": state.title,
@@ -229,22 +380,30 @@ class ChatService:
                     "agents": self.agent_mgr.list_agents(filter=ROLES_TO_SHOW),
                     "guardrails": guardrail_checks,
                     "trace_id": trace_id,
+                    "usage": usage,
                 }
             except Exception as exc:
                 logging.exception("ChatService run failed")
+                annotate(status="error", error=repr(exc))
                 error_msg = "Sorry, something went wrong on our side. Please try again."
                 guardrail_checks = self.agent_mgr.guardrail_manager.pop_guardrail_checks()
+                usage = self._round_usage()
                 state.update_round(
                     agent_name=state.current_agent_name,
                     trace_id=trace_id,
                     input_items=state.input_items,
                     events=[],
                     messages=[{"role": "assistant", "content": error_msg}],
+                    usage=usage,
+                    guardrails=guardrail_checks,
+                    timings=self._round_timings(),
                 )
                 state.input_items.append({"role": "assistant", "content": error_msg})
                 state.finish_round()
                 if persist:
-                    self.store.save(cid, state)
+                    with phase("store_save"):
+                        self.store.save(cid, state)
+                self._record_usage(state, round_id, trace_id, usage, persist)
                 return {
                     "conversation_id": cid,
                     "session_title": state.title,
@@ -255,21 +414,27 @@ class ChatService:
                     "agents": self.agent_mgr.list_agents(filter=ROLES_TO_SHOW),
                     "guardrails": guardrail_checks,
                     "trace_id": trace_id,
+                    "usage": usage,
                 }
 
-            messages, events, next_agent_name = extract_messages_events(result)
+            with phase("extract_messages_events"):
+                messages, events, next_agent_name = extract_messages_events(result)
             messages = messages
             guardrail_checks = self.agent_mgr.guardrail_manager.pop_guardrail_checks()
+            usage = self._round_usage()
             
-            self.obs_service.log_round(
-                conversation_id=cid,
-                trace_id=trace_id,
-                messages=messages,
-                events=events,
-                next_agent=next_agent_name,
-                context=state.context,
-                input_content=state.input_items,
-            )
+            with phase("observability"):
+                self.obs_service.log_round(
+                    conversation_id=cid,
+                    trace_id=trace_id,
+                    messages=messages,
+                    events=events,
+                    next_agent=next_agent_name,
+                    context=state.context,
+                    input_content=state.input_items,
+                    guardrails=guardrail_checks,
+                    usage=usage,
+                )
             
             state.update_round(
                 agent_name=state.current_agent_name, 
@@ -277,6 +442,9 @@ class ChatService:
                 trace_id=trace_id,
                 events=events,
                 messages=[{"role":"user","content":message}] + messages,
+                usage=usage,
+                guardrails=guardrail_checks,
+                timings=self._round_timings(),
             )
             state.input_items = result.to_input_list()
             
@@ -284,7 +452,20 @@ class ChatService:
             # print(state.input_items)
             state.finish_round()
             if persist:
-                self.store.save(cid, state)
+                with phase("store_save"):
+                    self.store.save(cid, state)
+            self._record_usage(state, round_id, trace_id, usage, persist)
+            if self.online_eval is not None:
+                # sampling + enqueue only; judging happens off the request path
+                self.online_eval.submit(
+                    trace_id=trace_id,
+                    conversation_id=cid,
+                    round_id=round_id,
+                    user_message=message,
+                    messages=messages,
+                    context=state.context,
+                    user_id=state.user_id,
+                )
         
         return {
             "conversation_id": cid,
@@ -296,4 +477,5 @@ class ChatService:
             "agents": self.agent_mgr.list_agents(filter=ROLES_TO_SHOW),
             "guardrails": guardrail_checks,
             "trace_id": trace_id,
+            "usage": usage,
         }
@@ -1,47 +1,136 @@
 from __future__ import annotations
 
-from typing import Any, Dict, List, Optional
+import itertools
+import os
+import sqlite3
+import time
+from typing import Any, Callable, Dict, Iterable, List, Optional, Sequence, Tuple
 from uuid import uuid4
 
-from agents import Runner
 from pydantic import BaseModel
 
-from airloop.agents.eval_agent import build_eval_agent, EvalScores
+from airloop.agents.eval_agent import EvalScores
 from airloop.agents.manager import AgentManager
 from airloop.domain.schema import ConversationStore, ConversationState
+from airloop.service.judge import LLMJudge, build_judge_cache, build_judge_model
 from airloop.service.observility_service import ObservabilityService
-from airloop.settings import AppConfig
-from openai import AsyncOpenAI
-from agents import OpenAIChatCompletionsModel
+from airloop.settings import AppConfig, EvalConfig
 
 
 class ConversationEvalRequest(BaseModel):
-    conversation_ids: List[str]
-    mode: str = "latest"  # "latest" or "all"
+    conversation_ids: List[str] = []  # incremental mode scans the whole store when empty
+    mode: str = "latest"  # "latest", "all" or "incremental"
+    updated_since: Optional[float] = None  # incremental: only conversations saved since (unix seconds)
+    batch_size: Optional[int] = None  # rounds per judge call; defaults to evaluation.judge_batch_size
+    use_cache: bool = True  # reuse cached judgements of unchanged rounds
+
+
+_RoundItem = Tuple[str, int, str, str]  # (conversation_id, round, trace_id, judge_input)
+
+# conversations loaded and judged together in incremental mode
+_INCREMENTAL_CHUNK = 50
+
+
+class EvalWatermarkStore:
+    """Per-conversation watermark: the last round index that has been judged."""
+
+    def __init__(self, db_path: str):
+        self.db_path = db_path
+
+    def _open_db(self) -> sqlite3.Connection:
+        dir_name = os.path.dirname(self.db_path) or "."
+        os.makedirs(dir_name, exist_ok=True)
+        conn = sqlite3.connect(self.db_path, check_same_thread=False)
+        conn.row_factory = sqlite3.Row
+        return conn
+
+    def init_db(self) -> None:
+        conn = self._open_db()
+        conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS eval_watermarks (
+                conversation_id TEXT PRIMARY KEY,
+                last_round INTEGER NOT NULL,
+                updated_at REAL NOT NULL
+            )
+            """
+        )
+        conn.commit()
+        conn.close()
+
+    def get_many(self, conversation_ids: Sequence[str]) -> Dict[str, int]:
+        if not conversation_ids:
+            return {}
+        conn = self._open_db()
+        rows = conn.execute(
+            f"SELECT conversation_id, last_round FROM eval_watermarks "
+            f"WHERE conversation_id IN ({','.join('?' * len(conversation_ids))})",
+            list(conversation_ids),
+        ).fetchall()
+        conn.close()
+        return {row["conversation_id"]: row["last_round"] for row in rows}
+
+    def advance(self, marks: Dict[str, int]) -> None:
+        """Move watermarks forward; a watermark never moves back."""
+        if not marks:
+            return
+        now = time.time()
+        conn = self._open_db()
+        conn.executemany(
+            """
+            INSERT INTO eval_watermarks (conversation_id, last_round, updated_at) VALUES (?, ?, ?)
+            ON CONFLICT(conversation_id) DO UPDATE SET
+                last_round = MAX(last_round, excluded.last_round),
+                updated_at = excluded.updated_at
+            """,
+            [(cid, round_idx, now) for cid, round_idx in marks.items()],
+        )
+        conn.commit()
+        conn.close()
 
 
 class ConversationEvalService:
     """
     Evaluate existing conversations using a local LLM judge (no Langfuse evaluator API).
     For each round, scores are written via ObservabilityService.score to the existing trace_id.
+
+    Judged rounds advance a persisted per-conversation watermark; mode="incremental" only
+    judges completed rounds past it, streaming conversation ids from the store.
     """
 
     def __init__(self, store: ConversationStore, agent_mgr: AgentManager, obs_service: ObservabilityService, app_config: Optional[AppConfig] = None):
         self.store = store
         self.obs = obs_service
-        self.judge = self._build_eval_agent(app_config, agent_mgr)
         self.run_config = agent_mgr.run_config
+        eval_config = app_config.evaluation if app_config else None
+        self.judge = LLMJudge(
+            build_judge_model(app_config, agent_mgr),
+            self.run_config,
+            eval_config,
+            cache=build_judge_cache(eval_config),
+        )
+        self.watermarks = EvalWatermarkStore((eval_config or EvalConfig()).watermark_path)
+        self.watermarks.init_db()
 
-    def _build_eval_agent(self, app_config: Optional[AppConfig], agent_mgr: AgentManager):
-        if app_config and app_config.eval_llm:
-            eval_cfg = app_config.eval_llm
-            client = AsyncOpenAI(base_url=eval_cfg.base_url, api_key=eval_cfg.api_key)
-            model = OpenAIChatCompletionsModel(model=eval_cfg.model_name, openai_client=client)
-            return build_eval_agent(model)
-        return build_eval_agent(agent_mgr.model)
+    def _round_items(self, cid: str, state: ConversationState, rounds) -> List[_RoundItem]:
+        items: List[_RoundItem] = []
+        for round_idx, round_store in rounds:
+            trace_id = round_store.trace_id or uuid4().hex
+            user_msgs = [m.get("content", "") for m in round_store.input_items if m.get("role") == "user"]
+            last_user = user_msgs[-1] if user_msgs else ""
+            assistant_msgs = [m.get("content", "") for m in round_store.messages]
+            assistant_text = "\n".join([t for t in assistant_msgs if t])
 
-    async def evaluate_conversations(self, req: ConversationEvalRequest) -> List[Dict[str, Any]]:
-        results: List[Dict[str, Any]] = []
+            judge_input = (
+                f"User message: {last_user}\n"
+                f"Assistant reply: {assistant_text}\n"
+                f"Context: {state.context}"
+            )
+            items.append((cid, round_idx, trace_id, judge_input))
+        return items
+
+    def _collect_rounds(self, req: ConversationEvalRequest) -> List[_RoundItem]:
+        items: List[_RoundItem] = []
         latest_only = req.mode != "all"
 
         for cid in req.conversation_ids:
@@ -49,51 +138,130 @@ class ConversationEvalService:
             if state is None:
                 continue
 
-            rounds = sorted(state.round_store.items(), key=lambda kv: kv[0])
+            if latest_only:
+                # a lazily loaded state only holds the open round; load the last finished one
+                state.hydrate_rounds(start=max(state.round_counter - 1, 0))
+            else:
+                state.hydrate_rounds()
+            # the open round at round_counter has no reply yet; judging it would also push
+            # the watermark onto the index the next completed round will get
+            rounds = sorted(
+                (idx, rs) for idx, rs in state.round_store.items() if idx < state.round_counter
+            )
             if latest_only and rounds:
                 rounds = [rounds[-1]]
+            items.extend(self._round_items(cid, state, rounds))
+        return items
 
-            for round_idx, round_store in rounds:
-                trace_id = round_store.trace_id or uuid4().hex
-                user_msgs = [m.get("content", "") for m in round_store.input_items if m.get("role") == "user"]
-                last_user = user_msgs[-1] if user_msgs else ""
-                assistant_msgs = [m.get("content", "") for m in round_store.messages]
-                assistant_text = "\n".join([t for t in assistant_msgs if t])
-
-                judge_input = (
-                    f"User message: {last_user}\n"
-                    f"Assistant reply: {assistant_text}\n"
-                    f"Context: {state.context}"
-                )
-
-                judge_result = await Runner.run(
-                    self.judge,
-                    [{"role": "user", "content": judge_input}],
-                    context=None,
-                    run_config=self.run_config,
-                )
-                scores = judge_result.final_output_as(EvalScores)
-                eval_trace_id = self.obs.log_eval_trace(
-                    conversation_id=cid,
-                    agent_name="LLM Judge",
-                    context={"round": round_idx},
-                    eval_input=judge_input,
-                    eval_output=scores.model_dump(),
-                )
-                self._log_scores(trace_id, scores)
-
-                results.append(
-                    {
-                        "conversation_id": cid,
-                        "round": round_idx,
-                        "trace_id": trace_id,
-                        "eval_trace_id": eval_trace_id,
-                        "scores": scores.model_dump(),
-                    }
-                )
+    def _collect_new_rounds(self, conversation_ids: Sequence[str]) -> List[_RoundItem]:
+        """Completed rounds past each conversation's watermark (the open round is skipped)."""
+        marks = self.watermarks.get_many(conversation_ids)
+        items: List[_RoundItem] = []
+        for cid in conversation_ids:
+            state = self.store.get(cid)
+            if state is None:
+                continue
+            last = marks.get(cid, -1)
+            # only the rounds past the watermark are read from the store
+            state.hydrate_rounds(start=last + 1)
+            rounds = sorted(
+                (idx, rs) for idx, rs in state.round_store.items() if last < idx < state.round_counter
+            )
+            items.extend(self._round_items(cid, state, rounds))
+        return items
+
+    def _advance_watermarks(self, items: Iterable[_RoundItem]) -> None:
+        marks: Dict[str, int] = {}
+        for cid, round_idx, _, _ in items:
+            marks[cid] = max(marks.get(cid, -1), round_idx)
+        self.watermarks.advance(marks)
 
+    async def evaluate_conversations(
+        self,
+        req: ConversationEvalRequest,
+        on_progress: Optional[Callable[[int, Dict[str, Any]], Any]] = None,
+    ) -> List[Dict[str, Any]]:
+        if req.mode == "incremental":
+            return await self._evaluate_incremental(req, on_progress)
+        items = self._collect_rounds(req)
+        results = await self._judge_and_log(items, req, on_progress)
+        if req.mode == "all":
+            self._advance_watermarks(items)
         return results
 
+    async def _evaluate_incremental(
+        self,
+        req: ConversationEvalRequest,
+        on_progress: Optional[Callable[[int, Dict[str, Any]], Any]] = None,
+    ) -> List[Dict[str, Any]]:
+        """
+        Judge only rounds added since the last run. Conversation ids are streamed from the store
+        (or taken from the request) and handled in chunks, so only one chunk of states is loaded
+        at a time. A chunk's watermarks advance once its rounds have been judged and logged.
+        """
+        if req.conversation_ids:
+            ids = iter(req.conversation_ids)
+        else:
+            ids = self.store.iter_ids(updated_since=req.updated_since)
+        results: List[Dict[str, Any]] = []
+        while True:
+            chunk = list(itertools.islice(ids, _INCREMENTAL_CHUNK))
+            if not chunk:
+                return results
+            items = self._collect_new_rounds(chunk)
+            results.extend(await self._judge_and_log(items, req, on_progress, done=len(results)))
+            self._advance_watermarks(items)
+
+    async def _judge_and_log(
+        self,
+        items: List[_RoundItem],
+        req: ConversationEvalRequest,
+        on_progress: Optional[Callable[[int, Dict[str, Any]], Any]] = None,
+        done: int = 0,
+    ) -> List[Dict[str, Any]]:
+        results: List[Dict[str, Any]] = []
+        judgements = await self.judge.judge_many(
+            [item[3] for item in items],
+            batch_size=req.batch_size,
+            use_cache=req.use_cache,
+        )
+
+        for (cid, round_idx, trace_id, judge_input), judgement in zip(items, judgements):
+            scores = judgement.scores
+            # the cache is keyed by judge input, not by round: a hit may come from another
+            # round or conversation, so the scores are always attached to this round's trace
+            eval_trace_id = self.obs.log_eval_trace(
+                conversation_id=cid,
+                agent_name="LLM Judge",
+                context={"round": round_idx, "cached": judgement.cached},
+                eval_input=judge_input,
+                eval_output=scores.model_dump(),
+            )
+            self._log_scores(trace_id, scores)
+
+            results.append(
+                {
+                    "conversation_id": cid,
+                    "round": round_idx,
+                    "trace_id": trace_id,
+                    "eval_trace_id": eval_trace_id,
+                    "scores": scores.model_dump(),
+                    "cached": judgement.cached,
+                }
+            )
+            if on_progress is not None:
+                on_progress(done + len(results), results[-1])
+
+        return results
+
+    async def compare_batching(self, req: ConversationEvalRequest) -> Dict[str, Any]:
+        """
+        Judge the selected rounds both one by one and batched (nothing is logged) and report
+        the throughput gain and the score agreement between the two modes.
+        """
+        items = self._collect_rounds(req)
+        return await self.judge.compare([item[3] for item in items], batch_size=req.batch_size)
+
     def _log_scores(self, trace_id: str, scores: EvalScores):
         metrics = scores.model_dump()
         reasoning = metrics.pop("reasoning", None)
@@ -0,0 +1,141 @@
+"""
+Streaming NDJSON export of conversation rounds, for eval datasets and analytics.
+
+One JSON line per finished round: conversation id, title and user, round index, agent,
+trace_id, messages, events, guardrails, usage and timings. Conversations are walked with the
+store's keyset `iter_ids` and each one's history is read a page of rounds at a time
+(ConversationState.iter_rounds), so memory stays flat however large the store is.
+
+    GET /api/export?user_id=1&since=1760000000
+    airloop export --out rounds.ndjson --agent "FAQ Agent" --since 2025-10-01
+"""
+from __future__ import annotations
+
+import argparse
+import json
+import sys
+import time
+from datetime import datetime
+from typing import Any, Dict, Iterator, List, Optional
+
+from airloop.domain.schema import ConversationStore
+
+
+class ExportService:
+    def __init__(self, store: ConversationStore):
+        self.store = store
+
+    def iter_records(
+        self,
+        user_id: Optional[int] = None,
+        agent: Optional[str] = None,
+        since: Optional[float] = None,
+        until: Optional[float] = None,
+        conversation_ids: Optional[List[str]] = None,
+        heartbeat: bool = False,
+    ) -> Iterator[Optional[Dict[str, Any]]]:
+        """
+        Rounds matching every given filter, conversation by conversation. `since`/`until`
+        (unix seconds) apply to the time a round finished; rounds stored before timings were
+        recorded have none and only match without a time filter. Archived conversations are
+        not exported (loading one would restore it). With `heartbeat`, None is also yielded
+        after every conversation scanned, matching or not, so an async caller can give the
+        loop back even when a selective filter skips most of the store.
+        """
+        ids = iter(conversation_ids) if conversation_ids else self.store.iter_ids(updated_since=since)
+        for cid in ids:
+            # iter_ids only walks hot conversations; explicitly requested ones may be archived
+            if not (conversation_ids and self.store.is_archived(cid)):
+                yield from self._conversation_records(cid, user_id, agent, since, until)
+            if heartbeat:
+                yield None
+
+    def _conversation_records(
+        self,
+        cid: str,
+        user_id: Optional[int],
+        agent: Optional[str],
+        since: Optional[float],
+        until: Optional[float],
+    ) -> Iterator[Dict[str, Any]]:
+        state = self.store.get(cid)
+        if state is None or (user_id is not None and state.user_id != user_id):
+            return
+        for idx, rs in state.iter_rounds():
+            # the open round is still being written
+            if idx >= state.round_counter:
+                break
+            if agent is not None and rs.agent_name != agent:
+                continue
+            if since is not None or until is not None:
+                finished_at = rs.timings.get("finished_at")
+                if finished_at is None:
+                    continue
+                if (since is not None and finished_at < since) or (until is not None and finished_at >= until):
+                    continue
+            yield {
+                "conversation_id": cid,
+                "title": state.title,
+                "user_id": state.user_id,
+                "round": idx,
+                "agent": rs.agent_name,
+                "trace_id": rs.trace_id,
+                "messages": rs.messages,
+                "events": rs.events,
+                "guardrails": rs.guardrails,
+                "usage": rs.usage,
+                "timings": rs.timings,
+            }
+
+    def iter_ndjson(self, **filters: Any) -> Iterator[str]:
+        """One line per record; a heartbeat (see iter_records) comes through as an empty string."""
+        for record in self.iter_records(**filters):
+            yield "" if record is None else json.dumps(record, ensure_ascii=False, default=str) + "\n"
+
+
+def parse_time(value: str) -> float:
+    """Unix seconds or an ISO 8601 date/time (local time when no offset is given)."""
+    try:
+        return float(value)
+    except ValueError:
+        pass
+    try:
+        return datetime.fromisoformat(value).timestamp()
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"not a unix timestamp or ISO date: {value}")
+
+
+def add_arguments(parser: argparse.ArgumentParser) -> None:
+    parser.add_argument("--out", default="-", help="output file (default stdout)")
+    parser.add_argument("--user-id", type=int, default=None)
+    parser.add_argument("--agent", default=None, help="only rounds handled by this agent")
+    parser.add_argument("--since", type=parse_time, default=None, help="unix seconds or ISO date")
+    parser.add_argument("--until", type=parse_time, default=None, help="unix seconds or ISO date")
+    parser.add_argument("--conversation-id", action="append", default=None, help="repeatable")
+
+
+def run(args: argparse.Namespace) -> int:
+    from airloop.server.services import build_store
+    from airloop.settings import load_app_config
+
+    store = build_store(load_app_config())
+    started = time.time()
+    count = 0
+    out = sys.stdout if args.out == "-" else open(args.out, "w", encoding="utf-8")
+    try:
+        for line in ExportService(store).iter_ndjson(
+            user_id=args.user_id,
+            agent=args.agent,
+            since=args.since,
+            until=args.until,
+            conversation_ids=args.conversation_id,
+        ):
+            out.write(line)
+            count += 1
+    finally:
+        if out is not sys.stdout:
+            out.close()
+        if hasattr(store, "close"):
+            store.close()
+    print(f"exported {count} rounds in {time.time() - started:.1f}s", file=sys.stderr)
+    return 0
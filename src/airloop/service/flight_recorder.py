@@ -0,0 +1,81 @@
+from __future__ import annotations
+
+from collections import deque
+from typing import Any, Deque, Dict, List, Optional
+import json
+import os
+import threading
+import time
+import traceback
+
+from airloop.settings import FlightRecorderConfig
+
+
+class FlightRecorder:
+    """
+    Ring buffer of the detailed timeline of the last N chat rounds.
+
+    Each record holds the phase spans of the round (model calls with token counts, tool calls
+    with arguments and durations, guardrail verdicts) plus the guardrail checks. Rounds slower
+    than `slow_ms` or ending in an error are also dumped to `dump_dir` as one JSON file each,
+    so tail-latency rounds can be inspected after the process is gone.
+    """
+
+    def __init__(self, config: Optional[FlightRecorderConfig] = None):
+        self.config = config or FlightRecorderConfig()
+        self._rounds: Deque[Dict[str, Any]] = deque(maxlen=self.config.capacity)
+        self._lock = threading.Lock()
+
+    def is_slow(self, record: Dict[str, Any]) -> bool:
+        return record.get("total_ms", 0.0) >= self.config.slow_ms or record.get("status") == "error"
+
+    def record(self, record: Dict[str, Any]) -> None:
+        with self._lock:
+            self._rounds.append(record)
+        if self.is_slow(record):
+            self._dump(record)
+
+    def _dump(self, record: Dict[str, Any]) -> None:
+        try:
+            os.makedirs(self.config.dump_dir, exist_ok=True)
+            name = f"{int(record.get('started_at', time.time()) * 1000)}-{record.get('trace_id') or 'round'}.json"
+            path = os.path.join(self.config.dump_dir, name)
+            with open(path, "w", encoding="utf-8") as f:
+                json.dump(record, f, ensure_ascii=False, default=str)
+            record["dump_path"] = path
+            self._prune_dumps()
+        except Exception:
+            traceback.print_exc()
+
+    def _dump_files(self) -> List[str]:
+        if not os.path.isdir(self.config.dump_dir):
+            return []
+        return sorted(f for f in os.listdir(self.config.dump_dir) if f.endswith(".json"))
+
+    def _prune_dumps(self) -> None:
+        files = self._dump_files()
+        for name in files[: max(0, len(files) - self.config.max_dumps)]:
+            try:
+                os.remove(os.path.join(self.config.dump_dir, name))
+            except OSError:
+                pass
+
+    def recent(self, limit: int = 20, slow_only: bool = False) -> List[Dict[str, Any]]:
+        with self._lock:
+            rounds = list(self._rounds)
+        if slow_only:
+            rounds = [r for r in rounds if self.is_slow(r)]
+        return rounds[::-1][:limit]
+
+    def slow_rounds(self, limit: int = 20) -> List[Dict[str, Any]]:
+        """Recent slow/error rounds from the dump directory (survives restarts), newest first."""
+        out: List[Dict[str, Any]] = []
+        for name in reversed(self._dump_files()):
+            if len(out) >= limit:
+                break
+            try:
+                with open(os.path.join(self.config.dump_dir, name), "r", encoding="utf-8") as f:
+                    out.append(json.load(f))
+            except (OSError, ValueError):
+                continue
+        return out
@@ -0,0 +1,252 @@
+from __future__ import annotations
+
+import asyncio
+import json
+import os
+import sqlite3
+import time
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Set
+from uuid import uuid4
+
+from airloop.settings import JobConfig
+
+
+ProgressCallback = Callable[[Dict[str, Any]], None]
+JobHandler = Callable[[Dict[str, Any], ProgressCallback], Awaitable[Any]]
+
+JOB_STATUSES = ("queued", "running", "succeeded", "failed", "cancelled")
+
+
+class JobService:
+    """
+    In-process background jobs for long-running work (evaluations).
+
+    Jobs are persisted in sqlite and run as asyncio tasks, at most `concurrency` at a time.
+    A job interrupted by a shutdown goes back to "queued" and is picked up again by `start()`
+    after a restart, so handlers should be resumable (the eval runs resume from their
+    checkpoint file / watermarks). Handlers get the job dict, whose `attempts` tells a first
+    run from a resumed one.
+
+    With several server workers sharing the database, only one of them is the `runner`. The
+    others just insert jobs and update their status; the runner polls for queued jobs and
+    for cancellations made elsewhere.
+    """
+
+    def __init__(self, config: Optional[JobConfig] = None, runner: bool = True):
+        self.config = config or JobConfig()
+        self.db_path = self.config.path
+        self.runner = runner
+        self._handlers: Dict[str, JobHandler] = {}
+        self._tasks: Dict[str, asyncio.Task] = {}
+        self._cancelled: Set[str] = set()
+        self._semaphore: Optional[asyncio.Semaphore] = None
+        self._poller: Optional[asyncio.Task] = None
+
+    def _open_db(self) -> sqlite3.Connection:
+        dir_name = os.path.dirname(self.db_path) or "."
+        os.makedirs(dir_name, exist_ok=True)
+        conn = sqlite3.connect(self.db_path, check_same_thread=False)
+        conn.row_factory = sqlite3.Row
+        return conn
+
+    def init_db(self) -> None:
+        conn = self._open_db()
+        conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS jobs (
+                id TEXT PRIMARY KEY,
+                kind TEXT NOT NULL,
+                status TEXT NOT NULL,
+                params_json TEXT NOT NULL,
+                progress_json TEXT,
+                result_json TEXT,
+                error TEXT,
+                attempts INTEGER NOT NULL DEFAULT 0,
+                created_at REAL NOT NULL,
+                started_at REAL,
+                finished_at REAL
+            )
+            """
+        )
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_jobs_status ON jobs (status, created_at)")
+        conn.commit()
+        conn.close()
+
+    def register(self, kind: str, handler: JobHandler) -> None:
+        self._handlers[kind] = handler
+
+    async def start(self) -> None:
+        """Re-queue jobs interrupted by the last shutdown and schedule every queued job."""
+        if not self.runner:
+            return
+        conn = self._open_db()
+        conn.execute("UPDATE jobs SET status = 'queued' WHERE status = 'running'")
+        conn.commit()
+        conn.close()
+        self._schedule_queued()
+        if self.config.poll_interval_s > 0 and self._poller is None:
+            self._poller = asyncio.create_task(self._poll())
+
+    async def shutdown(self) -> None:
+        """Stop running jobs without marking them cancelled; they resume on the next start."""
+        if self._poller is not None:
+            self._poller.cancel()
+            await asyncio.gather(self._poller, return_exceptions=True)
+            self._poller = None
+        tasks = list(self._tasks.values())
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+    def submit(self, kind: str, params: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+        if kind not in self._handlers:
+            raise ValueError(f"Unknown job kind {kind}")
+        job_id = uuid4().hex
+        conn = self._open_db()
+        conn.execute(
+            "INSERT INTO jobs (id, kind, status, params_json, created_at) VALUES (?, ?, 'queued', ?, ?)",
+            (job_id, kind, json.dumps(params or {}, ensure_ascii=False, default=str), time.time()),
+        )
+        conn.commit()
+        conn.close()
+        if self.runner:
+            self._schedule(job_id)
+        return self.get(job_id)
+
+    def cancel(self, job_id: str) -> Optional[Dict[str, Any]]:
+        job = self.get(job_id)
+        if job is None or job["status"] not in ("queued", "running"):
+            return job
+        self._cancelled.add(job_id)
+        self._update(job_id, status="cancelled", finished_at=time.time())
+        task = self._tasks.get(job_id)
+        if task is not None:
+            task.cancel()
+        return self.get(job_id)
+
+    def get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        conn = self._open_db()
+        row = conn.execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        conn.close()
+        return self._to_dict(row) if row else None
+
+    def result(self, job_id: str) -> Any:
+        conn = self._open_db()
+        row = conn.execute("SELECT result_json FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        conn.close()
+        if row is None or row["result_json"] is None:
+            return None
+        return json.loads(row["result_json"])
+
+    def list(self, status: Optional[str] = None, limit: int = 50) -> List[Dict[str, Any]]:
+        conn = self._open_db()
+        if status:
+            rows = conn.execute(
+                "SELECT * FROM jobs WHERE status = ? ORDER BY created_at DESC LIMIT ?", (status, limit)
+            ).fetchall()
+        else:
+            rows = conn.execute("SELECT * FROM jobs ORDER BY created_at DESC LIMIT ?", (limit,)).fetchall()
+        conn.close()
+        return [self._to_dict(row) for row in rows]
+
+    def _to_dict(self, row: sqlite3.Row) -> Dict[str, Any]:
+        return {
+            "id": row["id"],
+            "kind": row["kind"],
+            "status": row["status"],
+            "params": json.loads(row["params_json"]),
+            "progress": json.loads(row["progress_json"]) if row["progress_json"] else None,
+            "error": row["error"],
+            "attempts": row["attempts"],
+            "created_at": row["created_at"],
+            "started_at": row["started_at"],
+            "finished_at": row["finished_at"],
+            "has_result": row["result_json"] is not None,
+        }
+
+    def _update(self, job_id: str, expect_status: Optional[str] = None, **fields: Any) -> None:
+        """Set `fields`; with `expect_status`, only while the job is still in that status."""
+        assignments = ", ".join(f"{name} = ?" for name in fields)
+        where, params = "id = ?", [job_id]
+        if expect_status is not None:
+            where += " AND status = ?"
+            params.append(expect_status)
+        conn = self._open_db()
+        conn.execute(f"UPDATE jobs SET {assignments} WHERE {where}", (*fields.values(), *params))
+        conn.commit()
+        conn.close()
+
+    def _schedule_queued(self) -> None:
+        conn = self._open_db()
+        rows = conn.execute("SELECT id FROM jobs WHERE status = 'queued' ORDER BY created_at").fetchall()
+        conn.close()
+        for row in rows:
+            self._schedule(row["id"])
+
+    async def _poll(self) -> None:
+        while True:
+            await asyncio.sleep(self.config.poll_interval_s)
+            try:
+                self._schedule_queued()
+                for job_id, task in list(self._tasks.items()):
+                    job = self.get(job_id)
+                    if job is not None and job["status"] == "cancelled":
+                        # cancelled through another worker
+                        self._cancelled.add(job_id)
+                        task.cancel()
+            except sqlite3.Error:
+                continue
+
+    def _schedule(self, job_id: str) -> None:
+        if job_id in self._tasks:
+            return
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(max(1, self.config.concurrency))
+        task = asyncio.create_task(self._run(job_id))
+        self._tasks[job_id] = task
+        task.add_done_callback(lambda _: self._tasks.pop(job_id, None))
+
+    def _progress_reporter(self, job_id: str) -> ProgressCallback:
+        last_write = 0.0
+
+        def report(progress: Dict[str, Any]) -> None:
+            nonlocal last_write
+            now = time.monotonic()
+            if now - last_write < self.config.progress_interval_s:
+                return
+            last_write = now
+            self._update(job_id, progress_json=json.dumps(progress, ensure_ascii=False, default=str))
+
+        return report
+
+    async def _run(self, job_id: str) -> None:
+        try:
+            async with self._semaphore:
+                job = self.get(job_id)
+                if job is None or job["status"] != "queued":
+                    return
+                job["attempts"] += 1
+                self._update(job_id, status="running", started_at=time.time(), attempts=job["attempts"])
+                handler = self._handlers.get(job["kind"])
+                if handler is None:
+                    raise ValueError(f"Unknown job kind {job['kind']}")
+                result = await handler(job, self._progress_reporter(job_id))
+        except asyncio.CancelledError:
+            if job_id not in self._cancelled:
+                # interrupted by shutdown: run again after the next start
+                self._update(job_id, expect_status="running", status="queued")
+            raise
+        except Exception as exc:
+            # only while running: a cancel (here or through another worker) can land while
+            # the handler finishes, and must not be overwritten
+            self._update(job_id, expect_status="running", status="failed", error=repr(exc), finished_at=time.time())
+        else:
+            self._update(
+                job_id,
+                expect_status="running",
+                status="succeeded",
+                result_json=json.dumps(result, ensure_ascii=False, default=str),
+                finished_at=time.time(),
+            )
+        finally:
+            self._cancelled.discard(job_id)
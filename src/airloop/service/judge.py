@@ -0,0 +1,376 @@
+from __future__ import annotations
+
+import asyncio
+import hashlib
+import json
+import os
+import sqlite3
+import time
+from dataclasses import dataclass
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+from agents import Agent, OpenAIChatCompletionsModel, Runner
+from openai import AsyncOpenAI
+
+from airloop.agents.eval_agent import (
+    EVAL_PROMPT_VERSION,
+    BatchEvalScores,
+    EvalScores,
+    build_batch_eval_agent,
+    build_eval_agent,
+)
+from airloop.agents.manager import AgentManager
+from airloop.provider.cassette import with_cassette
+from airloop.provider.mock import MockModelProvider
+from airloop.instrumentation import UsageCollector, record_usage, use_usage
+from airloop.settings import AppConfig, EvalConfig
+
+
+def build_judge_model(app_config: Optional[AppConfig], agent_mgr: AgentManager):
+    """The dedicated eval LLM when one is configured, otherwise the agents' model."""
+    if app_config and app_config.eval_llm:
+        eval_cfg = app_config.eval_llm
+        if eval_cfg.provider == "mock":
+            if app_config.llm.provider == "mock" and eval_cfg.mock_script == app_config.llm.mock_script:
+                return agent_mgr.model
+            return MockModelProvider(eval_cfg.mock_script).get_model(eval_cfg.model_name)
+        client = AsyncOpenAI(base_url=eval_cfg.base_url, api_key=eval_cfg.api_key)
+        model = OpenAIChatCompletionsModel(model=eval_cfg.model_name, openai_client=client)
+        return with_cassette(model, app_config.cassette)
+    return agent_mgr.model
+
+
+def judge_model_name(model) -> str:
+    if isinstance(model, str):
+        return model
+    if hasattr(model, "model_name"):
+        return model.model_name
+    return str(getattr(model, "model", None) or type(model).__name__)
+
+
+@dataclass
+class Judgement:
+    scores: EvalScores
+    cached: bool = False
+
+
+class JudgeCache:
+    """
+    Persistent cache of judge results keyed by a hash of (prompt version, judge model,
+    judge_input), so unchanged rounds are not re-judged across runs.
+    """
+
+    def __init__(self, db_path: str):
+        self.db_path = db_path
+
+    def _open_db(self) -> sqlite3.Connection:
+        dir_name = os.path.dirname(self.db_path) or "."
+        os.makedirs(dir_name, exist_ok=True)
+        conn = sqlite3.connect(self.db_path, check_same_thread=False)
+        conn.row_factory = sqlite3.Row
+        return conn
+
+    def init_db(self) -> None:
+        conn = self._open_db()
+        conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS judge_cache (
+                key TEXT PRIMARY KEY,
+                prompt_version TEXT NOT NULL,
+                model TEXT NOT NULL,
+                scores_json TEXT NOT NULL,
+                hits INTEGER NOT NULL DEFAULT 0,
+                created_at REAL NOT NULL,
+                last_hit_at REAL
+            )
+            """
+        )
+        conn.commit()
+        conn.close()
+
+    @staticmethod
+    def make_key(prompt_version: str, model: str, judge_input: str) -> str:
+        payload = json.dumps([prompt_version, model, judge_input], ensure_ascii=False)
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def get_many(self, keys: Sequence[str]) -> Dict[str, EvalScores]:
+        if not keys:
+            return {}
+        conn = self._open_db()
+        found: Dict[str, EvalScores] = {}
+        unique = list(dict.fromkeys(keys))
+        for i in range(0, len(unique), 500):
+            chunk = unique[i:i + 500]
+            rows = conn.execute(
+                f"SELECT key, scores_json FROM judge_cache WHERE key IN ({','.join('?' * len(chunk))})",
+                chunk,
+            ).fetchall()
+            for row in rows:
+                found[row["key"]] = EvalScores.model_validate_json(row["scores_json"])
+        if found:
+            conn.executemany(
+                "UPDATE judge_cache SET hits = hits + 1, last_hit_at = ? WHERE key = ?",
+                [(time.time(), key) for key in found],
+            )
+            conn.commit()
+        conn.close()
+        return found
+
+    def put_many(self, prompt_version: str, model: str, entries: Sequence[Tuple[str, EvalScores]]) -> None:
+        if not entries:
+            return
+        now = time.time()
+        conn = self._open_db()
+        conn.executemany(
+            """
+            INSERT OR REPLACE INTO judge_cache (key, prompt_version, model, scores_json, hits, created_at)
+            VALUES (?, ?, ?, ?, 0, ?)
+            """,
+            [(key, prompt_version, model, scores.model_dump_json(), now) for key, scores in entries],
+        )
+        conn.commit()
+        conn.close()
+
+    def stats(self) -> Dict[str, Any]:
+        conn = self._open_db()
+        row = conn.execute(
+            "SELECT COUNT(*) AS entries, COALESCE(SUM(hits), 0) AS hits FROM judge_cache"
+        ).fetchone()
+        by_model = conn.execute(
+            """
+            SELECT prompt_version, model, COUNT(*) AS entries, COALESCE(SUM(hits), 0) AS hits
+            FROM judge_cache GROUP BY prompt_version, model
+            """
+        ).fetchall()
+        conn.close()
+        return {
+            "entries": row["entries"],
+            "hits": row["hits"],
+            "by_model": [dict(r) for r in by_model],
+        }
+
+
+def build_judge_cache(config: Optional[EvalConfig]) -> Optional[JudgeCache]:
+    if config is None or not config.judge_cache_path:
+        return None
+    cache = JudgeCache(config.judge_cache_path)
+    cache.init_db()
+    return cache
+
+
+class LLMJudge:
+    """
+    LLM judge shared by the evaluation services.
+
+    Every `judge_input` is scored into EvalScores. With a batch size above 1, up to that many
+    inputs are packed into a single call of the batch judge, so the judge instructions are sent
+    once per batch instead of once per round. A batch whose output does not parse is re-judged
+    one input at a time, and so are inputs missing from an otherwise valid batch.
+
+    With a JudgeCache, inputs already judged by the same prompt version and model are answered
+    from the cache and only the misses reach the LLM.
+    """
+
+    def __init__(self, model, run_config, config: Optional[EvalConfig] = None, cache: Optional[JudgeCache] = None):
+        config = config or EvalConfig()
+        self.agent: Agent = build_eval_agent(model)
+        self.batch_agent: Agent = build_batch_eval_agent(model)
+        self.run_config = run_config
+        self.model_name = judge_model_name(model)
+        self.cache = cache
+        self.batch_size = max(1, config.judge_batch_size)
+        self.batch_wait_s = max(0, config.judge_batch_wait_ms) / 1000
+        self.stats: Dict[str, int] = {
+            "judged": 0, "calls": 0, "batches": 0, "fallbacks": 0, "cache_hits": 0, "cache_misses": 0,
+        }
+        self._semaphore = asyncio.Semaphore(max(1, config.concurrency))
+        self._pending: List[Tuple[str, asyncio.Future]] = []
+        self._flush_handle: Optional[asyncio.TimerHandle] = None
+        self._flushing: set[asyncio.Task] = set()
+
+    def cache_key(self, judge_input: str) -> str:
+        return JudgeCache.make_key(EVAL_PROMPT_VERSION, self.model_name, judge_input)
+
+    def _cached(self, judge_inputs: Sequence[str]) -> Dict[str, EvalScores]:
+        if self.cache is None:
+            return {}
+        found = self.cache.get_many([self.cache_key(judge_input) for judge_input in judge_inputs])
+        hits = sum(1 for judge_input in judge_inputs if self.cache_key(judge_input) in found)
+        self.stats["cache_hits"] += hits
+        self.stats["cache_misses"] += len(judge_inputs) - hits
+        return found
+
+    def _store(self, judge_inputs: Sequence[str], scores: Sequence[EvalScores]) -> None:
+        if self.cache is not None:
+            entries = [(self.cache_key(i), s) for i, s in zip(judge_inputs, scores)]
+            self.cache.put_many(EVAL_PROMPT_VERSION, self.model_name, entries)
+
+    async def judge(self, judge_input: str, use_cache: bool = True) -> Judgement:
+        """
+        Score one input. Concurrent callers are micro-batched: a batch is sent once it is full
+        or `judge_batch_wait_ms` after its first input arrived.
+        """
+        if use_cache:
+            cached = self._cached([judge_input]).get(self.cache_key(judge_input))
+            if cached is not None:
+                return Judgement(cached, cached=True)
+        if self.batch_size <= 1:
+            scores = await self._judge_one(judge_input)
+        else:
+            loop = asyncio.get_running_loop()
+            future = loop.create_future()
+            self._pending.append((judge_input, future))
+            if len(self._pending) >= self.batch_size:
+                self._flush()
+            elif self._flush_handle is None:
+                self._flush_handle = loop.call_later(self.batch_wait_s, self._flush)
+            scores = await future
+        if use_cache:
+            self._store([judge_input], [scores])
+        return Judgement(scores)
+
+    async def judge_many(
+        self,
+        judge_inputs: Sequence[str],
+        batch_size: Optional[int] = None,
+        use_cache: bool = True,
+    ) -> List[Judgement]:
+        """
+        Score all inputs, in order. Cache hits are returned as is; the misses are judged in
+        chunks of `batch_size` (default: the configured size) and written back to the cache.
+        """
+        cached = self._cached(judge_inputs) if use_cache else {}
+        if use_cache:
+            # identical rounds within one request are judged once
+            misses = list(dict.fromkeys(i for i in judge_inputs if self.cache_key(i) not in cached))
+        else:
+            misses = list(judge_inputs)
+        size = max(1, batch_size or self.batch_size)
+        chunks = [misses[i:i + size] for i in range(0, len(misses), size)]
+        results = await asyncio.gather(*(self._judge_batch(chunk) for chunk in chunks))
+        fresh = [scores for chunk in results for scores in chunk]
+        if not use_cache:
+            return [Judgement(scores) for scores in fresh]
+        self._store(misses, fresh)
+
+        judged = {self.cache_key(i): scores for i, scores in zip(misses, fresh)}
+        out: List[Judgement] = []
+        for judge_input in judge_inputs:
+            key = self.cache_key(judge_input)
+            out.append(Judgement(cached[key], cached=True) if key in cached else Judgement(judged[key]))
+        return out
+
+    async def compare(self, judge_inputs: Sequence[str], batch_size: Optional[int] = None) -> Dict[str, Any]:
+        """
+        Judge the same inputs one by one and batched, and report the throughput gain and how
+        closely the batched scores agree with the single-round ones.
+        """
+        size = max(2, batch_size or self.batch_size)
+        single, single_stats = await self._timed(judge_inputs, 1)
+        batched, batched_stats = await self._timed(judge_inputs, size)
+        return {
+            "rounds": len(judge_inputs),
+            "batch_size": size,
+            "single": single_stats,
+            "batched": batched_stats,
+            "throughput_gain": (
+                round(single_stats["wall_time_s"] / batched_stats["wall_time_s"], 2)
+                if batched_stats["wall_time_s"] else None
+            ),
+            "agreement": score_agreement(single, batched),
+        }
+
+    async def _timed(self, judge_inputs: Sequence[str], batch_size: int) -> Tuple[List[EvalScores], Dict[str, Any]]:
+        fallbacks = self.stats["fallbacks"]
+        started = time.perf_counter()
+        with use_usage(UsageCollector()) as collector:
+            judgements = await self.judge_many(judge_inputs, batch_size=batch_size, use_cache=False)
+        scores = [j.scores for j in judgements]
+        wall_time = time.perf_counter() - started
+        usage = collector.as_dict()
+        return scores, {
+            "calls": usage["requests"],
+            "input_tokens": usage["input_tokens"],
+            "output_tokens": usage["output_tokens"],
+            "fallbacks": self.stats["fallbacks"] - fallbacks,
+            "wall_time_s": round(wall_time, 3),
+            "rounds_per_s": round(len(scores) / wall_time, 2) if wall_time else None,
+        }
+
+    def _flush(self) -> None:
+        if self._flush_handle is not None:
+            self._flush_handle.cancel()
+            self._flush_handle = None
+        batch, self._pending = self._pending, []
+        if not batch:
+            return
+        task = asyncio.create_task(self._resolve(batch))
+        self._flushing.add(task)
+        task.add_done_callback(self._flushing.discard)
+
+    async def _resolve(self, batch: List[Tuple[str, asyncio.Future]]) -> None:
+        try:
+            results = await self._judge_batch([judge_input for judge_input, _ in batch])
+        except Exception as exc:
+            for _, future in batch:
+                if not future.done():
+                    future.set_exception(exc)
+            return
+        for (_, future), scores in zip(batch, results):
+            if not future.done():
+                future.set_result(scores)
+
+    async def _judge_batch(self, judge_inputs: List[str]) -> List[EvalScores]:
+        if len(judge_inputs) == 1:
+            return [await self._judge_one(judge_inputs[0])]
+        batch_input = "\n".join(f"### Item {i}\n{judge_input}" for i, judge_input in enumerate(judge_inputs))
+        try:
+            result = await self._run(self.batch_agent, batch_input)
+            by_id = {item.id: item for item in result.final_output_as(BatchEvalScores).items}
+        except Exception:
+            # unparseable batch output: fall back to judging every round on its own
+            by_id = {}
+        self.stats["batches"] += 1
+        missing = [i for i in range(len(judge_inputs)) if i not in by_id]
+        self.stats["fallbacks"] += len(missing)
+        rejudged = await asyncio.gather(*(self._judge_one(judge_inputs[i]) for i in missing))
+        scores: Dict[int, EvalScores] = dict(zip(missing, rejudged))
+        for i, item in by_id.items():
+            if 0 <= i < len(judge_inputs):
+                scores[i] = EvalScores(**item.model_dump(exclude={"id"}))
+        self.stats["judged"] += len(judge_inputs) - len(missing)
+        return [scores[i] for i in range(len(judge_inputs))]
+
+    async def _judge_one(self, judge_input: str) -> EvalScores:
+        result = await self._run(self.agent, judge_input)
+        self.stats["judged"] += 1
+        return result.final_output_as(EvalScores)
+
+    async def _run(self, agent: Agent, judge_input: str):
+        async with self._semaphore:
+            self.stats["calls"] += 1
+            result = await Runner.run(
+                agent,
+                [{"role": "user", "content": judge_input}],
+                context=None,
+                run_config=self.run_config,
+            )
+        record_usage(agent.name, result.raw_responses, kind="judge")
+        return result
+
+
+def score_agreement(reference: Sequence[EvalScores], candidate: Sequence[EvalScores]) -> Dict[str, Any]:
+    """Per-dimension mean absolute difference and share of rounds within half a point."""
+    agreement: Dict[str, Any] = {}
+    pairs = [(a.model_dump(), b.model_dump()) for a, b in zip(reference, candidate)]
+    if not pairs:
+        return agreement
+    for name, value in pairs[0][0].items():
+        if not isinstance(value, (int, float)):
+            continue
+        diffs = [abs(float(a[name]) - float(b[name])) for a, b in pairs]
+        agreement[name] = {
+            "mean_abs_diff": round(sum(diffs) / len(diffs), 3),
+            "within_0_5": round(sum(1 for d in diffs if d <= 0.5) / len(diffs), 3),
+        }
+    return agreement
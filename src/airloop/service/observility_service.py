@@ -1,14 +1,16 @@
 from __future__ import annotations
 
-from typing import Any, Dict, Optional, List, Iterator
+from typing import TYPE_CHECKING, Any, Dict, Optional, List, Iterator
 from uuid import uuid4
 from contextlib import contextmanager
 import traceback
 import time
 
-from langfuse import Langfuse, get_client, LangfuseSpan
+if TYPE_CHECKING:
+    from langfuse import LangfuseSpan
 
 from airloop.settings import LangfuseConfig
+from airloop.instrumentation import phase
 
 
 
@@ -63,11 +65,8 @@ class NoopObservabilityService(ObservabilityService):
         context: Dict[str, Any],
         **kwargs
     ) -> Iterator[str]:
-        trace_id =uuid4().hex
-        try:
-            yield trace_id
-        finally:
-            return 
+        # no try/finally: exceptions from the round (e.g. a save conflict) must reach the caller
+        yield uuid4().hex
 
     def log_round(self, *, trace_id: str, messages: Any, events: Any, next_agent: str | None, context: Dict[str, Any], **kwargs) -> None:
         return None
@@ -96,6 +95,9 @@ class LangfuseObservabilityService(ObservabilityService):
     def __init__(self, config: LangfuseConfig):
         self.config = config
         self.enabled = True
+        # deferred: the SDK is heavy to import and unused unless Langfuse is configured
+        from langfuse import Langfuse
+
         self.client = Langfuse(
             public_key=config.public_key,
             secret_key=config.secret_key,
@@ -151,7 +153,8 @@ class LangfuseObservabilityService(ObservabilityService):
                 # 退出时：自动清理（不影响你 with 内的所有 log_xxx 功能）
                 # self._round_ctx.pop(trace_id, None)
                 try:
-                    self.client.flush()
+                    with phase("observability.flush"):
+                        self.client.flush()
                 except Exception:
                     traceback.print_exc()
     def log_round(
@@ -253,7 +256,7 @@ class LangfuseObservabilityService(ObservabilityService):
             root.update(
                 input=input_content,
                 output=messages,
-                metadata={"after_context": context, "next_agent": next_agent,"events": events},
+                metadata={"after_context": context, "next_agent": next_agent,"events": events, "usage": kwargs.get("usage")},
             )
 
         except Exception as e:
@@ -262,7 +265,7 @@ class LangfuseObservabilityService(ObservabilityService):
             traceback.print_exc()
             return
 
-    def log_guardrail_trip(self, *, trace_id: str, reason: str) -> None:
+    def log_guardrail_trip(self, *, trace_id: str, reason: str, **kwargs) -> None:
         ctx = self._round_ctx.get(trace_id)
         if not ctx:
             return
@@ -274,7 +277,7 @@ class LangfuseObservabilityService(ObservabilityService):
                 name="guardrail_trip",
                 # trace_context={"trace_id": trace_id, "parent_span_id": root_span_id},
             ) as sp:
-                sp.update(metadata={"reason": reason})
+                sp.update(metadata={"reason": reason, "usage": kwargs.get("usage")})
 
             # # v3 的 score 一般是 “current trace/span” 的概念：需要进入上下文
             # with self.client.start_as_current_observation(
@@ -1,22 +1,24 @@
 from __future__ import annotations
 
-from dataclasses import dataclass
-from typing import Any, List, Dict, Optional
+import asyncio
+import json
+import os
+import time
+from dataclasses import dataclass, fields
+from typing import Any, AsyncIterator, Callable, Iterable, Iterator, List, Dict, Optional, Set
 
 from pydantic import BaseModel
-from agents import Runner
 
 from airloop.agents.manager import AgentManager
 from airloop.agents.mock_manager import MockAgentManager
-from airloop.agents.eval_agent import build_eval_agent, EvalScores
+from airloop.agents.eval_agent import EvalScores
 from airloop.agents.role import AgentRole
 from airloop.domain.schema import ConversationState, InMemoryConversationStore
 from airloop.domain.context import AirlineAgentContext, create_initial_context
 from airloop.service.chat_service import ChatService
+from airloop.service.judge import LLMJudge, build_judge_cache, build_judge_model
 from airloop.service.observility_service import ObservabilityService
-from airloop.settings import AppConfig
-from openai import AsyncOpenAI
-from agents import OpenAIChatCompletionsModel
+from airloop.settings import AppConfig, EvalConfig
 
 
 @dataclass
@@ -28,12 +30,69 @@ class EvalCase:
     history: Optional[List[Dict[str, str]]] = None
 
 
+_EVAL_CASE_FIELDS = {f.name for f in fields(EvalCase)}
+
+
+def iter_eval_cases(path: str) -> Iterator[EvalCase]:
+    """
+    Stream EvalCase records from a JSONL file, one JSON object per line.
+    Blank lines and lines starting with '#' are skipped; case names must be unique.
+    """
+    with open(path, "r", encoding="utf-8") as f:
+        for line_no, line in enumerate(f, start=1):
+            line = line.strip()
+            if not line or line.startswith("#"):
+                continue
+            try:
+                record = json.loads(line)
+                yield EvalCase(**{k: v for k, v in record.items() if k in _EVAL_CASE_FIELDS})
+            except (ValueError, TypeError) as exc:
+                raise ValueError(f"{path}:{line_no}: invalid eval case ({exc})") from exc
+
+
+def load_completed_cases(output_path: str) -> Set[str]:
+    """
+    Names of cases that already have a successful result in a run's output file.
+    The append-only output file doubles as the run checkpoint; a torn last line from an
+    interrupted run is ignored and that case simply runs again.
+    """
+    completed: Set[str] = set()
+    if not os.path.exists(output_path):
+        return completed
+    # binary: a torn line can end inside a multi-byte UTF-8 sequence
+    with open(output_path, "rb") as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+            except ValueError:
+                continue
+            if record.get("case") and not record.get("error"):
+                completed.add(record["case"])
+    return completed
+
+
+def _terminate_torn_line(output_path: str) -> None:
+    """Append a newline when an interrupted run left the last line unterminated."""
+    if not os.path.exists(output_path):
+        return
+    with open(output_path, "rb+") as f:
+        f.seek(0, os.SEEK_END)
+        if f.tell():
+            f.seek(-1, os.SEEK_END)
+            if f.read(1) != b"\n":
+                f.write(b"\n")
+
+
 class OfflineEvalService:
     """
     Run offline evaluations:
       - Call existing chat service to get assistant reply.
       - Use a dedicated LLM judge (eval agent) to score multi-dimension JSON.
       - Push each dimension as a Langfuse score on a new trace.
+
+    Cases run concurrently, bounded by a semaphore shared by every run of this service,
+    with a per-case timeout and retries. With `evaluation.judge_batch_size` > 1 the judge
+    calls of concurrent cases are micro-batched into shared judge calls.
     """
 
     def __init__(
@@ -49,11 +108,21 @@ class OfflineEvalService:
         self.eval_agent_mgr = MockAgentManager(agent_mgr.model, agent_mgr.run_config)
         self.eval_chat_service = ChatService(
             self.eval_agent_mgr,
-            InMemoryConversationStore(),
+            # eval rounds run on throwaway states; keep the store small and per-service
+            InMemoryConversationStore(max_conversations=256),
             obs_service,
         )
-        self.eval_agent = self._build_eval_agent(app_config or None, agent_mgr)
         self.run_config = self.eval_agent_mgr.run_config
+        self.eval_config = (app_config.evaluation if app_config else None) or EvalConfig()
+        self.judge = LLMJudge(
+            build_judge_model(app_config, agent_mgr),
+            self.run_config,
+            self.eval_config,
+            cache=build_judge_cache(self.eval_config),
+        )
+        self.dataset_dir = self.eval_config.dataset_dir
+        self.output_dir = self.eval_config.output_dir
+        self._semaphore = asyncio.Semaphore(max(1, self.eval_config.concurrency))
 
         # Simple built-in cases; can be extended.
         self.default_cases: List[EvalCase] = [
@@ -80,80 +149,218 @@ class OfflineEvalService:
             ),
         ]
 
-    def _build_eval_agent(self, app_config: Optional[AppConfig], agent_mgr: AgentManager):
-        if app_config and app_config.eval_llm:
-            eval_cfg = app_config.eval_llm
-            client = AsyncOpenAI(base_url=eval_cfg.base_url, api_key=eval_cfg.api_key)
-            model = OpenAIChatCompletionsModel(model=eval_cfg.model_name, openai_client=client)
-            return build_eval_agent(model)
-        return build_eval_agent(agent_mgr.model)
-
     async def run_cases(self, cases: Optional[List[EvalCase]] = None, use_latest_only: bool = True) -> List[Dict[str, Any]]:
-        cases = cases or self.default_cases
+        report = await self.run_suite(cases)
+        return report["results"]
+
+    async def run_suite(
+        self,
+        cases: Optional[Iterable[EvalCase]] = None,
+        on_progress: Optional[Callable[[int, Dict[str, Any]], Any]] = None,
+    ) -> Dict[str, Any]:
+        """
+        Run all cases and return results in case order, together with the wall time and
+        the sequential baseline (sum of per-case durations).
+        """
+        started = time.perf_counter()
         results: List[Dict[str, Any]] = []
+        async for result in self.iter_results(cases):
+            results.append(result)
+            if on_progress is not None:
+                on_progress(len(results), result)
+        results.sort(key=lambda r: r["index"])
+        wall_time = time.perf_counter() - started
+        sequential_time = sum(r["duration_s"] for r in results)
+        return {
+            "results": results,
+            "total": len(results),
+            "failed": sum(1 for r in results if r.get("error")),
+            "concurrency": self.eval_config.concurrency,
+            "wall_time_s": round(wall_time, 3),
+            "sequential_time_s": round(sequential_time, 3),
+            "speedup": round(sequential_time / wall_time, 2) if wall_time else None,
+        }
+
+    def resolve_dataset(self, dataset: Optional[str] = None) -> Optional[str]:
+        """Map a dataset file name to a path inside the configured dataset directory."""
+        name = dataset or self.eval_config.dataset
+        if not name:
+            return None
+        path = os.path.join(self.dataset_dir, os.path.basename(name))
+        if not os.path.exists(path):
+            raise FileNotFoundError(f"Eval dataset {name} not found in {self.dataset_dir}")
+        return path
+
+    def output_path_for(self, dataset_path: str) -> str:
+        stem = os.path.splitext(os.path.basename(dataset_path))[0]
+        return os.path.join(self.output_dir, f"{stem}.results.jsonl")
+
+    async def run_dataset(
+        self,
+        dataset_path: str,
+        output_path: Optional[str] = None,
+        resume: bool = True,
+        on_progress: Optional[Callable[[int, Dict[str, Any]], Any]] = None,
+    ) -> Dict[str, Any]:
+        """
+        Stream a JSONL dataset through the evaluator, appending each result to `output_path`
+        as soon as it finishes. Only running aggregates are kept in memory. With `resume`,
+        cases that already have a successful result in the output file are neither re-run nor
+        re-judged.
+        """
+        output_path = output_path or self.output_path_for(dataset_path)
+        os.makedirs(os.path.dirname(output_path) or ".", exist_ok=True)
+        completed = load_completed_cases(output_path) if resume else set()
+        if not resume and os.path.exists(output_path):
+            os.remove(output_path)
+
+        started = time.perf_counter()
+        done = failed = skipped = 0
+        sequential_time = 0.0
+        score_sums: Dict[str, float] = {}
+
+        def cases() -> Iterator[EvalCase]:
+            nonlocal skipped
+            for case in iter_eval_cases(dataset_path):
+                if case.name in completed:
+                    skipped += 1
+                yield case
+
+        _terminate_torn_line(output_path)
+        with open(output_path, "a", encoding="utf-8") as out:
+            async for result in self.iter_results(cases(), skip=completed):
+                out.write(json.dumps(result, ensure_ascii=False, default=str) + "\n")
+                out.flush()
+                done += 1
+                sequential_time += result["duration_s"]
+                if result.get("error"):
+                    failed += 1
+                for name, value in (result.get("scores") or {}).items():
+                    if isinstance(value, (int, float)):
+                        score_sums[name] = score_sums.get(name, 0.0) + float(value)
+                if on_progress is not None:
+                    on_progress(done, result)
+
+        wall_time = time.perf_counter() - started
+        succeeded = done - failed
+        return {
+            "dataset": dataset_path,
+            "output": output_path,
+            "total": done,
+            "skipped": skipped,
+            "failed": failed,
+            "mean_scores": {k: round(v / succeeded, 3) for k, v in score_sums.items()} if succeeded else {},
+            "concurrency": self.eval_config.concurrency,
+            "wall_time_s": round(wall_time, 3),
+            "sequential_time_s": round(sequential_time, 3),
+            "speedup": round(sequential_time / wall_time, 2) if wall_time else None,
+        }
+
+    async def iter_results(
+        self,
+        cases: Optional[Iterable[EvalCase]] = None,
+        skip: Optional[Set[str]] = None,
+    ) -> AsyncIterator[Dict[str, Any]]:
+        """
+        Yield case results as they complete. Cases are pulled from `cases` lazily, so at most
+        `concurrency` cases are in flight (and in memory) at any time. Cases named in `skip`
+        keep their index but are not run.
+        """
+        cases = self.default_cases if cases is None else cases
+        window = max(1, self.eval_config.concurrency)
+        pending: set[asyncio.Task] = set()
+        try:
+            for index, case in enumerate(cases):
+                if skip and case.name in skip:
+                    continue
+                while len(pending) >= window:
+                    done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                    for task in done:
+                        yield task.result()
+                pending.add(asyncio.create_task(self._run_case_with_retries(index, case)))
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    yield task.result()
+        finally:
+            for task in pending:
+                task.cancel()
+
+    async def _run_case_with_retries(self, index: int, case: EvalCase) -> Dict[str, Any]:
+        cfg = self.eval_config
+        started: Optional[float] = None
+        attempts = 0
+        while True:
+            attempts += 1
+            async with self._semaphore:
+                started = started or time.perf_counter()
+                try:
+                    result = await asyncio.wait_for(self._run_case(case), timeout=cfg.case_timeout_s)
+                    break
+                except Exception as exc:
+                    if attempts > cfg.max_retries:
+                        error = "timeout" if isinstance(exc, asyncio.TimeoutError) else repr(exc)
+                        result = {"case": case.name, "error": error}
+                        break
+            # back off outside the semaphore so a failing case does not hold a slot while it waits
+            await asyncio.sleep(min(0.5 * 2 ** attempts, 10.0))
+        result.update(index=index, attempts=attempts, duration_s=round(time.perf_counter() - started, 3))
+        return result
+
+    async def _run_case(self, case: EvalCase) -> Dict[str, Any]:
+        # Build conversation state with optional context and history
+        ctx = create_initial_context()
+        if case.context:
+            for k, v in case.context.items():
+                if hasattr(ctx, k):
+                    setattr(ctx, k, v)
+
+        history = case.history or []
+        triage = self.eval_agent_mgr.get_agent_by_role(AgentRole.TRIAGE)
+        state = ConversationState(
+            state_id=f"offline-{case.name}",
+            input_items=list(history),
+            current_agent_name=triage.name,
+            context=ctx,
+        )
+
+        chat_res = await self.eval_chat_service.chat_with_state(state, case.user_message, persist=False)
+        assistant_outputs = [m.get("content", "") for m in (chat_res.get("messages") or [])]
+        assistant_text = "\n".join([t for t in assistant_outputs if t])
+        trace_id = chat_res.get("trace_id")
+
+        # Build judge input
+        judge_input = (
+            f"User message: {case.user_message}\n"
+            f"Assistant reply: {assistant_text}\n"
+        )
+        if case.expected:
+            judge_input += f"Expected behavior: {case.expected}\n"
+
+        # Reuse the trace from chat (per round) and push scores there
+        if not trace_id:
+            trace_id = f"offline-{case.name}"
+            
+        judgement = await self.judge.judge(judge_input)
+        scores = judgement.scores
+        eval_trace_id = self.obs_service.log_eval_trace(
+            conversation_id="NO Conversation",
+            agent_name="LLM Judge",
+            context={"case": case.name},
+            eval_input=judge_input,
+            eval_output=scores.model_dump(),
+        )
+        obs_ids = self._log_scores(trace_id, scores)
 
-        for case in cases:
-            # Build conversation state with optional context and history
-            ctx = create_initial_context()
-            if case.context:
-                for k, v in case.context.items():
-                    if hasattr(ctx, k):
-                        setattr(ctx, k, v)
-
-            history = case.history or []
-            triage = self.eval_agent_mgr.get_agent_by_role(AgentRole.TRIAGE)
-            state = ConversationState(
-                state_id=f"offline-{case.name}",
-                input_items=list(history),
-                current_agent_name=triage.name,
-                context=ctx,
-            )
-
-            chat_res = await self.eval_chat_service.chat_with_state(state, case.user_message, persist=False)
-            assistant_outputs = [m.get("content", "") for m in (chat_res.get("messages") or [])]
-            assistant_text = "\n".join([t for t in assistant_outputs if t])
-            trace_id = chat_res.get("trace_id")
-
-            # Build judge input
-            judge_input = (
-                f"User message: {case.user_message}\n"
-                f"Assistant reply: {assistant_text}\n"
-            )
-            if case.expected:
-                judge_input += f"Expected behavior: {case.expected}\n"
-
-            # Reuse the trace from chat (per round) and push scores there
-            if not trace_id:
-                trace_id = f"offline-{case.name}"
-                
-            judge_result = await Runner.run(
-                self.eval_agent,
-                [{"role": "user", "content": judge_input}],
-                context=None,
-                run_config=self.run_config,
-            )
-            scores = judge_result.final_output_as(EvalScores)
-            eval_trace_id = self.obs_service.log_eval_trace(
-                conversation_id="NO Conversation",
-                agent_name="LLM Judge",
-                context={"case": case.name},
-                eval_input=judge_input,
-                eval_output=scores.model_dump(),
-            )
-            obs_ids = self._log_scores(trace_id, scores)
-
-            results.append(
-                {
-                    "case": case.name,
-                    "trace_id": trace_id,
-                    "eval_trace_id": eval_trace_id,
-                    "scores": scores.model_dump(),
-                    "assistant_reply": assistant_text,
-                    "score_observation_ids": obs_ids,
-                }
-            )
-
-        return results
+        return {
+            "case": case.name,
+            "trace_id": trace_id,
+            "eval_trace_id": eval_trace_id,
+            "scores": scores.model_dump(),
+            "assistant_reply": assistant_text,
+            "score_observation_ids": obs_ids,
+            "judge_cached": judgement.cached,
+        }
 
     def _log_scores(self, trace_id: str, scores: EvalScores):
         metrics = scores.model_dump()
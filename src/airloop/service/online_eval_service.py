@@ -0,0 +1,169 @@
+from __future__ import annotations
+
+import asyncio
+import contextvars
+import logging
+import random
+import time
+from typing import Any, Dict, List, Optional
+
+from airloop.service.judge import LLMJudge
+from airloop.service.observility_service import ObservabilityService
+from airloop.instrumentation import UsageCollector, use_usage
+from airloop.service.usage_service import UsageService
+from airloop.settings import OnlineEvalConfig
+
+
+logger = logging.getLogger(__name__)
+
+
+class _RateLimiter:
+    """Spaces acquisitions at least 60 / max_per_minute seconds apart."""
+
+    def __init__(self, max_per_minute: int):
+        self.interval = 60.0 / max_per_minute if max_per_minute > 0 else 0.0
+        self._next_at = 0.0
+        self._lock = asyncio.Lock()
+
+    async def acquire(self) -> None:
+        if not self.interval:
+            return
+        async with self._lock:
+            now = time.monotonic()
+            wait = self._next_at - now
+            self._next_at = max(now, self._next_at) + self.interval
+        if wait > 0:
+            await asyncio.sleep(wait)
+
+
+class OnlineEvalService:
+    """
+    Sampled online evaluation of live traffic.
+
+    ChatService hands every completed round to `submit`, which keeps a `sample_rate` fraction
+    and queues it without awaiting anything. Background workers (`concurrency` of them, rate
+    capped at `max_per_minute` judge calls) score the queued rounds with the LLM judge and
+    write the scores to the round's trace_id, prefixed with the configured evaluator name.
+    When the queue is full, new samples are dropped rather than slowing down the chat path.
+    The judge's token usage goes to the usage ledger as kind "judge", against the round.
+    """
+
+    def __init__(
+        self,
+        judge: LLMJudge,
+        obs_service: ObservabilityService,
+        config: Optional[OnlineEvalConfig] = None,
+        usage_svc: Optional[UsageService] = None,
+    ):
+        self.judge = judge
+        self.obs = obs_service
+        self.config = config or OnlineEvalConfig()
+        self.usage_svc = usage_svc
+        self.stats: Dict[str, int] = {"seen": 0, "sampled": 0, "dropped": 0, "judged": 0, "failed": 0}
+        self._queue: Optional[asyncio.Queue] = None
+        self._workers: List[asyncio.Task] = []
+        self._limiter = _RateLimiter(self.config.max_per_minute)
+
+    def submit(
+        self,
+        *,
+        trace_id: str,
+        conversation_id: str,
+        round_id: int,
+        user_message: str,
+        messages: List[Dict[str, Any]],
+        context: Any,
+        user_id: Optional[int] = None,
+    ) -> bool:
+        """Sample a completed round for judging; returns whether it was queued."""
+        self.stats["seen"] += 1
+        if not trace_id or random.random() >= self.config.sample_rate:
+            return False
+        self._ensure_workers()
+        assistant_text = "\n".join(m.get("content", "") for m in messages if m.get("content"))
+        judge_input = (
+            f"User message: {user_message}\n"
+            f"Assistant reply: {assistant_text}\n"
+            f"Context: {context}"
+        )
+        try:
+            self._queue.put_nowait((trace_id, conversation_id, round_id, user_id, judge_input))
+        except asyncio.QueueFull:
+            self.stats["dropped"] += 1
+            return False
+        self.stats["sampled"] += 1
+        return True
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {
+            "enabled": True,
+            "name": self.config.name,
+            "sample_rate": self.config.sample_rate,
+            "concurrency": self.config.concurrency,
+            "max_per_minute": self.config.max_per_minute,
+            "queued": self._queue.qsize() if self._queue is not None else 0,
+            **self.stats,
+        }
+
+    async def shutdown(self) -> None:
+        for task in self._workers:
+            task.cancel()
+        await asyncio.gather(*self._workers, return_exceptions=True)
+        self._workers = []
+
+    def _ensure_workers(self) -> None:
+        if self._queue is None:
+            self._queue = asyncio.Queue(maxsize=max(1, self.config.queue_size))
+        if not self._workers:
+            # started from inside a chat request: a fresh context keeps the workers from holding
+            # on to that request's timer, usage collector and guardrail checks
+            self._workers = [
+                asyncio.create_task(self._worker(), context=contextvars.Context())
+                for _ in range(max(1, self.config.concurrency))
+            ]
+
+    async def _worker(self) -> None:
+        while True:
+            item = await self._queue.get()
+            try:
+                await self._limiter.acquire()
+                await self._evaluate(*item)
+                self.stats["judged"] += 1
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                self.stats["failed"] += 1
+                logger.exception("Online evaluation failed")
+            finally:
+                self._queue.task_done()
+
+    async def _evaluate(
+        self, trace_id: str, conversation_id: str, round_id: int, user_id: Optional[int], judge_input: str
+    ) -> None:
+        with use_usage(UsageCollector()) as collector:
+            judgement = await self.judge.judge(judge_input, use_cache=False)
+        if self.usage_svc is not None:
+            self.usage_svc.record_round(
+                conversation_id=conversation_id,
+                user_id=user_id,
+                round_id=round_id,
+                trace_id=trace_id,
+                usage=collector.as_dict(self.usage_svc.config),
+            )
+        self.obs.log_eval_trace(
+            conversation_id=conversation_id,
+            agent_name=self.config.name,
+            context={"round": round_id, "trace_id": trace_id},
+            eval_input=judge_input,
+            eval_output=judgement.scores.model_dump(),
+        )
+        metrics = judgement.scores.model_dump()
+        reasoning = metrics.pop("reasoning", None)
+        for name, value in metrics.items():
+            if isinstance(value, (int, float)):
+                self.obs.score(
+                    trace_id=trace_id,
+                    name=f"{self.config.name}.{name}",
+                    value=float(value),
+                    comment=reasoning,
+                )
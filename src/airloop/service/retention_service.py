@@ -0,0 +1,124 @@
+from __future__ import annotations
+
+import asyncio
+import logging
+import time
+from typing import Any, Callable, Dict, Optional
+
+from airloop.domain.schema import PersistentConversationStore
+from airloop.service.job_service import JobService
+from airloop.settings import RetentionConfig
+
+
+logger = logging.getLogger(__name__)
+
+
+class RetentionService:
+    """
+    Moves conversations idle for `idle_days` out of the hot sqlite store into the compressed
+    archive (see PersistentConversationStore.archive_one), then returns the freed pages to
+    the OS with incremental VACUUM.
+
+    A pass runs as a "retention" background job, so it shows up in /api/jobs with progress
+    and its report (conversations moved, bytes archived, bytes reclaimed) as the result. The
+    job runner worker submits one every `interval_s` unless one is already pending.
+    """
+
+    def __init__(self, store: PersistentConversationStore, jobs: JobService, config: Optional[RetentionConfig] = None):
+        self.store = store
+        self.jobs = jobs
+        self.config = config or RetentionConfig()
+        self.last_report: Optional[Dict[str, Any]] = None
+        self._scheduler: Optional[asyncio.Task] = None
+
+    async def run_pass(
+        self,
+        on_progress: Optional[Callable[[Dict[str, Any]], None]] = None,
+        convert_vacuum: bool = False,
+    ) -> Dict[str, Any]:
+        """
+        `convert_vacuum` switches a database created without auto_vacuum=INCREMENTAL over
+        with one full VACUUM (see PersistentConversationStore.vacuum); without it such a
+        database keeps its free pages.
+        """
+        cfg = self.config
+        started = time.time()
+        cutoff = started - cfg.idle_days * 86400
+        bytes_before = self.store.file_bytes()
+        archived = skipped = archived_bytes = 0
+        # hydration, compression, commits and VACUUM run in a thread on connections of their own
+        worker = await asyncio.to_thread(self.store.sibling)
+        try:
+            while archived + skipped < cfg.max_per_pass:
+                limit = min(cfg.batch_size, cfg.max_per_pass - archived - skipped)
+                batch = await asyncio.to_thread(worker.idle_ids, cutoff, limit)
+                if not batch:
+                    break
+                sizes = await asyncio.to_thread(lambda ids: [worker.archive_one(cid) for cid in ids], batch)
+                for size in sizes:
+                    if size is None:
+                        skipped += 1
+                    else:
+                        archived += 1
+                        archived_bytes += size
+                if on_progress is not None:
+                    on_progress({"archived": archived, "skipped": skipped})
+                if skipped and not archived:
+                    break
+            vacuum = await asyncio.to_thread(worker.vacuum, cfg.vacuum_pages, convert_vacuum)
+        finally:
+            await asyncio.to_thread(worker.close)
+        bytes_after = self.store.file_bytes()
+        result = {
+            "cutoff": cutoff,
+            "archived": archived,
+            "skipped": skipped,
+            "archived_bytes": archived_bytes,
+            "archive_total": self.store.archived_count(),
+            "bytes_before": bytes_before,
+            "bytes_after": bytes_after,
+            "reclaimed_bytes": bytes_before - bytes_after,
+            "vacuum": vacuum,
+            "duration_s": round(time.time() - started, 3),
+        }
+        self.last_report = result
+        logger.info(
+            "retention pass archived %s conversations, reclaimed %.1f MB",
+            archived, result["reclaimed_bytes"] / 2**20,
+        )
+        if not vacuum["incremental"]:
+            logger.warning(
+                "%s was created without auto_vacuum=INCREMENTAL, so archived space is not returned to the OS; "
+                "run one retention pass with convert_vacuum (a full VACUUM) in a quiet period",
+                self.store.db_path,
+            )
+        return result
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "enabled": self.config.enabled,
+            "idle_days": self.config.idle_days,
+            "archived": self.store.archived_count(),
+            "hot_bytes": self.store.file_bytes(),
+            "last_report": self.last_report,
+        }
+
+    def start(self) -> None:
+        if self._scheduler is None and self.config.interval_s > 0:
+            self._scheduler = asyncio.create_task(self._schedule())
+
+    async def shutdown(self) -> None:
+        if self._scheduler is not None:
+            self._scheduler.cancel()
+            await asyncio.gather(self._scheduler, return_exceptions=True)
+            self._scheduler = None
+
+    async def _schedule(self) -> None:
+        while True:
+            try:
+                pending = self.jobs.list("queued") + self.jobs.list("running")
+                if not any(job["kind"] == "retention" for job in pending):
+                    self.jobs.submit("retention")
+            except Exception:
+                logger.exception("could not schedule a retention pass")
+            await asyncio.sleep(self.config.interval_s)
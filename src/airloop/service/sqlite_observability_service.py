@@ -0,0 +1,422 @@
+from __future__ import annotations
+
+from typing import Any, Dict, Optional, List, Iterator
+from uuid import uuid4
+from contextlib import contextmanager
+import atexit
+import json
+import os
+import sqlite3
+import threading
+import time
+import traceback
+
+from pydantic import BaseModel
+
+from airloop.settings import TraceStoreConfig
+from airloop.service.observility_service import ObservabilityService
+from airloop.instrumentation import current_timer
+
+
+_SPAN_KEYS = ("name", "agent", "start_ms", "dur_ms")
+
+
+def _now_ms() -> float:
+    return time.time() * 1000
+
+
+def _json_default(value: Any) -> Any:
+    if isinstance(value, BaseModel):
+        return value.model_dump(mode="json", exclude_none=True)
+    return str(value)
+
+
+def _to_json(value: Any) -> Optional[str]:
+    if value is None:
+        return None
+    return json.dumps(value, default=_json_default, ensure_ascii=False)
+
+
+class SqliteObservabilityService(ObservabilityService):
+    """
+    Local stand-in for Langfuse: traces, observations and scores go to an indexed sqlite file.
+    Rows are buffered in memory and a background thread writes them with executemany once
+    `batch_size` rows are pending or every `flush_interval_s`, so the request path only pays
+    for a list append.
+    """
+
+    _TABLES = {
+        "traces": (
+            "INSERT OR REPLACE INTO traces (trace_id, name, conversation_id, round_id, agent_name, status, "
+            "start_ms, end_ms, duration_ms, input_json, output_json, metadata_json, total_tokens, cost) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)"
+        ),
+        "observations": (
+            "INSERT OR REPLACE INTO observations (id, trace_id, type, name, agent, status, start_ms, duration_ms, "
+            "input_json, output_json, metadata_json) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)"
+        ),
+        "scores": (
+            "INSERT INTO scores (id, trace_id, name, value, comment, created_ms) VALUES (?, ?, ?, ?, ?, ?)"
+        ),
+    }
+
+    def __init__(self, config: TraceStoreConfig):
+        self.config = config
+        self.enabled = True
+        dir_name = os.path.dirname(config.path) or "."
+        os.makedirs(dir_name, exist_ok=True)
+        self._conn = sqlite3.connect(config.path, check_same_thread=False)
+        # _lock guards the buffer, _db_lock the connection (flushes and queries)
+        self._lock = threading.Lock()
+        self._db_lock = threading.Lock()
+        self._wake = threading.Event()
+        self._closed = False
+        self._pending: Dict[str, List[tuple]] = {name: [] for name in self._TABLES}
+        self._pending_count = 0
+        self._last_flush = time.monotonic()
+        self._round_ctx: Dict[str, Dict[str, Any]] = {}
+        self._ensure_schema()
+        self._flusher = threading.Thread(target=self._flush_loop, name="trace-store-flush", daemon=True)
+        self._flusher.start()
+        atexit.register(self.close)
+
+    def _ensure_schema(self):
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript(
+            """
+            CREATE TABLE IF NOT EXISTS traces (
+                trace_id TEXT PRIMARY KEY,
+                name TEXT NOT NULL,
+                conversation_id TEXT,
+                round_id INTEGER,
+                agent_name TEXT,
+                status TEXT,
+                start_ms REAL,
+                end_ms REAL,
+                duration_ms REAL,
+                input_json TEXT,
+                output_json TEXT,
+                metadata_json TEXT,
+                total_tokens INTEGER,
+                cost REAL
+            );
+            CREATE INDEX IF NOT EXISTS idx_traces_conversation ON traces (conversation_id, round_id);
+            CREATE INDEX IF NOT EXISTS idx_traces_agent_duration ON traces (name, agent_name, duration_ms);
+            CREATE INDEX IF NOT EXISTS idx_traces_start ON traces (start_ms);
+
+            CREATE TABLE IF NOT EXISTS observations (
+                id TEXT PRIMARY KEY,
+                trace_id TEXT NOT NULL,
+                type TEXT NOT NULL,
+                name TEXT NOT NULL,
+                agent TEXT,
+                status TEXT,
+                start_ms REAL,
+                duration_ms REAL,
+                input_json TEXT,
+                output_json TEXT,
+                metadata_json TEXT
+            );
+            CREATE INDEX IF NOT EXISTS idx_observations_trace ON observations (trace_id);
+            CREATE INDEX IF NOT EXISTS idx_observations_type_name ON observations (type, name, status);
+
+            CREATE TABLE IF NOT EXISTS scores (
+                id TEXT PRIMARY KEY,
+                trace_id TEXT NOT NULL,
+                name TEXT NOT NULL,
+                value REAL NOT NULL,
+                comment TEXT,
+                created_ms REAL NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS idx_scores_name ON scores (name, value);
+            CREATE INDEX IF NOT EXISTS idx_scores_trace ON scores (trace_id);
+            """
+        )
+        columns = [row[1] for row in self._conn.execute("PRAGMA table_info(traces)").fetchall()]
+        if "total_tokens" not in columns:
+            self._conn.execute("ALTER TABLE traces ADD COLUMN total_tokens INTEGER")
+        if "cost" not in columns:
+            self._conn.execute("ALTER TABLE traces ADD COLUMN cost REAL")
+        self._conn.commit()
+
+    # ------------------------------------------------------------------
+    # buffering
+    # ------------------------------------------------------------------
+    def _enqueue(self, table: str, row: tuple) -> None:
+        with self._lock:
+            self._pending[table].append(row)
+            self._pending_count += 1
+            full = self._pending_count >= self.config.batch_size
+        if full:
+            self._wake.set()
+
+    def _flush_loop(self) -> None:
+        while not self._closed:
+            self._wake.wait(self.config.flush_interval_s)
+            self._wake.clear()
+            self.flush()
+
+    def flush(self) -> None:
+        with self._lock:
+            self._last_flush = time.monotonic()
+            if not self._pending_count:
+                return
+            pending = self._pending
+            self._pending = {name: [] for name in self._TABLES}
+            self._pending_count = 0
+        with self._db_lock:
+            try:
+                with self._conn:
+                    for table, rows in pending.items():
+                        if rows:
+                            self._conn.executemany(self._TABLES[table], rows)
+            except Exception:
+                traceback.print_exc()
+
+    def close(self) -> None:
+        self._closed = True
+        self._wake.set()
+        if self._flusher.is_alive() and self._flusher is not threading.current_thread():
+            self._flusher.join(timeout=5)
+        self.flush()
+
+    def _observation(
+        self,
+        *,
+        trace_id: str,
+        type: str,
+        name: str,
+        agent: Optional[str] = None,
+        status: Optional[str] = None,
+        start_ms: Optional[float] = None,
+        duration_ms: Optional[float] = None,
+        input: Any = None,
+        output: Any = None,
+        metadata: Any = None,
+    ) -> str:
+        obs_id = uuid4().hex
+        self._enqueue(
+            "observations",
+            (
+                obs_id, trace_id, type, name, agent, status,
+                start_ms if start_ms is not None else _now_ms(), duration_ms,
+                _to_json(input), _to_json(output), _to_json(metadata),
+            ),
+        )
+        return obs_id
+
+    # ------------------------------------------------------------------
+    # ObservabilityService
+    # ------------------------------------------------------------------
+    @contextmanager
+    def start_round_trace(
+        self,
+        *,
+        conversation_id: str,
+        round_id: int,
+        input_messages: str,
+        agent_name: str,
+        context: Dict[str, Any],
+        **kwargs,
+    ) -> Iterator[str]:
+        trace_id = uuid4().hex
+        start_ms = _now_ms()
+        start = time.perf_counter()
+        timer = current_timer()
+        span_offset = len(timer.spans) if timer is not None else 0
+        ctx = self._round_ctx[trace_id] = {
+            "status": "ok",
+            "metadata": {"begin_context": context},
+        }
+        try:
+            yield trace_id
+        except BaseException:
+            ctx["status"] = "error"
+            raise
+        finally:
+            self._round_ctx.pop(trace_id, None)
+            usage = ctx.get("usage") or {}
+            duration_ms = (time.perf_counter() - start) * 1000
+            if timer is not None:
+                # per-phase timings (model calls, tools, guardrails) become child observations
+                for span in timer.spans[span_offset:]:
+                    self._observation(
+                        trace_id=trace_id,
+                        type="phase",
+                        name=span["name"],
+                        agent=span.get("agent"),
+                        start_ms=start_ms + span["start_ms"],
+                        duration_ms=span["dur_ms"],
+                        metadata={k: v for k, v in span.items() if k not in _SPAN_KEYS} or None,
+                    )
+            self._enqueue(
+                "traces",
+                (
+                    trace_id, "chat_round", conversation_id, round_id, agent_name, ctx["status"],
+                    start_ms, start_ms + duration_ms, duration_ms,
+                    _to_json(ctx.get("input", input_messages)), _to_json(ctx.get("output")), _to_json(ctx["metadata"]),
+                    usage.get("total_tokens"), usage.get("cost"),
+                ),
+            )
+
+    def log_round(
+        self,
+        *,
+        conversation_id: str,
+        trace_id: str,
+        messages: Any,
+        events: List[Dict[str, Any]],
+        next_agent: Optional[str],
+        context: Dict[str, Any],
+        input_content: List[Dict[str, str]],
+        **kwargs,
+    ) -> None:
+        try:
+            for e in (events or []):
+                etype = e.get("type") or "unknown"
+                e["observation_id"] = self._observation(
+                    trace_id=trace_id,
+                    type="event",
+                    name=f"event:{etype}",
+                    agent=e.get("agent"),
+                    start_ms=e.get("timestamp"),
+                    output={"content": e.get("content")},
+                    metadata={"event_id": e.get("id"), "metadata": e.get("metadata")},
+                )
+            self._log_guardrail_checks(trace_id, kwargs.get("guardrails"))
+            ctx = self._round_ctx.get(trace_id)
+            if ctx is not None:
+                ctx["input"] = input_content
+                ctx["output"] = messages
+                ctx["metadata"].update({"after_context": context, "next_agent": next_agent, "usage": kwargs.get("usage")})
+                ctx["usage"] = kwargs.get("usage")
+        except Exception:
+            traceback.print_exc()
+
+    def _log_guardrail_checks(self, trace_id: str, checks: Optional[List[Dict[str, Any]]]) -> None:
+        for check in checks or []:
+            self._observation(
+                trace_id=trace_id,
+                type="guardrail",
+                name=check.get("name", "guardrail"),
+                status="passed" if check.get("passed") else "tripped",
+                start_ms=check.get("timestamp"),
+                input=check.get("input"),
+                output={"reasoning": check.get("reasoning")},
+            )
+
+    def log_guardrail_trip(self, *, trace_id: str, reason: str, **kwargs) -> None:
+        try:
+            self._log_guardrail_checks(trace_id, kwargs.get("guardrails"))
+            self._observation(trace_id=trace_id, type="guardrail_trip", name="guardrail_trip", metadata={"reason": reason})
+            ctx = self._round_ctx.get(trace_id)
+            if ctx is not None:
+                ctx["status"] = "guardrail_tripped"
+                ctx["usage"] = kwargs.get("usage")
+        except Exception:
+            traceback.print_exc()
+
+    def score(
+        self,
+        *,
+        trace_id: str,
+        name: str,
+        value: float,
+        comment: str | None = None,
+        **kwargs,
+    ) -> None:
+        self._enqueue("scores", (uuid4().hex, trace_id, name, float(value), comment, _now_ms()))
+
+    def log_eval_trace(
+        self,
+        *,
+        conversation_id: str,
+        agent_name: str,
+        context: Dict[str, Any],
+        eval_input: Any,
+        eval_output: Any,
+    ) -> str:
+        trace_id = uuid4().hex
+        now = _now_ms()
+        self._enqueue(
+            "traces",
+            (
+                trace_id, "local_evaluator", conversation_id, None, agent_name, "ok",
+                now, now, 0.0,
+                _to_json({"eval_input": eval_input}), _to_json({"eval_output": eval_output}), _to_json(context),
+                None, None,
+            ),
+        )
+        return trace_id
+
+    # ------------------------------------------------------------------
+    # queries
+    # ------------------------------------------------------------------
+    def _percentile(self, agent_name: str, count: int, q: float, since_ms: float) -> Optional[float]:
+        if not count:
+            return None
+        offset = min(count - 1, int(q * count))
+        row = self._conn.execute(
+            "SELECT duration_ms FROM traces WHERE name = 'chat_round' AND agent_name = ? AND start_ms >= ? "
+            "ORDER BY duration_ms LIMIT 1 OFFSET ?",
+            (agent_name, since_ms, offset),
+        ).fetchone()
+        return row[0] if row else None
+
+    def agent_latency(self, since_ms: float = 0.0) -> List[Dict[str, Any]]:
+        self.flush()
+        with self._db_lock:
+            rows = self._conn.execute(
+                "SELECT agent_name, COUNT(*), AVG(duration_ms), MAX(duration_ms), "
+                "SUM(CASE WHEN status = 'error' THEN 1 ELSE 0 END) "
+                "FROM traces WHERE name = 'chat_round' AND start_ms >= ? GROUP BY agent_name",
+                (since_ms,),
+            ).fetchall()
+            model_rows = self._conn.execute(
+                "SELECT o.agent, COUNT(*), AVG(o.duration_ms) FROM observations o "
+                "JOIN traces t ON t.trace_id = o.trace_id "
+                "WHERE o.type = 'phase' AND o.name = 'model' AND t.start_ms >= ? GROUP BY o.agent",
+                (since_ms,),
+            ).fetchall()
+            model_stats = {agent: {"calls": calls, "avg_ms": avg} for agent, calls, avg in model_rows}
+            return [
+                {
+                    "agent": agent,
+                    "rounds": count,
+                    "errors": errors,
+                    "avg_ms": avg_ms,
+                    "p50_ms": self._percentile(agent, count, 0.50, since_ms),
+                    "p95_ms": self._percentile(agent, count, 0.95, since_ms),
+                    "max_ms": max_ms,
+                    "model_calls": model_stats.get(agent, {}).get("calls", 0),
+                    "model_avg_ms": model_stats.get(agent, {}).get("avg_ms"),
+                }
+                for agent, count, avg_ms, max_ms, errors in rows
+            ]
+
+    def guardrail_trip_rate(self, since_ms: float = 0.0) -> List[Dict[str, Any]]:
+        self.flush()
+        with self._db_lock:
+            rows = self._conn.execute(
+                "SELECT name, COUNT(*), SUM(CASE WHEN status = 'tripped' THEN 1 ELSE 0 END) "
+                "FROM observations WHERE type = 'guardrail' AND start_ms >= ? GROUP BY name",
+                (since_ms,),
+            ).fetchall()
+        return [
+            {"guardrail": name, "checks": total, "trips": trips, "trip_rate": trips / total if total else 0.0}
+            for name, total, trips in rows
+        ]
+
+    def score_aggregates(self, since_ms: float = 0.0) -> List[Dict[str, Any]]:
+        self.flush()
+        with self._db_lock:
+            rows = self._conn.execute(
+                "SELECT name, COUNT(*), AVG(value), MIN(value), MAX(value) "
+                "FROM scores WHERE created_ms >= ? GROUP BY name ORDER BY name",
+                (since_ms,),
+            ).fetchall()
+        return [
+            {"name": name, "count": count, "avg": avg, "min": min_v, "max": max_v}
+            for name, count, avg, min_v, max_v in rows
+        ]
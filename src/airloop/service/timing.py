@@ -0,0 +1,66 @@
+from __future__ import annotations
+
+from typing import Any, Dict, List
+
+from agents import RunHooks
+
+from airloop.instrumentation import current_timer
+
+
+def format_server_timing(summary: List[Dict[str, Any]]) -> str:
+    """Render a `PhaseTimer.summary()` as a Server-Timing header value."""
+    parts = []
+    for entry in summary:
+        part = f"{_metric_name(entry['name'])};dur={entry['dur_ms']:.1f}"
+        if entry.get("count", 1) > 1:
+            part += f';desc="x{entry["count"]}"'
+        parts.append(part)
+    return ", ".join(parts)
+
+
+def _metric_name(name: str) -> str:
+    # Server-Timing metric names must be HTTP tokens
+    return "".join(ch if ch.isalnum() or ch in "-_." else "_" for ch in name)
+
+
+def _tool_key(context: Any, tool: Any) -> tuple:
+    # newer SDKs hand tool hooks a ToolContext carrying the call id, which keeps
+    # parallel calls of the same tool apart
+    return ("tool", getattr(tool, "name", ""), getattr(context, "tool_call_id", None))
+
+
+class PhaseTimingHooks(RunHooks):
+    """Run hooks that time every model call and tool call of a Runner.run."""
+
+    async def on_llm_start(self, context, agent, system_prompt, input_items) -> None:
+        timer = current_timer()
+        if timer is not None:
+            timer.begin(("llm", agent.name))
+
+    async def on_llm_end(self, context, agent, response) -> None:
+        timer = current_timer()
+        if timer is not None:
+            usage = getattr(response, "usage", None)
+            timer.end(
+                ("llm", agent.name),
+                "model",
+                agent=agent.name,
+                input_tokens=getattr(usage, "input_tokens", None),
+                output_tokens=getattr(usage, "output_tokens", None),
+            )
+
+    async def on_tool_start(self, context, agent, tool) -> None:
+        timer = current_timer()
+        if timer is not None:
+            timer.begin(_tool_key(context, tool))
+
+    async def on_tool_end(self, context, agent, tool, result) -> None:
+        timer = current_timer()
+        if timer is not None:
+            tool_name = getattr(tool, "name", "")
+            timer.end(
+                _tool_key(context, tool),
+                f"tool.{tool_name}",
+                agent=agent.name,
+                arguments=getattr(context, "tool_arguments", None),
+            )
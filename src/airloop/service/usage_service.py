@@ -0,0 +1,159 @@
+from __future__ import annotations
+
+from typing import Any, Dict, List, Optional
+import os
+import sqlite3
+import time
+
+from airloop.instrumentation import record_usage
+from airloop.settings import UsageConfig
+from airloop.service.timing import PhaseTimingHooks
+
+
+class UsageTrackingHooks(PhaseTimingHooks):
+    """Phase timing hooks that also attribute each model response's usage to its agent."""
+
+    async def on_llm_end(self, context, agent, response) -> None:
+        await super().on_llm_end(context, agent, response)
+        record_usage(agent.name, [response])
+
+
+class UsageService:
+    """
+    Sqlite ledger of per-round model usage. Aggregates usage per conversation, user and agent
+    and checks the optional per-conversation / per-user token budgets.
+    """
+
+    def __init__(self, db_path: str, config: Optional[UsageConfig] = None):
+        self.db_path = db_path
+        self.config = config or UsageConfig()
+
+    def _open_db(self) -> sqlite3.Connection:
+        dir_name = os.path.dirname(self.db_path) or "."
+        os.makedirs(dir_name, exist_ok=True)
+        conn = sqlite3.connect(self.db_path, check_same_thread=False)
+        conn.row_factory = sqlite3.Row
+        return conn
+
+    def init_db(self) -> None:
+        conn = self._open_db()
+        conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS usage_ledger (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                conversation_id TEXT NOT NULL,
+                user_id INTEGER,
+                round_id INTEGER,
+                trace_id TEXT,
+                agent TEXT NOT NULL,
+                kind TEXT NOT NULL,
+                requests INTEGER NOT NULL DEFAULT 0,
+                input_tokens INTEGER NOT NULL DEFAULT 0,
+                output_tokens INTEGER NOT NULL DEFAULT 0,
+                total_tokens INTEGER NOT NULL DEFAULT 0,
+                cost REAL NOT NULL DEFAULT 0,
+                created_at REAL NOT NULL
+            )
+            """
+        )
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_usage_conversation ON usage_ledger (conversation_id)")
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_usage_user ON usage_ledger (user_id, created_at)")
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_usage_agent ON usage_ledger (agent)")
+        conn.commit()
+        conn.close()
+
+    def record_round(
+        self,
+        *,
+        conversation_id: str,
+        user_id: Optional[int],
+        round_id: int,
+        trace_id: Optional[str],
+        usage: Dict[str, Any],
+    ) -> None:
+        rows = [
+            (
+                conversation_id, user_id, round_id, trace_id, agent, entry.get("kind", "agent"),
+                entry["requests"], entry["input_tokens"], entry["output_tokens"], entry["total_tokens"],
+                entry.get("cost", 0.0), time.time(),
+            )
+            for agent, entry in (usage.get("by_agent") or {}).items()
+        ]
+        if not rows:
+            return
+        conn = self._open_db()
+        conn.executemany(
+            """
+            INSERT INTO usage_ledger (conversation_id, user_id, round_id, trace_id, agent, kind,
+                                      requests, input_tokens, output_tokens, total_tokens, cost, created_at)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+            """,
+            rows,
+        )
+        conn.commit()
+        conn.close()
+
+    def _total_tokens(self, column: str, value: Any) -> int:
+        conn = self._open_db()
+        row = conn.execute(
+            # judge calls (online evaluation) are ours, not the user's
+            f"SELECT COALESCE(SUM(total_tokens), 0) FROM usage_ledger WHERE {column} = ? AND kind != 'judge'",
+            (value,),
+        ).fetchone()
+        conn.close()
+        return int(row[0])
+
+    def check_budget(self, conversation_id: str, user_id: Optional[int]) -> Optional[str]:
+        """Return the name of the exhausted budget, or None when the round may run."""
+        conversation_budget = self.config.conversation_token_budget
+        if conversation_budget and self._total_tokens("conversation_id", conversation_id) >= conversation_budget:
+            return "conversation"
+        user_budget = self.config.user_token_budget
+        if user_budget and user_id is not None and self._total_tokens("user_id", user_id) >= user_budget:
+            return "user"
+        return None
+
+    def summary(self, group_by: str = "agent", since: float = 0.0, limit: int = 100) -> List[Dict[str, Any]]:
+        columns = {"agent": "agent", "conversation": "conversation_id", "user": "user_id"}
+        if group_by not in columns:
+            raise ValueError(f"Unsupported group_by {group_by}")
+        column = columns[group_by]
+        conn = self._open_db()
+        rows = conn.execute(
+            f"""
+            SELECT {column} AS key, COUNT(DISTINCT conversation_id || ':' || round_id) AS rounds,
+                   SUM(requests) AS requests, SUM(input_tokens) AS input_tokens,
+                   SUM(output_tokens) AS output_tokens, SUM(total_tokens) AS total_tokens, SUM(cost) AS cost
+            FROM usage_ledger
+            WHERE created_at >= ?
+            GROUP BY {column}
+            ORDER BY total_tokens DESC
+            LIMIT ?
+            """,
+            (since, limit),
+        ).fetchall()
+        conn.close()
+        return [{group_by: row["key"], **{k: row[k] for k in row.keys() if k != "key"}} for row in rows]
+
+    def prometheus_metrics(self) -> str:
+        conn = self._open_db()
+        rows = conn.execute(
+            """
+            SELECT agent, kind, SUM(requests) AS requests, SUM(input_tokens) AS input_tokens,
+                   SUM(output_tokens) AS output_tokens, SUM(cost) AS cost
+            FROM usage_ledger GROUP BY agent, kind
+            """
+        ).fetchall()
+        conn.close()
+        lines = [
+            "# TYPE airloop_llm_requests_total counter",
+            "# TYPE airloop_llm_tokens_total counter",
+            "# TYPE airloop_llm_cost_total counter",
+        ]
+        for row in rows:
+            labels = f'agent="{row["agent"]}",kind="{row["kind"]}"'
+            lines.append(f"airloop_llm_requests_total{{{labels}}} {row['requests']}")
+            lines.append(f'airloop_llm_tokens_total{{{labels},direction="input"}} {row["input_tokens"]}')
+            lines.append(f'airloop_llm_tokens_total{{{labels},direction="output"}} {row["output_tokens"]}')
+            lines.append(f"airloop_llm_cost_total{{{labels}}} {row['cost']}")
+        return "\n".join(lines) + "\n"
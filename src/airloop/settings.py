@@ -12,6 +12,8 @@ class UserConfig:
     api_key: str
     model_name: str
     output_streaming: bool = False
+    provider: str = "openai"  # openai | mock
+    mock_script: Optional[str] = None
 
 
 @dataclass
@@ -27,8 +29,120 @@ class LangfuseConfig:
 
 @dataclass
 class StoreConfig:
-    kind: str = "sqlite"  # "sqlite" | "memory"
+    kind: str = "sqlite"  # "sqlite" | "memory" | "log"
     path: str = "data/conversations.db"
+    # bounds for kind=memory (None = unbounded); evicted sessions go to `path` when memory_spill
+    memory_max_conversations: Optional[int] = 10000
+    memory_ttl_s: Optional[float] = None
+    memory_max_mb: Optional[float] = None
+    memory_spill: bool = False
+    # "<json|msgpack>[+<zlib|zstd>]"; msgpack/zstd need the codec extra
+    serializer: str = "json+zlib"
+    serializer_level: Optional[int] = None
+    zstd_dict_path: Optional[str] = None
+    # kind=log: append-only segment files, single process only
+    log_dir: str = "data/conversations.log.d"
+    log_segment_mb: float = 64.0
+    log_fsync: bool = False
+    log_compact_interval_s: Optional[float] = 60.0
+    log_compact_ratio: float = 0.5
+    # kind=sqlite: FTS5 tokenizer for conversation search, "unicode61" | "trigram"; None disables
+    search_tokenizer: Optional[str] = "unicode61"
+
+
+@dataclass
+class TraceStoreConfig:
+    kind: str = "sqlite"  # "sqlite" | "noop", used when Langfuse is not configured
+    path: str = "data/traces.db"
+    batch_size: int = 200
+    flush_interval_s: float = 2.0
+
+
+@dataclass
+class FlightRecorderConfig:
+    capacity: int = 200  # rounds kept in memory
+    slow_ms: float = 5000.0  # rounds slower than this (or failing) are dumped to disk
+    dump_dir: str = "data/flight_recorder"
+    max_dumps: int = 500
+
+
+@dataclass
+class UsageConfig:
+    input_price_per_1k: float = 0.0
+    output_price_per_1k: float = 0.0
+    conversation_token_budget: Optional[int] = None
+    user_token_budget: Optional[int] = None
+
+    def cost(self, input_tokens: int, output_tokens: int) -> float:
+        return (input_tokens * self.input_price_per_1k + output_tokens * self.output_price_per_1k) / 1000
+
+
+@dataclass
+class EvalConfig:
+    concurrency: int = 4
+    case_timeout_s: float = 120.0
+    max_retries: int = 1
+    dataset_dir: str = "config"
+    dataset: Optional[str] = "eval_cases.jsonl"  # JSONL file of EvalCase records in dataset_dir
+    output_dir: str = "data/eval_runs"
+    judge_batch_size: int = 1  # rounds packed into one judge call; 1 disables batching
+    judge_batch_wait_ms: int = 50  # how long a partial batch waits for more rounds
+    judge_cache_path: Optional[str] = "data/judge_cache.db"  # empty disables the judge cache
+    watermark_path: str = "data/eval_watermarks.db"  # last judged round per conversation (incremental mode)
+
+
+@dataclass
+class CassetteConfig:
+    mode: str = "off"  # "off" | "record" | "replay" | "auto"
+    path: str = "data/cassettes/llm.jsonl"
+    strict: bool = False  # replay exact requests only, no same-agent fallback
+
+
+@dataclass
+class OnlineEvalConfig:
+    enabled: bool = False
+    sample_rate: float = 0.05  # fraction of completed live rounds sent to the judge
+    concurrency: int = 2  # judge calls in flight
+    max_per_minute: int = 30  # rate cap on judge calls
+    queue_size: int = 1000  # sampled rounds waiting for the judge; overflow is dropped
+    name: str = "auto_eval"  # score name prefix; langfuse.auto_eval_name overrides it
+
+
+@dataclass
+class JobConfig:
+    path: str = "data/jobs.db"
+    concurrency: int = 2  # background jobs running at the same time
+    progress_interval_s: float = 1.0  # minimum interval between persisted progress updates
+    poll_interval_s: float = 2.0  # how often the runner picks up jobs submitted by other workers
+
+
+@dataclass
+class ServerConfig:
+    host: str = "127.0.0.1"
+    port: int = 8000
+    workers: int = 1
+    graceful_timeout_s: float = 30.0  # drain in-flight requests for at most this long on shutdown
+    keep_alive_s: float = 5.0
+    preload: bool = True  # import and build agent/tool definitions before forking workers
+
+
+@dataclass
+class RetentionConfig:
+    enabled: bool = False
+    idle_days: float = 30.0  # conversations not saved for this long move to the archive
+    interval_s: float = 6 * 3600.0  # how often the job runner schedules a retention pass
+    batch_size: int = 100  # conversations archived between yields to the event loop
+    max_per_pass: int = 10000
+    archive_path: str = "data/conversations_archive.db"
+    archive_serializer: str = "json+zlib"
+    archive_level: Optional[int] = 9
+    vacuum_pages: int = 0  # free pages returned to the OS per pass (0 = all)
+
+
+def _to_int(value: Any) -> Optional[int]:
+    if value in (None, ""):
+        return None
+    return int(value)
 
 
 @dataclass
@@ -37,6 +151,21 @@ class AppConfig:
     langfuse: Optional[LangfuseConfig] = None
     store: StoreConfig = None
     eval_llm: Optional[UserConfig] = None
+    traces: TraceStoreConfig = None
+    recorder: FlightRecorderConfig = None
+    usage: UsageConfig = None
+    evaluation: EvalConfig = None
+    jobs: JobConfig = None
+    online_eval: OnlineEvalConfig = None
+    cassette: CassetteConfig = None
+    server: ServerConfig = None
+    retention: RetentionConfig = None
+
+
+def _to_float(value: Any) -> Optional[float]:
+    if value in (None, ""):
+        return None
+    return float(value)
 
 
 def _to_bool(value: Any, default: Optional[bool] = None) -> Optional[bool]:
@@ -67,7 +196,14 @@ def load_app_config(config_path: Optional[str] = None) -> AppConfig:
     api_key = os.getenv("LLM_API_KEY", llm_cfg.get("api_key"))
     model_name = os.getenv("LLM_MODEL_NAME", llm_cfg.get("model_name"))
     output_streaming = _to_bool(os.getenv("LLM_OUTPUT_STREAMING", llm_cfg.get("output_streaming")), default=False)
+    provider = os.getenv("LLM_PROVIDER", llm_cfg.get("provider")) or "openai"
+    mock_script = os.getenv("LLM_MOCK_SCRIPT", llm_cfg.get("mock_script")) or None
 
+    if provider == "mock":
+        # the mock model never talks to an endpoint; fill placeholders so nothing else has to care
+        base_url = base_url or "http://localhost/mock"
+        api_key = api_key or "mock"
+        model_name = model_name or "mock"
     if not base_url or not api_key or not model_name:
         raise ValueError("Missing required LLM configuration (base_url, api_key, model_name)")
 
@@ -76,17 +212,29 @@ def load_app_config(config_path: Optional[str] = None) -> AppConfig:
         api_key=api_key,
         model_name=model_name,
         output_streaming=bool(output_streaming),
+        provider=provider,
+        mock_script=mock_script,
     )
 
     langfuse_cfg = raw_cfg.get("langfuse", {})
     store_cfg = raw_cfg.get("store", {})
     eval_cfg = raw_cfg.get("eval_llm", {})
+    traces_cfg = raw_cfg.get("traces", {})
+    recorder_cfg = raw_cfg.get("recorder", {})
+    usage_cfg = raw_cfg.get("usage", {})
+    evaluation_cfg = raw_cfg.get("evaluation", {})
+    jobs_cfg = raw_cfg.get("jobs", {})
+    server_cfg = raw_cfg.get("server", {})
+    retention_cfg = raw_cfg.get("retention", {})
+    online_eval_cfg = raw_cfg.get("online_eval", {})
+    cassette_cfg = raw_cfg.get("cassette", {})
     langfuse_enabled = _to_bool(os.getenv("LANGFUSE_ENABLED", langfuse_cfg.get("enabled")), default=None)
     langfuse_host = os.getenv("LANGFUSE_HOST", langfuse_cfg.get("host"))
     langfuse_public_key = os.getenv("LANGFUSE_PUBLIC_KEY", langfuse_cfg.get("public_key"))
     langfuse_secret_key = os.getenv("LANGFUSE_SECRET_KEY", langfuse_cfg.get("secret_key"))
     langfuse_release = os.getenv("LANGFUSE_RELEASE", langfuse_cfg.get("release"))
     langfuse_evaluator = os.getenv("LANGFUSE_EVALUATOR_NAME", langfuse_cfg.get("evaluator_name"))
+    langfuse_auto_eval = os.getenv("LANGFUSE_AUTO_EVAL_NAME", langfuse_cfg.get("auto_eval_name"))
 
     langfuse = None
     has_langfuse_keys = all([langfuse_host, langfuse_public_key, langfuse_secret_key])
@@ -100,11 +248,103 @@ def load_app_config(config_path: Optional[str] = None) -> AppConfig:
             release=langfuse_release,
             enabled=True,
             evaluator_name=langfuse_evaluator,
+            auto_eval_name=langfuse_auto_eval,
         )
 
     store = StoreConfig(
         kind=os.getenv("STORE_KIND", store_cfg.get("kind", "sqlite")),
         path=os.getenv("STORE_PATH", store_cfg.get("path", "data/conversations.db")),
+        memory_max_conversations=_to_int(os.getenv("STORE_MEMORY_MAX_CONVERSATIONS", store_cfg.get("memory_max_conversations", 10000))),
+        memory_ttl_s=_to_float(os.getenv("STORE_MEMORY_TTL_S", store_cfg.get("memory_ttl_s"))),
+        memory_max_mb=_to_float(os.getenv("STORE_MEMORY_MAX_MB", store_cfg.get("memory_max_mb"))),
+        memory_spill=bool(_to_bool(os.getenv("STORE_MEMORY_SPILL", store_cfg.get("memory_spill")), default=False)),
+        serializer=os.getenv("STORE_SERIALIZER", store_cfg.get("serializer", "json+zlib")),
+        serializer_level=_to_int(os.getenv("STORE_SERIALIZER_LEVEL", store_cfg.get("serializer_level"))),
+        zstd_dict_path=os.getenv("STORE_ZSTD_DICT_PATH", store_cfg.get("zstd_dict_path")) or None,
+        log_dir=os.getenv("STORE_LOG_DIR", store_cfg.get("log_dir", "data/conversations.log.d")),
+        log_segment_mb=float(os.getenv("STORE_LOG_SEGMENT_MB", store_cfg.get("log_segment_mb", 64.0))),
+        log_fsync=bool(_to_bool(os.getenv("STORE_LOG_FSYNC", store_cfg.get("log_fsync")), default=False)),
+        log_compact_interval_s=_to_float(os.getenv("STORE_LOG_COMPACT_INTERVAL_S", store_cfg.get("log_compact_interval_s", 60.0))),
+        log_compact_ratio=float(os.getenv("STORE_LOG_COMPACT_RATIO", store_cfg.get("log_compact_ratio", 0.5))),
+        search_tokenizer=os.getenv("STORE_SEARCH_TOKENIZER", store_cfg.get("search_tokenizer", "unicode61")) or None,
+    )
+
+    traces = TraceStoreConfig(
+        kind=os.getenv("TRACE_STORE_KIND", traces_cfg.get("kind", "sqlite")),
+        path=os.getenv("TRACE_STORE_PATH", traces_cfg.get("path", "data/traces.db")),
+        batch_size=int(os.getenv("TRACE_STORE_BATCH_SIZE", traces_cfg.get("batch_size", 200))),
+        flush_interval_s=float(os.getenv("TRACE_STORE_FLUSH_INTERVAL_S", traces_cfg.get("flush_interval_s", 2.0))),
+    )
+
+    recorder = FlightRecorderConfig(
+        capacity=int(os.getenv("RECORDER_CAPACITY", recorder_cfg.get("capacity", 200))),
+        slow_ms=float(os.getenv("RECORDER_SLOW_MS", recorder_cfg.get("slow_ms", 5000.0))),
+        dump_dir=os.getenv("RECORDER_DUMP_DIR", recorder_cfg.get("dump_dir", "data/flight_recorder")),
+        max_dumps=int(os.getenv("RECORDER_MAX_DUMPS", recorder_cfg.get("max_dumps", 500))),
+    )
+
+    usage = UsageConfig(
+        input_price_per_1k=float(os.getenv("USAGE_INPUT_PRICE_PER_1K", usage_cfg.get("input_price_per_1k", 0.0))),
+        output_price_per_1k=float(os.getenv("USAGE_OUTPUT_PRICE_PER_1K", usage_cfg.get("output_price_per_1k", 0.0))),
+        conversation_token_budget=_to_int(os.getenv("USAGE_CONVERSATION_TOKEN_BUDGET", usage_cfg.get("conversation_token_budget"))),
+        user_token_budget=_to_int(os.getenv("USAGE_USER_TOKEN_BUDGET", usage_cfg.get("user_token_budget"))),
+    )
+
+    evaluation = EvalConfig(
+        concurrency=int(os.getenv("EVAL_CONCURRENCY", evaluation_cfg.get("concurrency", 4))),
+        case_timeout_s=float(os.getenv("EVAL_CASE_TIMEOUT_S", evaluation_cfg.get("case_timeout_s", 120.0))),
+        max_retries=int(os.getenv("EVAL_MAX_RETRIES", evaluation_cfg.get("max_retries", 1))),
+        dataset_dir=os.getenv("EVAL_DATASET_DIR", evaluation_cfg.get("dataset_dir", "config")),
+        dataset=os.getenv("EVAL_DATASET", evaluation_cfg.get("dataset", "eval_cases.jsonl")),
+        output_dir=os.getenv("EVAL_OUTPUT_DIR", evaluation_cfg.get("output_dir", "data/eval_runs")),
+        judge_batch_size=int(os.getenv("EVAL_JUDGE_BATCH_SIZE", evaluation_cfg.get("judge_batch_size", 1))),
+        judge_batch_wait_ms=int(os.getenv("EVAL_JUDGE_BATCH_WAIT_MS", evaluation_cfg.get("judge_batch_wait_ms", 50))),
+        judge_cache_path=os.getenv("EVAL_JUDGE_CACHE_PATH", evaluation_cfg.get("judge_cache_path", "data/judge_cache.db")) or None,
+        watermark_path=os.getenv("EVAL_WATERMARK_PATH", evaluation_cfg.get("watermark_path", "data/eval_watermarks.db")),
+    )
+
+    jobs = JobConfig(
+        path=os.getenv("JOBS_PATH", jobs_cfg.get("path", "data/jobs.db")),
+        concurrency=int(os.getenv("JOBS_CONCURRENCY", jobs_cfg.get("concurrency", 2))),
+        progress_interval_s=float(os.getenv("JOBS_PROGRESS_INTERVAL_S", jobs_cfg.get("progress_interval_s", 1.0))),
+        poll_interval_s=float(os.getenv("JOBS_POLL_INTERVAL_S", jobs_cfg.get("poll_interval_s", 2.0))),
+    )
+
+    server = ServerConfig(
+        host=os.getenv("SERVER_HOST", server_cfg.get("host", "127.0.0.1")),
+        port=int(os.getenv("SERVER_PORT", server_cfg.get("port", 8000))),
+        workers=int(os.getenv("SERVER_WORKERS", server_cfg.get("workers", 1))),
+        graceful_timeout_s=float(os.getenv("SERVER_GRACEFUL_TIMEOUT_S", server_cfg.get("graceful_timeout_s", 30.0))),
+        keep_alive_s=float(os.getenv("SERVER_KEEP_ALIVE_S", server_cfg.get("keep_alive_s", 5.0))),
+        preload=bool(_to_bool(os.getenv("SERVER_PRELOAD", server_cfg.get("preload")), default=True)),
+    )
+
+    retention = RetentionConfig(
+        enabled=bool(_to_bool(os.getenv("RETENTION_ENABLED", retention_cfg.get("enabled")), default=False)),
+        idle_days=float(os.getenv("RETENTION_IDLE_DAYS", retention_cfg.get("idle_days", 30.0))),
+        interval_s=float(os.getenv("RETENTION_INTERVAL_S", retention_cfg.get("interval_s", 6 * 3600.0))),
+        batch_size=int(os.getenv("RETENTION_BATCH_SIZE", retention_cfg.get("batch_size", 100))),
+        max_per_pass=int(os.getenv("RETENTION_MAX_PER_PASS", retention_cfg.get("max_per_pass", 10000))),
+        archive_path=os.getenv("RETENTION_ARCHIVE_PATH", retention_cfg.get("archive_path", "data/conversations_archive.db")),
+        archive_serializer=os.getenv("RETENTION_ARCHIVE_SERIALIZER", retention_cfg.get("archive_serializer", "json+zlib")),
+        archive_level=_to_int(os.getenv("RETENTION_ARCHIVE_LEVEL", retention_cfg.get("archive_level", 9))),
+        vacuum_pages=int(os.getenv("RETENTION_VACUUM_PAGES", retention_cfg.get("vacuum_pages", 0))),
+    )
+
+    online_eval = OnlineEvalConfig(
+        enabled=bool(_to_bool(os.getenv("ONLINE_EVAL_ENABLED", online_eval_cfg.get("enabled")), default=False)),
+        sample_rate=float(os.getenv("ONLINE_EVAL_SAMPLE_RATE", online_eval_cfg.get("sample_rate", 0.05))),
+        concurrency=int(os.getenv("ONLINE_EVAL_CONCURRENCY", online_eval_cfg.get("concurrency", 2))),
+        max_per_minute=int(os.getenv("ONLINE_EVAL_MAX_PER_MINUTE", online_eval_cfg.get("max_per_minute", 30))),
+        queue_size=int(os.getenv("ONLINE_EVAL_QUEUE_SIZE", online_eval_cfg.get("queue_size", 1000))),
+        name=(langfuse.auto_eval_name if langfuse and langfuse.auto_eval_name else None)
+        or os.getenv("ONLINE_EVAL_NAME", online_eval_cfg.get("name", "auto_eval")),
+    )
+
+    cassette = CassetteConfig(
+        mode=os.getenv("LLM_CASSETTE_MODE", cassette_cfg.get("mode")) or "off",
+        path=os.getenv("LLM_CASSETTE_PATH", cassette_cfg.get("path", "data/cassettes/llm.jsonl")),
+        strict=bool(_to_bool(os.getenv("LLM_CASSETTE_STRICT", cassette_cfg.get("strict")), default=False)),
     )
 
     # eval llm (optional, fallback to main llm)
@@ -112,6 +352,7 @@ def load_app_config(config_path: Optional[str] = None) -> AppConfig:
     eval_api_key = os.getenv("EVAL_LLM_API_KEY", eval_cfg.get("api_key", api_key))
     eval_model_name = os.getenv("EVAL_LLM_MODEL_NAME", eval_cfg.get("model_name", model_name))
     eval_output_streaming = _to_bool(os.getenv("EVAL_LLM_OUTPUT_STREAMING", eval_cfg.get("output_streaming")), default=output_streaming)
+    eval_provider = os.getenv("EVAL_LLM_PROVIDER", eval_cfg.get("provider", provider)) or provider
     eval_llm = None
     if eval_base_url and eval_api_key and eval_model_name:
         eval_llm = UserConfig(
@@ -119,7 +360,9 @@ def load_app_config(config_path: Optional[str] = None) -> AppConfig:
             api_key=eval_api_key,
             model_name=eval_model_name,
             output_streaming=bool(eval_output_streaming),
+            provider=eval_provider,
+            mock_script=os.getenv("EVAL_LLM_MOCK_SCRIPT", eval_cfg.get("mock_script", mock_script)) or None,
         )
 
-    return AppConfig(llm=llm, langfuse=langfuse, store=store, eval_llm=eval_llm)
+    return AppConfig(llm=llm, langfuse=langfuse, store=store, eval_llm=eval_llm, traces=traces, recorder=recorder, usage=usage, evaluation=evaluation, jobs=jobs, online_eval=online_eval, cassette=cassette, server=server, retention=retention)
     